@@ -0,0 +1,130 @@
+from functools import lru_cache
+
+from Crypto.Cipher import AES
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+__all__ = [
+    "CipherBackend",
+    "PycryptodomeBackend",
+    "CryptographyBackend",
+    "get_backend",
+    "DEFAULT_BACKEND",
+]
+
+
+DEFAULT_BACKEND = "encrypted_fields.backends.PycryptodomeBackend"
+
+
+class CipherBackend:
+    """AES-256-GCM, as used by KeyRing to encrypt and decrypt values.
+
+    Backends only do the cipher operations: the storage formats are built by the
+    KeyRing, so every backend reads and writes exactly the same bytes. Select one with
+    settings.FIELD_ENCRYPTION_BACKEND (a dotted path to the class).
+    """
+
+    name = None
+
+    def encrypt(self, key, nonce, plaintext, associated_data=None):
+        """Return (cypher_text, tag)."""
+        raise NotImplementedError
+
+    def decrypt(self, key, nonce, cypher_text, tag, associated_data=None):
+        """Return the plaintext, or raise ValueError if it can't be authenticated."""
+        raise NotImplementedError
+
+    def encrypt_once(self, key, nonce, plaintext, associated_data=None):
+        """encrypt() with a key used for this value only (eg an envelope's data key),
+        so not worth keeping any state for."""
+        return self.encrypt(key, nonce, plaintext, associated_data)
+
+    def decrypt_once(self, key, nonce, cypher_text, tag, associated_data=None):
+        """decrypt() with a key used for this value only, see encrypt_once()."""
+        return self.decrypt(key, nonce, cypher_text, tag, associated_data)
+
+
+class PycryptodomeBackend(CipherBackend):
+    """The default backend, using pycryptodome."""
+
+    name = "pycryptodome"
+
+    def encrypt(self, key, nonce, plaintext, associated_data=None):
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        if associated_data is not None:
+            cipher.update(associated_data)
+        return cipher.encrypt_and_digest(plaintext)
+
+    def decrypt(self, key, nonce, cypher_text, tag, associated_data=None):
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        if associated_data is not None:
+            cipher.update(associated_data)
+        return cipher.decrypt_and_verify(cypher_text, tag)
+
+
+class CryptographyBackend(CipherBackend):
+    """A backend using OpenSSL, via the cryptography package, which must be
+    installed separately. An AESGCM object is kept per key and used for every value
+    encrypted with it, rather than setting up a new cipher each time, except for the
+    single use keys of encrypt_once() and decrypt_once()."""
+
+    name = "cryptography"
+
+    def __init__(self):
+        try:
+            from cryptography.exceptions import InvalidTag
+            from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        except ImportError:
+            raise ImproperlyConfigured(
+                "CryptographyBackend requires the cryptography package."
+            )
+        self.invalid_tag = InvalidTag
+        self.new_cipher = AESGCM
+        self.get_cipher = lru_cache(maxsize=1024)(AESGCM)
+
+    def encrypt(self, key, nonce, plaintext, associated_data=None):
+        return self._encrypt(self.get_cipher(key), nonce, plaintext, associated_data)
+
+    def decrypt(self, key, nonce, cypher_text, tag, associated_data=None):
+        return self._decrypt(
+            self.get_cipher(key), nonce, cypher_text, tag, associated_data
+        )
+
+    def encrypt_once(self, key, nonce, plaintext, associated_data=None):
+        return self._encrypt(self.new_cipher(key), nonce, plaintext, associated_data)
+
+    def decrypt_once(self, key, nonce, cypher_text, tag, associated_data=None):
+        return self._decrypt(
+            self.new_cipher(key), nonce, cypher_text, tag, associated_data
+        )
+
+    def _encrypt(self, cipher, nonce, plaintext, associated_data):
+        encrypted = cipher.encrypt(nonce, plaintext, associated_data)
+        return encrypted[:-16], encrypted[-16:]
+
+    def _decrypt(self, cipher, nonce, cypher_text, tag, associated_data):
+        try:
+            return cipher.decrypt(nonce, cypher_text + tag, associated_data)
+        except self.invalid_tag:
+            raise ValueError("MAC check failed")
+
+
+_backends = {}
+
+
+def get_backend(path=None):
+    """Return the process wide instance of the backend class at path
+    (settings.FIELD_ENCRYPTION_BACKEND by default)."""
+    if path is None:
+        path = getattr(settings, "FIELD_ENCRYPTION_BACKEND", DEFAULT_BACKEND)
+    backend = _backends.get(path)
+    if backend is None:
+        try:
+            backend_class = import_string(path)
+        except ImportError as e:
+            raise ImproperlyConfigured(
+                f"Cannot import FIELD_ENCRYPTION_BACKEND {path!r}: {e}"
+            )
+        backend = _backends[path] = backend_class()
+    return backend
@@ -0,0 +1,75 @@
+import datetime
+import struct
+
+__all__ = ["encode_int", "encode_date", "encode_datetime", "decode", "is_encoded"]
+
+
+# Binary plaintext encodings of integers, dates and datetimes, which are smaller
+# than their str() and read without any parsing. An encoded payload starts with a tag
+# byte naming its type (and the version of its encoding). Tags are control
+# characters, which never start the str() of these types, so values stored as text
+# (before these encodings existed) are still read as text.
+TAG_INT8 = 0x01
+TAG_INT16 = 0x02
+TAG_INT32 = 0x03
+TAG_INT64 = 0x04
+TAG_DATE = 0x05  # proleptic Gregorian ordinal, 3 bytes
+TAG_DATETIME = 0x06  # naive, microseconds since the epoch, 8 bytes
+TAG_DATETIME_UTC = 0x07  # aware, microseconds since the epoch in UTC, 8 bytes
+MAX_TAG = 0x1F
+
+_INT_FORMATS = [
+    (TAG_INT8, struct.Struct(">b")),
+    (TAG_INT16, struct.Struct(">h")),
+    (TAG_INT32, struct.Struct(">i")),
+    (TAG_INT64, struct.Struct(">q")),
+]
+_INT_LIMITS = [(1 << (8 * s.size - 1), tag, s) for tag, s in _INT_FORMATS]
+_INT_DECODERS = {tag: s for tag, s in _INT_FORMATS}
+_INT64 = struct.Struct(">q")
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def encode_int(value):
+    """Pack value in the smallest of 1, 2, 4 or 8 bytes it fits in, or return None
+    if it is too big for any of them."""
+    for limit, tag, packer in _INT_LIMITS:
+        if -limit <= value < limit:
+            return bytes([tag]) + packer.pack(value)
+    return None
+
+
+def encode_date(value):
+    return bytes([TAG_DATE]) + value.toordinal().to_bytes(3, "big")
+
+
+def encode_datetime(value):
+    """Encode value, keeping whether it is naive or aware (as UTC)."""
+    if value.utcoffset() is None:
+        tag = TAG_DATETIME
+    else:
+        tag = TAG_DATETIME_UTC
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return bytes([tag]) + _INT64.pack((value - _EPOCH) // _MICROSECOND)
+
+
+def is_encoded(payload):
+    return len(payload) > 0 and payload[0] <= MAX_TAG
+
+
+def decode(payload):
+    tag = payload[0]
+    try:
+        if tag in _INT_DECODERS:
+            return _INT_DECODERS[tag].unpack(payload[1:])[0]
+        if tag == TAG_DATE:
+            return datetime.date.fromordinal(int.from_bytes(payload[1:], "big"))
+        if tag in (TAG_DATETIME, TAG_DATETIME_UTC):
+            value = _EPOCH + _INT64.unpack(payload[1:])[0] * _MICROSECOND
+            if tag == TAG_DATETIME_UTC:
+                value = value.replace(tzinfo=datetime.timezone.utc)
+            return value
+    except (struct.error, ValueError, OverflowError):
+        raise ValueError("Data is corrupted.")
+    raise ValueError(f"Unsupported plaintext encoding {tag:#04x}.")
@@ -0,0 +1,365 @@
+import hashlib
+import zlib
+from functools import lru_cache
+
+from Crypto.Random import get_random_bytes
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .backends import get_backend
+
+__all__ = [
+    "KeyRing",
+    "get_keyring",
+    "clear_keyring",
+    "get_key_id",
+    "compress_payload",
+    "decode_payload",
+]
+
+
+# Versioned ciphertext layouts:
+#   v1: FORMAT_MAGIC | 1 | nonce (16) | key id (4) | tag (16) | cypher_text
+#   v2: FORMAT_MAGIC | 2 | flags | nonce (16) | key id (4) | tag (16) | cypher_text
+#   v3: FORMAT_MAGIC | 3 | flags | nonce (12) | key id (4) | tag (16) | cypher_text
+#   v4: FORMAT_MAGIC | 4 | flags | nonce (12) | key id (4) | tag (16) | wrapped data
+#       key (32) | data tag (16) | data cypher_text
+# v3 is written, or v4 for envelope encryption. Its 96 bit nonce is the size GCM is designed for: it is used as
+# the counter block as it is, where other sizes must first be hashed with GHASH.
+# Headers with flags (v2 and v3) are authenticated as GCM associated data.
+# A v4 value's payload is encrypted with its own random data key, which is stored
+# encrypted ("wrapped") by the key with the key id, so rotating it only re-wraps the
+# data key. Each data key encrypts one payload only, so its nonce is fixed.
+# The legacy layout (nonce (16) | tag (16) | cypher_text) has no header at all, so any
+# value that does not parse as a versioned one is read as legacy data.
+FORMAT_MAGIC = b"\xef"
+FORMAT_V1 = 1
+FORMAT_V2 = 2
+FORMAT_V3 = 3
+FORMAT_V4 = 4
+# version: (has a flags byte, nonce size)
+FORMATS = {
+    FORMAT_V1: (False, 16),
+    FORMAT_V2: (True, 16),
+    FORMAT_V3: (True, 12),
+    FORMAT_V4: (True, 12),
+}
+HEADER_SIZE = len(FORMAT_MAGIC) + 1
+NONCE_SIZE = 12
+LEGACY_NONCE_SIZE = 16
+KEY_ID_SIZE = 4
+TAG_SIZE = 16
+DATA_KEY_SIZE = 32
+DATA_NONCE = bytes(NONCE_SIZE)
+# The size of a v4 value's data key and nonce, key id and tag of its wrapping.
+WRAPPING_SIZE = NONCE_SIZE + KEY_ID_SIZE + TAG_SIZE + DATA_KEY_SIZE
+DEFAULT_DATA_KEY_CACHE_SIZE = 1024
+
+# Payload flags.
+FLAG_ZLIB = 0x01
+KNOWN_FLAGS = FLAG_ZLIB
+
+
+def get_key_id(key):
+    """Return the short fingerprint of a (raw bytes) key stored in the ciphertext."""
+    return hashlib.sha256(key).digest()[:KEY_ID_SIZE]
+
+
+def compress_payload(payload, threshold=0, zdict=None):
+    """Return (payload, flags), with payload zlib compressed (and flags FLAG_ZLIB)
+    if it is at least threshold bytes long and compressing makes it smaller."""
+    if len(payload) < threshold:
+        return payload, 0
+    compressor = zlib.compressobj(zdict=zdict) if zdict else zlib.compressobj()
+    compressed = compressor.compress(payload) + compressor.flush()
+    if len(compressed) >= len(payload):
+        return payload, 0
+    return compressed, FLAG_ZLIB
+
+
+def decode_payload(payload, flags, zdict=None):
+    """Undo the encodings marked by flags, eg decompress a FLAG_ZLIB payload using
+    the preset dictionary zdict it was compressed with."""
+    if flags & ~KNOWN_FLAGS:
+        raise ValueError(f"Unsupported payload flags {flags:#04x}.")
+    if flags & FLAG_ZLIB:
+        decompressor = (
+            zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+        )
+        try:
+            payload = decompressor.decompress(payload) + decompressor.flush()
+        except zlib.error as e:
+            raise ValueError(f"Cannot decompress data: {e}")
+    return payload
+
+
+def parse_versioned(value):
+    """Split a versioned ciphertext into (header, flags, nonce, key id, tag,
+    cypher_text), or return None if value is not one."""
+    if value[: len(FORMAT_MAGIC)] != FORMAT_MAGIC or len(value) < HEADER_SIZE:
+        return None
+    layout = FORMATS.get(value[HEADER_SIZE - 1])
+    if layout is None:
+        return None
+    has_flags, nonce_size = layout
+    offset = HEADER_SIZE + has_flags
+    flags = value[HEADER_SIZE] if has_flags and len(value) > HEADER_SIZE else 0
+    nonce = value[offset : offset + nonce_size]
+    offset += nonce_size
+    key_id = value[offset : offset + KEY_ID_SIZE]
+    offset += KEY_ID_SIZE
+    tag = value[offset : offset + TAG_SIZE]
+    if len(tag) != TAG_SIZE:
+        return None
+    return (
+        value[: HEADER_SIZE + has_flags],
+        flags,
+        nonce,
+        key_id,
+        tag,
+        value[offset + TAG_SIZE :],
+    )
+
+
+class KeyRing:
+    """The parsed contents of settings.FIELD_ENCRYPTION_KEYS.
+
+    Keys are decoded from hex once and indexed by their key id, so decrypting a
+    versioned value is one dictionary lookup and one AES operation, whichever key
+    in the list it was encrypted with. The AES operations are done by a
+    backends.CipherBackend, settings.FIELD_ENCRYPTION_BACKEND by default.
+
+    Values encrypted with envelope=True have data keys of their own (see the v4
+    format), so rotate() only re-encrypts those, whatever the size of the value. The
+    most recently unwrapped data_key_cache_size data keys are kept in memory
+    (settings.FIELD_ENCRYPTION_DATA_KEY_CACHE_SIZE, 1024 by default, 0 for none), so
+    reading a value again doesn't unwrap its key again.
+    """
+
+    def __init__(self, keys, backend=None, data_key_cache_size=None):
+        # should be a list or tuple of hex encoded 32byte keys
+        if not isinstance(keys, (list, tuple)):
+            raise ImproperlyConfigured("FIELD_ENCRYPTION_KEYS should be a list.")
+        if not keys:
+            raise ImproperlyConfigured("FIELD_ENCRYPTION_KEYS should not be empty.")
+        try:
+            self.keys = tuple(bytes.fromhex(key) for key in keys)
+        except (TypeError, ValueError):
+            raise ImproperlyConfigured(
+                "FIELD_ENCRYPTION_KEYS should contain hex encoded keys."
+            )
+        self.backend = backend if backend is not None else get_backend()
+        self.primary_key = self.keys[0]
+        self.primary_key_id = get_key_id(self.primary_key)
+        self._keys_by_id = {}
+        for key in self.keys:
+            # Fingerprints are short, so (very rarely) two keys may share one.
+            key_id = get_key_id(key)
+            self._keys_by_id[key_id] = self._keys_by_id.get(key_id, ()) + (key,)
+        if data_key_cache_size is None:
+            data_key_cache_size = getattr(
+                settings,
+                "FIELD_ENCRYPTION_DATA_KEY_CACHE_SIZE",
+                DEFAULT_DATA_KEY_CACHE_SIZE,
+            )
+        if data_key_cache_size:
+            self.unwrap = lru_cache(maxsize=data_key_cache_size)(self.unwrap)
+
+    def get_keys(self, key_id):
+        """Return the keys matching key_id, or an empty tuple if it is unknown."""
+        return self._keys_by_id.get(key_id, ())
+
+    def encrypt(self, plaintext, flags=0, envelope=False):
+        """Encrypt plaintext, a payload described by flags (see decode_payload()),
+        with a data key of its own if envelope is True."""
+        if envelope:
+            return self.encrypt_many([plaintext], [flags], envelope=True)[0]
+        nonce = get_random_bytes(NONCE_SIZE)
+        header = FORMAT_MAGIC + bytes([FORMAT_V3, flags])
+        cypher_text, tag = self.backend.encrypt(
+            self.primary_key, nonce, plaintext, header
+        )
+        return header + nonce + self.primary_key_id + tag + cypher_text
+
+    def encrypt_many(self, plaintexts, flags=None, envelope=False):
+        """Encrypt a list of plaintexts (with an optional list of their flags), with
+        less overhead per value than encrypt()."""
+        key = self.primary_key
+        version = FORMAT_V4 if envelope else FORMAT_V3
+        header = FORMAT_MAGIC + bytes([version, 0])
+        key_id = self.primary_key_id
+        nonces = get_random_bytes(NONCE_SIZE * len(plaintexts))
+        if envelope:
+            data_keys = get_random_bytes(DATA_KEY_SIZE * len(plaintexts))
+        encrypt = self.backend.encrypt
+        encrypted = []
+        for i, plaintext in enumerate(plaintexts):
+            nonce = nonces[i * NONCE_SIZE : (i + 1) * NONCE_SIZE]
+            value_header = (
+                FORMAT_MAGIC + bytes([version, flags[i]])
+                if flags and flags[i]
+                else header
+            )
+            if envelope:
+                data_key = data_keys[i * DATA_KEY_SIZE : (i + 1) * DATA_KEY_SIZE]
+                data_cypher_text, data_tag = self.backend.encrypt_once(
+                    data_key, DATA_NONCE, plaintext, value_header
+                )
+                wrapped, tag = encrypt(key, nonce, data_key, value_header)
+                cypher_text = wrapped + data_tag + data_cypher_text
+            else:
+                cypher_text, tag = encrypt(key, nonce, plaintext, value_header)
+            encrypted.append(b"".join((value_header, nonce, key_id, tag, cypher_text)))
+        return encrypted
+
+    def uses_primary_key(self, value):
+        """Return True if value was encrypted by this KeyRing's primary key, going by
+        its header only."""
+        parsed = parse_versioned(bytes(value))
+        return parsed is not None and parsed[3] == self.primary_key_id
+
+    def rotate(self, value):
+        """Return value re-encrypted with the primary key, or None if it already is.
+        The payload is re-encrypted as it is, eg without decompressing it, and for
+        envelope (v4) values only the data key is."""
+        if self.uses_primary_key(value):
+            return None
+        value = bytes(value)
+        parsed = parse_versioned(value)
+        if parsed is not None and value[HEADER_SIZE - 1] == FORMAT_V4:
+            header = parsed[0]
+            offset = len(header) + WRAPPING_SIZE
+            unwrapped = self.unwrap(header, value[len(header) : offset])
+            if unwrapped is not None:
+                nonce = get_random_bytes(NONCE_SIZE)
+                wrapped, tag = self.backend.encrypt(
+                    self.primary_key, nonce, unwrapped[0], header
+                )
+                return b"".join(
+                    (header, nonce, self.primary_key_id, tag, wrapped, value[offset:])
+                )
+        payload, _, flags = self.decrypt_and_identify(value)
+        return self.encrypt(payload, flags)
+
+    def decrypt(self, value, zdict=None):
+        """Decrypt value, decompressing it (with the preset dictionary zdict) if it
+        was compressed."""
+        payload, _, flags = self.decrypt_and_identify(value)
+        if flags:
+            payload = decode_payload(payload, flags, zdict)
+        return payload
+
+    def decrypt_and_identify(self, value):
+        """Return (payload, key, flags) where key is the (raw bytes) key that
+        decrypted value, so callers can tell if it still uses an old key, and flags
+        describe the payload (see decode_payload())."""
+        # Perform same nonce checks here as Pycryptodome, so we can raise a more user
+        # friendly error message
+        if not isinstance(value, (bytes, bytearray, memoryview)):
+            raise ValueError("Data is corrupted.")
+        value = bytes(value)
+        if len(value) < HEADER_SIZE + NONCE_SIZE:
+            raise ValueError("Data is corrupted.")
+
+        parsed = parse_versioned(value)
+        if parsed is not None and value[HEADER_SIZE - 1] == FORMAT_V4:
+            decrypted = self._decrypt_envelope(value, parsed[0])
+            if decrypted is not None:
+                return decrypted + (parsed[1],)
+        elif parsed is not None:
+            header, flags, nonce, key_id, tag, cypher_text = parsed
+            decrypted = self._decrypt_with(
+                self.get_keys(key_id),
+                nonce,
+                tag,
+                cypher_text,
+                # v1 headers are not authenticated
+                header if len(header) > HEADER_SIZE else None,
+            )
+            if decrypted is not None:
+                return decrypted + (flags,)
+        # A legacy nonce may start with the same bytes as our header, so anything
+        # that did not decrypt as a versioned value is also tried as legacy data.
+        decrypted = self._decrypt_legacy(value)
+        if decrypted is not None:
+            return decrypted + (0,)
+        raise ValueError("AES Key incorrect or data is corrupted")
+
+    def unwrap(self, header, wrapping):
+        """Return (data key, key) for the wrapped data key of a v4 value, where key
+        is the (raw bytes) key that unwrapped it, or None if none could.
+
+        wrapping is the nonce, key id, tag and wrapped data key following the
+        header. Results are cached, see data_key_cache_size.
+        """
+        nonce = wrapping[:NONCE_SIZE]
+        key_id = wrapping[NONCE_SIZE : NONCE_SIZE + KEY_ID_SIZE]
+        tag = wrapping[NONCE_SIZE + KEY_ID_SIZE : NONCE_SIZE + KEY_ID_SIZE + TAG_SIZE]
+        wrapped = wrapping[NONCE_SIZE + KEY_ID_SIZE + TAG_SIZE :]
+        if len(wrapped) != DATA_KEY_SIZE:
+            return None
+        return self._decrypt_with(self.get_keys(key_id), nonce, tag, wrapped, header)
+
+    def _decrypt_envelope(self, value, header):
+        offset = len(header) + WRAPPING_SIZE
+        unwrapped = self.unwrap(header, value[len(header) : offset])
+        data_tag = value[offset : offset + TAG_SIZE]
+        if unwrapped is None or len(data_tag) != TAG_SIZE:
+            return None
+        data_key, key = unwrapped
+        try:
+            payload = self.backend.decrypt_once(
+                data_key, DATA_NONCE, value[offset + TAG_SIZE :], data_tag, header
+            )
+        except ValueError:
+            return None
+        return payload, key
+
+    def _decrypt_legacy(self, value):
+        nonce = value[:LEGACY_NONCE_SIZE]
+        tag = value[LEGACY_NONCE_SIZE : LEGACY_NONCE_SIZE + TAG_SIZE]
+        cypher_text = value[LEGACY_NONCE_SIZE + TAG_SIZE :]
+        if len(tag) != TAG_SIZE:
+            return None
+        return self._decrypt_with(self.keys, nonce, tag, cypher_text)
+
+    def _decrypt_with(self, keys, nonce, tag, cypher_text, header=None):
+        decrypt = self.backend.decrypt
+        for key in keys:
+            try:
+                return decrypt(key, nonce, cypher_text, tag, header), key
+            except ValueError:
+                continue
+        return None
+
+
+_keyrings = {}
+
+
+def get_keyring(keys=None):
+    """Return the process wide KeyRing for keys (settings.FIELD_ENCRYPTION_KEYS by
+    default), parsing the keys on first use only."""
+    if keys is None:
+        keys = settings.FIELD_ENCRYPTION_KEYS
+    cache_key = tuple(keys) if isinstance(keys, (list, tuple)) else keys
+    keyring = _keyrings.get(cache_key)
+    if keyring is None:
+        keyring = _keyrings[cache_key] = KeyRing(keys)
+    return keyring
+
+
+def clear_keyring():
+    """Forget all cached KeyRings, eg after changing FIELD_ENCRYPTION_KEYS at runtime."""
+    _keyrings.clear()
+
+
+@receiver(setting_changed)
+def reset_keyring(*, setting, **kwargs):
+    if setting in (
+        "FIELD_ENCRYPTION_KEYS",
+        "FIELD_ENCRYPTION_BACKEND",
+        "FIELD_ENCRYPTION_DATA_KEY_CACHE_SIZE",
+    ):
+        clear_keyring()
@@ -1,12 +1,31 @@
+import datetime
 import hashlib
+import hmac
 import string
+import threading
+import unicodedata
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from inspect import isclass
+from time import perf_counter
 
-from Crypto.Cipher import AES
+from django.apps import apps
 from django.conf import settings
-from django.core.exceptions import FieldError, ImproperlyConfigured
-from django.db import models
+from django.core import checks
+from django.core.exceptions import (
+    EmptyResultSet,
+    FieldDoesNotExist,
+    FieldError,
+    ImproperlyConfigured,
+)
+from django.core.signals import setting_changed
+from django.db import connections, models, router, transaction
+from django.db.models.lookups import Exact, In
+from django.dispatch import receiver
 from django.utils.functional import cached_property
+from django.utils import timezone
 from django.utils.text import capfirst
 from django.contrib.admin.widgets import (
     AdminTextInputWidget,
@@ -18,6 +37,9 @@ from django.contrib.admin.widgets import (
     AdminTextareaWidget,
 )
 
+from . import encoding, metrics, repair
+from .encryption import compress_payload, decode_payload, get_keyring
+
 
 __all__ = [
     "EncryptedFieldMixin",
@@ -32,13 +54,227 @@ __all__ = [
     "EncryptedPositiveSmallIntegerField",
     "EncryptedSmallIntegerField",
     "SearchField",
+    "PrefixSearchField",
+    "RangeBucketField",
 ]
 
 
+_decryption_state = threading.local()
+
+
+@contextmanager
+def decryption_deferred():
+    """Within this block, values loaded by EncryptedFields are not decrypted but
+    wrapped in an EncryptedValue, to be decrypted on first access."""
+    previous = getattr(_decryption_state, "deferred", False)
+    _decryption_state.deferred = True
+    try:
+        yield
+    finally:
+        _decryption_state.deferred = previous
+
+
+_save_state = threading.local()
+
+
+@contextmanager
+def prepared_for_save(values):
+    """Within this block, pre_save() of EncryptedFields and SearchFields returns the
+    values already prepared for the instance, eg in a batch by bulk_create().
+
+    values is a dict of {(id(model_instance), attname): value}.
+    """
+    previous = getattr(_save_state, "prepared", None)
+    _save_state.prepared = values
+    try:
+        yield
+    finally:
+        _save_state.prepared = previous
+
+
+def get_prepared_value(model_instance, attname, default):
+    prepared = getattr(_save_state, "prepared", None)
+    if prepared is None:
+        return default
+    return prepared.get((id(model_instance), attname), default)
+
+
+_missing = object()
+
+
+class EncryptedValue:
+    """A value loaded from the database that has not been decrypted yet."""
+
+    __slots__ = ("field", "cypher_text")
+
+    def __init__(self, field, cypher_text):
+        self.field = field
+        self.cypher_text = cypher_text
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}: {self.field.name}>"
+
+    def decrypt(self):
+        return self.field.to_python(self.field.decrypt(self.cypher_text))
+
+    def uses_primary_key(self):
+        return self.field.keyring.uses_primary_key(self.cypher_text)
+
+
+def load_deferred_fields(instances, attnames):
+    """Load the deferred EncryptedFields attnames of instances, all of one model and
+    from one database, with one pk__in query (per max_query_params instances).
+
+    Values are loaded as EncryptedValues, decrypted when first read. Attributes that
+    have been set in the meantime are left alone.
+    """
+    instances = [obj for obj in instances if obj.pk is not None]
+    if not instances or not attnames:
+        return
+    first = instances[0]
+    instances_by_pk = {}
+    for obj in instances:
+        instances_by_pk.setdefault(obj.pk, []).append(obj)
+    pks = list(instances_by_pk)
+    batch_size = connections[first._state.db].features.max_query_params or len(pks)
+    manager = first._meta.base_manager.db_manager(first._state.db)
+    for i in range(0, len(pks), batch_size):
+        queryset = manager.filter(pk__in=pks[i : i + batch_size])
+        with decryption_deferred():
+            rows = list(queryset.values_list("pk", *attnames))
+        for pk, *values in rows:
+            for obj in instances_by_pk[pk]:
+                for attname, value in zip(attnames, values):
+                    obj.__dict__.setdefault(attname, value)
+
+
+def update_rotated_rows(manager, fields, rows):
+    """Save the values of fields (EncryptedFields of manager's model) re-encrypted by
+    KeyRing.rotate(), from (pk, values, rotated) rows: the loaded EncryptedValues (or
+    None) and the new ciphertexts (None where unchanged), with a bulk_update().
+
+    Only the rows and fields with a new ciphertext are updated. Return the number of
+    rows updated.
+    """
+    update_fields = [
+        field
+        for i, field in enumerate(fields)
+        if any(rotated[i] is not None for _, _, rotated in rows)
+    ]
+    objs = []
+    for pk, values, rotated in rows:
+        if all(new_value is None for new_value in rotated):
+            continue
+        obj = manager.model(pk=pk)
+        # Every updated row gets a value for every updated field, so values that
+        # don't need rotating are written back with their existing ciphertext.
+        for field, value, new_value in zip(fields, values, rotated):
+            if field not in update_fields:
+                continue
+            if new_value is not None:
+                value = EncryptedValue(field, new_value)
+            # An expression, so bulk_update saves the ciphertext as it is.
+            obj.__dict__[field.attname] = models.Value(value, output_field=field)
+        objs.append(obj)
+    if not objs:
+        return 0
+    if hasattr(manager, "bulk_update"):
+        manager.bulk_update(objs, [field.name for field in update_fields])
+    else:  # Django < 2.2
+        for obj in objs:
+            manager.filter(pk=obj.pk).update(
+                **{f.attname: obj.__dict__[f.attname] for f in update_fields}
+            )
+    return len(objs)
+
+
+class DeferredFieldsBatch:
+    """The instances fetched together by an EncryptedQuerySet.
+
+    When a deferred EncryptedField (eg the companion of a SearchField, after only()
+    or defer()) is read on one of them, it is loaded for all of them in one query,
+    rather than one query per instance. Other deferred fields are left deferred.
+    """
+
+    def __init__(self):
+        self._refs = []
+
+    def __reduce__(self):
+        # Instances are only loaded together within the process that fetched them.
+        return (DeferredFieldsBatch, ())
+
+    def add(self, instance):
+        self._refs.append(weakref.ref(instance))
+        instance._state.deferred_batch = self
+
+    def load(self, instance, attname):
+        """Load the deferred EncryptedField attname of instance, and of the other
+        instances of the batch that are still in use."""
+        others = []
+        for ref in self._refs:
+            obj = ref()
+            if (
+                obj is not None
+                and obj is not instance
+                and obj.__class__ is instance.__class__
+                and obj._state.db == instance._state.db
+                and attname not in obj.__dict__
+            ):
+                others.append(obj)
+        load_deferred_fields([instance] + others, [attname])
+        self._refs = [ref for ref in self._refs if ref() is not None]
+
+
+def load_deferred_field(instance, attname, field):
+    """Load the deferred attname of instance, along with that of the instances of its
+    DeferredFieldsBatch if it has one, else with refresh_from_db()."""
+    batch = getattr(instance._state, "deferred_batch", None)
+    if batch is not None:
+        batch.load(instance, attname)
+    if attname not in instance.__dict__:
+        if metrics.enabled:
+            metrics.increment("refresh_from_db", field)
+        instance.refresh_from_db(fields=[attname])
+
+
+class EncryptedFieldDescriptor:
+    """Decrypts an EncryptedValue the first time the attribute is read, then keeps
+    the python value on the instance. Also loads the value from the database if the
+    field was deferred."""
+
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        data = instance.__dict__
+        attname = self.field.attname
+        if attname not in data:
+            load_deferred_field(instance, attname, self.field)
+        value = data[attname]
+        if isinstance(value, EncryptedValue):
+            if repair.enabled and not value.uses_primary_key():
+                repair.add(self.field, instance)
+            value = data[attname] = value.decrypt()
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
 class EncryptedFieldMixin(models.Field):
     """A field that encrypts values with AES 256 symmetric encryption,
     using Pycryptodome.
 
+    Values are decrypted as they are loaded from the database, unless loaded via
+    EncryptedQuerySet.defer_decryption(), in which case they are decrypted when first
+    read. Values that are never read are saved back to the database as they were.
+
+    With envelope=True each value is encrypted with a random data key of its own,
+    stored encrypted by the key from FIELD_ENCRYPTION_KEYS, so rotating keys only
+    re-encrypts the data keys rather than the values (see encryption.KeyRing).
+
     Note: Be careful not to change/alter a pre-existing regular django field to be an
     EncryptedField. The data for existing rows will be unencrypted in the database and
     appear 'corrupted' when trying to decrypt/fetch it.
@@ -46,7 +282,9 @@ class EncryptedFieldMixin(models.Field):
     to transfer data from the old field.
     """
 
-    def __init__(self, *args, **kwargs):
+    descriptor_class = EncryptedFieldDescriptor
+
+    def __init__(self, *args, envelope=False, **kwargs):
         if kwargs.get("primary_key"):
             raise ImproperlyConfigured(
                 f"{self.__class__.__name__} does not support primary_key=True."
@@ -60,8 +298,15 @@ class EncryptedFieldMixin(models.Field):
                 f"{self.__class__.__name__} does not support db_index=True."
             )
         self._internal_type = "BinaryField"
+        self.envelope = envelope
         super().__init__(*args, **kwargs)
 
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.envelope:
+            kwargs["envelope"] = True
+        return name, path, args, kwargs
+
     @cached_property
     def keys(self):
         # should be a list or tuple of hex encoded 32byte keys
@@ -70,40 +315,138 @@ class EncryptedFieldMixin(models.Field):
             raise ImproperlyConfigured("FIELD_ENCRYPTION_KEYS should be a list.")
         return key_list
 
+    @property
+    def keyring(self):
+        return get_keyring(self.keys)
+
+    # zlib preset dictionary of compressed values, see EncryptedTextField.
+    compress_dictionary = None
+    # Whether encode_plaintext() may return a binary encoding from encoding.py,
+    # rather than text.
+    binary_plaintext = False
+
+    def encode_plaintext(self, value):
+        """Return (payload, flags): the bytes to encrypt for value and the flags
+        describing them (see encryption.decode_payload())."""
+        if not isinstance(value, str):
+            value = str(value)
+        return value.encode(), 0
+
+    def decode_plaintext(self, payload, flags):
+        """The reverse of encode_plaintext(), returning a value for to_python()."""
+        if flags:
+            payload = decode_payload(payload, flags, self.compress_dictionary)
+        if self.binary_plaintext and encoding.is_encoded(payload):
+            return encoding.decode(payload)
+        return payload.decode()
+
     def encrypt(self, data_to_encrypt):
-        if not isinstance(data_to_encrypt, str):
-            data_to_encrypt = str(data_to_encrypt)
-        cipher = AES.new(bytes.fromhex(self.keys[0]), AES.MODE_GCM)
-        nonce = cipher.nonce
-        cypher_text, tag = cipher.encrypt_and_digest(data_to_encrypt.encode())
-        return nonce + tag + cypher_text
+        if metrics.enabled:
+            start = perf_counter()
+            encrypted = self.keyring.encrypt(
+                *self.encode_plaintext(data_to_encrypt), envelope=self.envelope
+            )
+            metrics.observe("encrypt", self, perf_counter() - start)
+            return encrypted
+        return self.keyring.encrypt(
+            *self.encode_plaintext(data_to_encrypt), envelope=self.envelope
+        )
+
+    def encrypt_many(self, values, workers=None):
+        """Encrypt a list of values, like encrypt() but with less overhead per value.
+
+        With workers > 1, the values are split between that many threads.
+        """
+        start = perf_counter() if metrics.enabled else None
+        encoded = [self.encode_plaintext(value) for value in values]
+        plaintexts = [payload for payload, _ in encoded]
+        flags = [flag for _, flag in encoded] if any(f for _, f in encoded) else None
+        keyring = self.keyring
+        envelope = self.envelope
+        if not workers or workers < 2 or len(plaintexts) < 2:
+            encrypted = keyring.encrypt_many(plaintexts, flags, envelope)
+        else:
+            size = -(-len(plaintexts) // workers)
+            chunks = [
+                (plaintexts[i : i + size], flags and flags[i : i + size])
+                for i in range(0, len(plaintexts), size)
+            ]
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                encrypted = [
+                    value
+                    for chunk in executor.map(
+                        lambda chunk: keyring.encrypt_many(*chunk, envelope), chunks
+                    )
+                    for value in chunk
+                ]
+        if start is not None:
+            metrics.observe("encrypt", self, perf_counter() - start, len(plaintexts))
+        return encrypted
 
     def decrypt(self, value):
-        nonce = value[:16]
-        # Perform same nonce checks here as Pycryptodome, so we can raise a more user
-        # friendly error message
-        if not isinstance(nonce, (bytes, bytearray, memoryview)) or len(nonce) != 16:
-            raise ValueError("Data is corrupted.")
-        tag = value[16:32]
-        cypher_text = value[32:]
-        counter = 0
-        num_keys = len(self.keys)
-        while counter < num_keys:
-            cipher = AES.new(
-                bytes.fromhex(self.keys[counter]), AES.MODE_GCM, nonce=nonce
-            )
-            try:
-                plaintext = cipher.decrypt_and_verify(cypher_text, tag)
-            except ValueError:
-                counter += 1
-                continue
-            return plaintext.decode()
-        raise ValueError("AES Key incorrect or data is corrupted")
+        if metrics.enabled:
+            return self._measured_decrypt(value)
+        payload, _, flags = self.keyring.decrypt_and_identify(value)
+        return self.decode_plaintext(payload, flags)
+
+    def _measured_decrypt(self, value):
+        keyring = self.keyring
+        start = perf_counter()
+        payload, key, flags = keyring.decrypt_and_identify(value)
+        decrypted = self.decode_plaintext(payload, flags)
+        metrics.observe("decrypt", self, perf_counter() - start)
+        if key != keyring.primary_key:
+            metrics.increment("fallback_key", self)
+        return decrypted
 
     def get_internal_type(self):
         return self._internal_type
 
+    def pre_save(self, model_instance, add):
+        value = get_prepared_value(model_instance, self.attname, _missing)
+        if value is not _missing:
+            return value
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, EncryptedValue) and not (
+            getattr(self, "auto_now", False)
+            or (add and getattr(self, "auto_now_add", False))
+        ):
+            # Never read, so save it as it is rather than decrypting it first.
+            return value
+        return super().pre_save(model_instance, add)
+
     def get_db_prep_save(self, value, connection):
+        if isinstance(value, EncryptedValue):
+            return connection.Database.Binary(value.cypher_text)
+        value = self.get_db_prep_plaintext(value, connection)
+        if value is not None:
+            encrypted_value = self.encrypt(value)
+            return connection.Database.Binary(encrypted_value)
+
+    def get_db_prep_save_many(self, values, connection, workers=None):
+        """Batched get_db_prep_save(), returning EncryptedValues (or None) that are
+        saved as they are. Values that are already EncryptedValues are kept."""
+        prepared = [
+            value
+            if isinstance(value, EncryptedValue)
+            else self.get_db_prep_plaintext(value, connection)
+            for value in values
+        ]
+        to_encrypt = [
+            value
+            for value in prepared
+            if value is not None and not isinstance(value, EncryptedValue)
+        ]
+        encrypted = iter(self.encrypt_many(to_encrypt, workers=workers))
+        return [
+            value
+            if value is None or isinstance(value, EncryptedValue)
+            else EncryptedValue(self, next(encrypted))
+            for value in prepared
+        ]
+
+    def get_db_prep_plaintext(self, value, connection):
+        """The value to be encrypted, as prepared by the regular django field."""
         if self.empty_strings_allowed and value == bytes():
             # This tackles a corner case effecting string-based (eg Char/Text) fields
             # during migrations when null=False, blank=True and no default has been declared.
@@ -112,15 +455,18 @@ class EncryptedFieldMixin(models.Field):
             # We change this to "" to prevent str(bytes()), ie a literal "b''" being
             # used as the default to populate pre-existing records.
             value = ""
-        value = super().get_db_prep_save(value, connection)
-        if value is not None:
-            encrypted_value = self.encrypt(value)
-            return connection.Database.Binary(encrypted_value)
+        return super().get_db_prep_save(value, connection)
 
     def from_db_value(self, value, expression, connection):
         if value is not None:
+            if getattr(_decryption_state, "deferred", False):
+                return EncryptedValue(self, value)
             return self.to_python(self.decrypt(value))
 
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.attname, self.descriptor_class(self))
+
     @cached_property
     def validators(self):
         # For IntegerField (and subclasses) we must pretend to be that
@@ -132,8 +478,56 @@ class EncryptedFieldMixin(models.Field):
             self._internal_type = "BinaryField"
 
 
+DEFAULT_COMPRESS_THRESHOLD = 256
+
+
 class EncryptedTextField(EncryptedFieldMixin, models.TextField):
-    pass
+    """An EncryptedField for text, optionally compressed with zlib before being
+    encrypted (encrypted data can't be compressed by the database or backups).
+
+    With compress=True, values of at least compress_threshold bytes are compressed,
+    if that makes them smaller. compress_dictionary is an optional zlib preset
+    dictionary (bytes or str) of content typical of the field, which helps with
+    shorter values. Values compressed with a dictionary can only be read with the
+    same dictionary, so never change it.
+    """
+
+    def __init__(
+        self,
+        *args,
+        compress=False,
+        compress_threshold=DEFAULT_COMPRESS_THRESHOLD,
+        compress_dictionary=None,
+        **kwargs,
+    ):
+        if not isinstance(compress_threshold, int) or compress_threshold < 0:
+            raise ImproperlyConfigured(
+                "'compress_threshold' must be a positive integer"
+            )
+        if isinstance(compress_dictionary, str):
+            compress_dictionary = compress_dictionary.encode()
+        self.compress = compress
+        self.compress_threshold = compress_threshold
+        self.compress_dictionary = compress_dictionary or None
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.compress:
+            kwargs["compress"] = True
+        if self.compress_threshold != DEFAULT_COMPRESS_THRESHOLD:
+            kwargs["compress_threshold"] = self.compress_threshold
+        if self.compress_dictionary:
+            kwargs["compress_dictionary"] = self.compress_dictionary
+        return name, path, args, kwargs
+
+    def encode_plaintext(self, value):
+        payload, flags = super().encode_plaintext(value)
+        if self.compress:
+            return compress_payload(
+                payload, self.compress_threshold, self.compress_dictionary
+            )
+        return payload, flags
 
 
 class EncryptedCharField(EncryptedFieldMixin, models.CharField):
@@ -144,37 +538,110 @@ class EncryptedEmailField(EncryptedFieldMixin, models.EmailField):
     pass
 
 
-class EncryptedIntegerField(EncryptedFieldMixin, models.IntegerField):
+class PackedIntegerMixin:
+    """Encrypts integers packed in 1, 2, 4 or 8 bytes, rather than as text."""
+
+    binary_plaintext = True
+
+    def encode_plaintext(self, value):
+        payload = encoding.encode_int(value)
+        if payload is None:
+            return super().encode_plaintext(value)
+        return payload, 0
+
+
+class EncryptedIntegerField(
+    PackedIntegerMixin, EncryptedFieldMixin, models.IntegerField
+):
     pass
 
 
-class EncryptedPositiveIntegerField(EncryptedFieldMixin, models.PositiveIntegerField):
+class EncryptedPositiveIntegerField(
+    PackedIntegerMixin, EncryptedFieldMixin, models.PositiveIntegerField
+):
     pass
 
 
 class EncryptedPositiveSmallIntegerField(
-    EncryptedFieldMixin, models.PositiveSmallIntegerField
+    PackedIntegerMixin, EncryptedFieldMixin, models.PositiveSmallIntegerField
 ):
     pass
 
 
-class EncryptedSmallIntegerField(EncryptedFieldMixin, models.SmallIntegerField):
+class EncryptedSmallIntegerField(
+    PackedIntegerMixin, EncryptedFieldMixin, models.SmallIntegerField
+):
     pass
 
 
-class EncryptedBigIntegerField(EncryptedFieldMixin, models.BigIntegerField):
+class EncryptedBigIntegerField(
+    PackedIntegerMixin, EncryptedFieldMixin, models.BigIntegerField
+):
     pass
 
 
 class EncryptedDateField(EncryptedFieldMixin, models.DateField):
-    pass
+    """Encrypts dates as their ordinal, rather than as text."""
+
+    binary_plaintext = True
+
+    def get_db_prep_plaintext(self, value, connection):
+        return self.get_prep_value(value)
+
+    def encode_plaintext(self, value):
+        return encoding.encode_date(value), 0
 
 
 class EncryptedDateTimeField(EncryptedFieldMixin, models.DateTimeField):
-    pass
+    """Encrypts datetimes as microseconds since the epoch, rather than as text.
+
+    Like the regular django field, aware values are made naive (in the connection's
+    time zone) for databases that don't support time zones, so values are read back
+    as they were before this encoding.
+    """
+
+    binary_plaintext = True
+
+    def get_db_prep_plaintext(self, value, connection):
+        value = self.get_prep_value(value)
+        if (
+            value is not None
+            and timezone.is_aware(value)
+            and not connection.features.supports_timezones
+        ):
+            value = timezone.make_naive(value, connection.timezone)
+        return value
+
+    def encode_plaintext(self, value):
+        return encoding.encode_datetime(value), 0
+
+
+@receiver(setting_changed)
+def update_cached_keys(*, setting, value, **kwargs):
+    """Keep the keys cached by model EncryptedFields in step with the setting."""
+    if setting != "FIELD_ENCRYPTION_KEYS" or not apps.ready:
+        return
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, EncryptedFieldMixin) and "keys" in field.__dict__:
+                if isinstance(value, (list, tuple)):
+                    field.__dict__["keys"] = value
+                else:
+                    del field.keys
 
 
 SEARCH_HASH_PREFIX = "xx"
+# The prefix of a SearchField hash records the algorithm that made it.
+SEARCH_HASH_PREFIXES = {
+    "sha256": SEARCH_HASH_PREFIX,
+    "hmac-sha256": "xh",
+    "blake2b": "xb",
+}
+DEFAULT_SEARCH_HASH_ALGORITHM = "sha256"
+SEARCH_HASH_DIGEST_SIZE = 32
+
+
+_search_hash_prefixes = frozenset(SEARCH_HASH_PREFIXES.values())
 
 
 def is_hashed_already(data_string):
@@ -187,7 +654,7 @@ def is_hashed_already(data_string):
     if not isinstance(data_string, str):
         return False
 
-    if not data_string.startswith(SEARCH_HASH_PREFIX):
+    if data_string[: len(SEARCH_HASH_PREFIX)] not in _search_hash_prefixes:
         return False
 
     actual_hash = data_string[len(SEARCH_HASH_PREFIX) :]
@@ -198,6 +665,251 @@ def is_hashed_already(data_string):
     return all([char in string.hexdigits for char in actual_hash])
 
 
+class SearchHash(bytes):
+    """A SearchField hash stored as raw bytes (a SearchField with binary=True).
+
+    Hashes are always of this type, from hashing or from the database, which is how
+    they are told apart from the values to be hashed: there is no prefix to look
+    for or hex digits to check.
+    """
+
+    __slots__ = ()
+
+
+@lru_cache(maxsize=None)
+def get_search_hasher(algorithm, hash_key, digest_size=None):
+    """Return a function that hashes a str value with algorithm and hash_key.
+
+    The hash is the prefixed hex digest, or with a digest_size, a SearchHash of the
+    first digest_size bytes of the digest.
+
+    For the keyed algorithms the key is processed once, here, and the resulting
+    state is copied for each value.
+    """
+    prefix = SEARCH_HASH_PREFIXES[algorithm]
+    if algorithm == "sha256":
+        # The original algorithm: the hash_key is a suffix of the value.
+        sha256 = hashlib.sha256
+        if digest_size is not None:
+
+            def hasher(value):
+                digest = sha256((value + hash_key).encode()).digest()
+                return SearchHash(digest[:digest_size])
+
+            return hasher
+
+        def hasher(value):
+            return prefix + sha256((value + hash_key).encode()).hexdigest()
+
+        return hasher
+
+    if algorithm == "hmac-sha256":
+        keyed = hmac.new(hash_key.encode(), digestmod=hashlib.sha256)
+    else:
+        keyed = hashlib.blake2b(key=hash_key.encode(), digest_size=32)
+
+    if digest_size is not None:
+
+        def hasher(value):
+            h = keyed.copy()
+            h.update(value.encode())
+            return SearchHash(h.digest()[:digest_size])
+
+        return hasher
+
+    def hasher(value):
+        h = keyed.copy()
+        h.update(value.encode())
+        return prefix + h.hexdigest()
+
+    return hasher
+
+
+def get_search_hash(
+    hash_key, value, algorithm=DEFAULT_SEARCH_HASH_ALGORITHM, digest_size=None
+):
+    """Return the SearchField hash of the str value, in the binary form (see
+    SearchHash) if a digest_size is given."""
+    # if we have hashed this previously, don't do it again
+    if digest_size is not None:
+        if isinstance(value, SearchHash):
+            return value
+    elif is_hashed_already(value):
+        return value
+
+    return get_search_hasher(algorithm, hash_key, digest_size)(value)
+
+
+def normalize_email(value):
+    """Canonicalize an email address: NFKC normalized, stripped and case-folded,
+    with an internationalized domain in its ASCII (IDNA) form."""
+    value = unicodedata.normalize("NFKC", value).strip().casefold()
+    local, at, domain = value.rpartition("@")
+    if at:
+        try:
+            domain = domain.encode("idna").decode("ascii")
+        except UnicodeError:
+            pass  # not a valid domain, keep it as it is
+        value = local + at + domain
+    return value
+
+
+# The named normalizers for SearchField(normalizer=...)
+SEARCH_NORMALIZERS = {
+    "strip": str.strip,
+    "casefold": str.casefold,
+    "nfkc": lambda value: unicodedata.normalize("NFKC", value),
+    "email": normalize_email,
+}
+# The named normalizers that make values case-insensitive, see normalizer_folds_case().
+CASE_FOLDING_NORMALIZERS = frozenset(["casefold", "email"])
+
+
+def get_search_normalizer(normalizer):
+    """Return a function applying normalizer to a str value, or None for no
+    normalizer.
+
+    normalizer is the name of one of SEARCH_NORMALIZERS, a list of names applied in
+    turn, or a function taking and returning a str.
+    """
+    if normalizer is None or callable(normalizer):
+        return normalizer
+    names = [normalizer] if isinstance(normalizer, str) else list(normalizer)
+    unknown = [name for name in names if name not in SEARCH_NORMALIZERS]
+    if unknown or not names:
+        raise ImproperlyConfigured(
+            f"'normalizer' must be a function, or one or more of "
+            f"{', '.join(SEARCH_NORMALIZERS)}"
+        )
+    if len(names) == 1:
+        return SEARCH_NORMALIZERS[names[0]]
+    functions = [SEARCH_NORMALIZERS[name] for name in names]
+
+    def normalize(value):
+        for function in functions:
+            value = function(value)
+        return value
+
+    return normalize
+
+
+def normalizer_folds_case(normalizer):
+    """Return True if normalizer (as for get_search_normalizer()) makes values that
+    differ only in case the same: one of its names is in CASE_FOLDING_NORMALIZERS,
+    or it is a function with a true folds_case attribute."""
+    if normalizer is None:
+        return False
+    if callable(normalizer):
+        return bool(getattr(normalizer, "folds_case", False))
+    names = [normalizer] if isinstance(normalizer, str) else normalizer
+    return any(name in CASE_FOLDING_NORMALIZERS for name in names)
+
+
+def hex_to_binary_search_hash(value, digest_size=32):
+    """Return the binary form of a (prefixed hex) SearchField hash, or None if value
+    isn't one. This is the hash the same SearchField would make with binary=True."""
+    if not is_hashed_already(value):
+        return None
+    return SearchHash(bytes.fromhex(value[len(SEARCH_HASH_PREFIX) :])[:digest_size])
+
+
+def convert_search_hashes(model_name, from_field, to_field, batch_size=1000):
+    """Return a migrations.RunPython operation that fills the SearchField to_field
+    with the hashes of the SearchField from_field, converted to to_field's storage
+    (see hex_to_binary_search_hash()), without decrypting anything.
+
+    Use it to change a SearchField to binary=True: add the new field, convert the
+    hashes, then remove the old field (and rename the new one). Hex hashes made by
+    another algorithm than from_field's (see SEARCH_HASH_PREFIXES) are skipped, as
+    its lookups don't match them either: re-save those rows to rehash them.
+    """
+    from django.db import migrations
+
+    def forwards(apps, schema_editor):
+        model = apps.get_model(model_name)
+        source = model._meta.get_field(from_field)
+        target = model._meta.get_field(to_field)
+        # Hashes of differently normalized values can't be converted without the
+        # values themselves.
+        if (source.hash_key, source.algorithm, source.normalizer) != (
+            target.hash_key,
+            target.algorithm,
+            target.normalizer,
+        ):
+            raise ValueError(
+                f"'{from_field}' and '{to_field}' must have the same hash_key, "
+                f"algorithm and normalizer for their hashes to be converted."
+            )
+        if not target.binary or (
+            source.binary and source.digest_size < target.digest_size
+        ):
+            raise ValueError(
+                f"'{to_field}' must be a binary SearchField, with a digest_size no "
+                f"larger than '{from_field}'s."
+            )
+
+        prefix = SEARCH_HASH_PREFIXES[source.algorithm]
+
+        def convert(value):
+            if source.binary:
+                return SearchHash(value[: target.digest_size])
+            if not value.startswith(prefix):
+                return None
+            return hex_to_binary_search_hash(value, target.digest_size)
+
+        manager = model._base_manager.db_manager(schema_editor.connection.alias)
+        rows = manager.exclude(**{from_field + "__isnull": True}).order_by("pk")
+        last_pk = None
+        while True:
+            batch = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+            batch = list(batch.values_list("pk", source.attname)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            converted = [(pk, convert(value)) for pk, value in batch]
+            converted = [(pk, value) for pk, value in converted if value is not None]
+            if not converted:
+                continue
+            whens = [
+                models.When(pk=pk, then=models.Value(value, output_field=target))
+                for pk, value in converted
+            ]
+            manager.filter(pk__in=[pk for pk, _ in converted]).update(
+                **{to_field: models.Case(*whens, output_field=target)}
+            )
+
+    return migrations.RunPython(forwards, migrations.RunPython.noop)
+
+
+_search_hash_cache = None
+
+
+def get_search_hash_cache():
+    """Return get_search_hash() wrapped in an LRU cache, used when preparing lookups.
+
+    The cache holds settings.SEARCH_FIELD_HASH_CACHE_SIZE values (default 1024, 0 to
+    disable it). Use its cache_info() for hit/miss statistics.
+    """
+    global _search_hash_cache
+    if _search_hash_cache is None:
+        size = getattr(settings, "SEARCH_FIELD_HASH_CACHE_SIZE", 1024)
+        _search_hash_cache = lru_cache(maxsize=size)(get_search_hash)
+    return _search_hash_cache
+
+
+def clear_search_hash_cache():
+    """Empty the SearchField hash cache, eg after changing a hash_key at runtime."""
+    if _search_hash_cache is not None:
+        _search_hash_cache.cache_clear()
+
+
+@receiver(setting_changed)
+def reset_search_hash_cache(*, setting, **kwargs):
+    global _search_hash_cache
+    if setting == "SEARCH_FIELD_HASH_CACHE_SIZE":
+        _search_hash_cache = None
+
+
 class SearchFieldDescriptor:
     def __init__(self, field):
         self.field = field
@@ -206,11 +918,9 @@ class SearchFieldDescriptor:
         if instance is None:
             return self
 
-        if self.field.encrypted_field_name in instance.__dict__:
-            decrypted_data = instance.__dict__[self.field.encrypted_field_name]
-        else:
-            instance.refresh_from_db(fields=[self.field.encrypted_field_name])
-            decrypted_data = getattr(instance, self.field.encrypted_field_name)
+        if self.field.encrypted_field_name not in instance.__dict__:
+            load_deferred_field(instance, self.field.encrypted_field_name, self.field)
+        decrypted_data = getattr(instance, self.field.encrypted_field_name)
 
         # swap data from encrypted_field to search_field
         setattr(instance, self.field.name, decrypted_data)
@@ -219,7 +929,7 @@ class SearchFieldDescriptor:
 
     def __set__(self, instance, value):
         instance.__dict__[self.field.name] = value
-        if not is_hashed_already(value):
+        if not self.field.is_hashed(value):
             # if the value has been hashed already, don't pass the value to encrypted_field.
             # otherwise will overwrite the real data with an encrypted version of the hash!!
             instance.__dict__[self.field.encrypted_field_name] = value
@@ -232,6 +942,20 @@ class SearchField(models.CharField):
     The user provided hash_key should be suitably long and random to prevent being able to 'guess' the value
     The user must provide an encrypted_field_name of the corresponding encrypted-data field in the same model.
 
+    The optional algorithm is one of "sha256" (the default, hashing value + hash_key),
+    "hmac-sha256" or "blake2b" (keyed). The keyed algorithms are faster, as the key is
+    only processed once. Each hash is prefixed with a marker of its algorithm.
+
+    With binary=True the raw digest is stored in a binary column, rather than as
+    prefixed hex, optionally truncated to digest_size=16 bytes (from 32) for an
+    even smaller index. See convert_search_hashes() to migrate existing hashes.
+
+    The optional normalizer (see get_search_normalizer()) is applied to values
+    before they are hashed, both when saving and in lookups, eg normalizer="email"
+    so any capitalization of an address finds it. Fields with a normalizer that
+    folds case (see normalizer_folds_case()) also support 'iexact' lookups, which
+    are the same as 'exact' ones.
+
     Notes:
          Do not use model.objects.update() unless you update both the SearchField and the associated EncryptedField.
          Always add a SearchField to a model, don't change/alter an existing regular django field.
@@ -250,11 +974,45 @@ class SearchField(models.CharField):
     description = "A secure SearchField to accompany an EncryptedField"
     descriptor_class = SearchFieldDescriptor
 
-    def __init__(self, hash_key=None, encrypted_field_name=None, *args, **kwargs):
+    def __init__(
+        self,
+        hash_key=None,
+        encrypted_field_name=None,
+        *args,
+        algorithm=DEFAULT_SEARCH_HASH_ALGORITHM,
+        binary=False,
+        digest_size=None,
+        normalizer=None,
+        **kwargs,
+    ):
         if hash_key is None:
             raise ImproperlyConfigured("you must supply a hash_key")
         self.hash_key = hash_key
 
+        if algorithm not in SEARCH_HASH_PREFIXES:
+            raise ImproperlyConfigured(
+                f"'algorithm' must be one of {', '.join(SEARCH_HASH_PREFIXES)}"
+            )
+        if algorithm == "blake2b" and len(hash_key.encode()) > 64:
+            raise ImproperlyConfigured(
+                "A 'blake2b' SearchField's hash_key must be at most 64 bytes"
+            )
+        self.algorithm = algorithm
+
+        if binary:
+            digest_size = digest_size or SEARCH_HASH_DIGEST_SIZE
+            if digest_size not in (16, SEARCH_HASH_DIGEST_SIZE):
+                raise ImproperlyConfigured("'digest_size' must be 16 or 32")
+        elif digest_size is not None:
+            raise ImproperlyConfigured("'digest_size' requires binary=True")
+        self.binary = binary
+        # The size of binary hashes, None for hex ones.
+        self.digest_size = digest_size
+
+        self.normalizer = normalizer
+        self.normalize = get_search_normalizer(normalizer)
+        self.folds_case = normalizer_folds_case(normalizer)
+
         if encrypted_field_name is None:
             raise ImproperlyConfigured(
                 "you must supply the name of the accompanying Encrypted Field"
@@ -274,7 +1032,10 @@ class SearchField(models.CharField):
         if "db_index" not in kwargs:
             # if not specified we should index by default.
             kwargs["db_index"] = True  # it is a field for searching!
-        kwargs["max_length"] = 64 + len(SEARCH_HASH_PREFIX)  # will be sha256 hex digest
+        if binary:
+            kwargs["max_length"] = digest_size
+        else:
+            kwargs["max_length"] = 64 + len(SEARCH_HASH_PREFIX)  # 32 byte hex digest
         kwargs["null"] = True  # should be nullable, in case data field is nullable.
         kwargs[
             "blank"
@@ -288,8 +1049,27 @@ class SearchField(models.CharField):
             kwargs["hash_key"] = self.hash_key
         if self.encrypted_field_name:
             kwargs["encrypted_field_name"] = self.encrypted_field_name
+        if self.algorithm != DEFAULT_SEARCH_HASH_ALGORITHM:
+            kwargs["algorithm"] = self.algorithm
+        if self.binary:
+            kwargs["binary"] = True
+            if self.digest_size != SEARCH_HASH_DIGEST_SIZE:
+                kwargs["digest_size"] = self.digest_size
+        if self.normalizer is not None:
+            kwargs["normalizer"] = self.normalizer
         return name, path, args, kwargs
 
+    def get_internal_type(self):
+        if self.binary:
+            return "BinaryField"
+        return super().get_internal_type()
+
+    def is_hashed(self, value):
+        """Return True if value is a hash, rather than a value to be hashed."""
+        if self.binary:
+            return isinstance(value, SearchHash)
+        return is_hashed_already(value)
+
     def has_default(self):
         """Always use the EncryptedFields default"""
         return self.model._meta.get_field(self.encrypted_field_name).has_default()
@@ -298,6 +1078,23 @@ class SearchField(models.CharField):
         """Always use EncryptedField's default."""
         return self.model._meta.get_field(self.encrypted_field_name).get_default()
 
+    def pre_save(self, model_instance, add):
+        value = get_prepared_value(model_instance, self.attname, _missing)
+        if value is not _missing:
+            return value
+        value = model_instance.__dict__.get(self.attname)
+        encrypted_value = model_instance.__dict__.get(self.encrypted_field_name)
+        if isinstance(encrypted_value, EncryptedValue) and (
+            len(value) == self.digest_size
+            if isinstance(value, SearchHash)
+            else is_hashed_already(value)
+            and value.startswith(SEARCH_HASH_PREFIXES[self.algorithm])
+        ):
+            # Neither field has been read or set since loading, so the stored hash
+            # is still correct and there is no need to decrypt the data to rehash it.
+            return value
+        return super().pre_save(model_instance, add)
+
     def get_prep_value(self, value):
         if value is None:
             return value
@@ -306,14 +1103,83 @@ class SearchField(models.CharField):
         # NOTE: not sure what happens when the str format for date/datetime is changed??
         # Should not matter as we are dealing with a datetime object in this case.
         # Eg str(datetime(10, 9, 2020))
-        value = str(value)
+        if not isinstance(value, SearchHash):
+            value = str(value)
+            if self.normalize is not None and not self.is_hashed(value):
+                value = self.normalize(value)
+
+        # Lookups often repeat the same values (eg logins), so use the cache.
+        if metrics.enabled:
+            start = perf_counter()
+            hashed = (_search_hash_cache or get_search_hash_cache())(
+                self.hash_key, value, self.algorithm, self.digest_size
+            )
+            metrics.observe("hash", self, perf_counter() - start)
+            return hashed
+        return (_search_hash_cache or get_search_hash_cache())(
+            self.hash_key, value, self.algorithm, self.digest_size
+        )
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if self.binary and value is not None:
+            return connection.Database.Binary(value)
+        return value
 
-        if is_hashed_already(value):
-            # if we have hashed this previously, don't do it again
+    def get_db_prep_save(self, value, connection):
+        # Values being saved are hashed without the cache, to keep it for lookups.
+        if value is None:
             return value
+        if not isinstance(value, SearchHash):
+            value = str(value)
+            if self.normalize is not None and not self.is_hashed(value):
+                value = self.normalize(value)
+        if metrics.enabled and not self.is_hashed(value):
+            start = perf_counter()
+            hashed = get_search_hash(
+                self.hash_key, value, self.algorithm, self.digest_size
+            )
+            metrics.observe("hash", self, perf_counter() - start)
+        else:
+            hashed = get_search_hash(
+                self.hash_key, value, self.algorithm, self.digest_size
+            )
+        if self.binary:
+            return connection.Database.Binary(hashed)
+        return hashed
 
-        v = value + self.hash_key
-        return SEARCH_HASH_PREFIX + hashlib.sha256(v.encode()).hexdigest()
+    def get_db_converters(self, connection):
+        converters = super().get_db_converters(connection)
+        if self.binary:
+            converters.append(self.convert_search_hash)
+        return converters
+
+    def convert_search_hash(self, value, expression, connection):
+        if value is not None:
+            return SearchHash(value)
+
+    def hash_many(self, values):
+        """Batched get_prep_value(), hashing each distinct value only once."""
+        start = perf_counter() if metrics.enabled else None
+        hashes = {}
+        prepared = []
+        normalize = self.normalize
+        for value in values:
+            if value is not None:
+                if not isinstance(value, SearchHash):
+                    value = str(value)
+                    if normalize is not None and not self.is_hashed(value):
+                        value = normalize(value)
+                hashed = hashes.get(value)
+                if hashed is None:
+                    hashed = hashes[value] = get_search_hash(
+                        self.hash_key, value, self.algorithm, self.digest_size
+                    )
+                value = hashed
+            prepared.append(value)
+        if start is not None:
+            metrics.observe("hash", self, perf_counter() - start, len(hashes))
+        return prepared
 
     def formfield(self, **kwargs):
         """Use formfield from self.encrypted_field_name, passing kwargs along
@@ -370,6 +1236,563 @@ class SearchField(models.CharField):
         setattr(cls, self.name, self.descriptor_class(self))
 
 
+# Prefix hashes are truncated to this many bytes.
+PREFIX_HASH_SIZE = 16
+
+
+def get_prefix_hash_model():
+    return apps.get_model("encrypted_fields", "PrefixSearchHash")
+
+
+class PrefixSearchField(models.Field):
+    """
+    A companion to an EncryptedField, like SearchField, for 'startswith' lookups (eg
+    autocomplete) without decrypting every row.
+
+    Keyed hashes of the normalized prefixes of the value, from min_prefix_length to
+    max_prefix_length characters long, are stored in a side table (the
+    encrypted_fields.PrefixSearchHash model), so a lookup is an indexed subquery on
+    that table. Prefixes are normalized with Unicode NFKC, stripped, and case folded
+    unless case_sensitive=True, so by default matching is case-insensitive.
+
+    Prefixes longer than max_prefix_length are looked up by their first
+    max_prefix_length characters, and the rows checked in python, which
+    EncryptedModelIterable does, so only it can run such lookups.
+
+    The field has no column of its own and can't be read or set. Hashes are updated
+    when instances are saved (if the value's prefixes changed since it was loaded)
+    or deleted, but not by QuerySet.update() or bulk_create(): call
+    update_prefixes() for those.
+
+    Requires "encrypted_fields" in INSTALLED_APPS and an integer primary key.
+    """
+
+    description = "Prefix hashes of an EncryptedField, for startswith lookups"
+
+    def __init__(
+        self,
+        hash_key=None,
+        encrypted_field_name=None,
+        *args,
+        min_prefix_length=1,
+        max_prefix_length=10,
+        case_sensitive=False,
+        **kwargs,
+    ):
+        if hash_key is None:
+            raise ImproperlyConfigured("you must supply a hash_key")
+        if encrypted_field_name is None:
+            raise ImproperlyConfigured(
+                "you must supply the name of the accompanying Encrypted Field"
+                " that will hold the data"
+            )
+        if not 1 <= min_prefix_length <= max_prefix_length:
+            raise ImproperlyConfigured(
+                "'min_prefix_length' must be at least 1 and at most "
+                "'max_prefix_length'"
+            )
+        self.hash_key = hash_key
+        self.encrypted_field_name = encrypted_field_name
+        self.min_prefix_length = min_prefix_length
+        self.max_prefix_length = max_prefix_length
+        self.case_sensitive = case_sensitive
+        kwargs["editable"] = False
+        kwargs["serialize"] = False
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["hash_key"] = self.hash_key
+        kwargs["encrypted_field_name"] = self.encrypted_field_name
+        if self.min_prefix_length != 1:
+            kwargs["min_prefix_length"] = self.min_prefix_length
+        if self.max_prefix_length != 10:
+            kwargs["max_prefix_length"] = self.max_prefix_length
+        if self.case_sensitive:
+            kwargs["case_sensitive"] = True
+        del kwargs["editable"], kwargs["serialize"]
+        return name, path, args, kwargs
+
+    def check(self, **kwargs):
+        errors = super().check(**kwargs)
+        if not apps.is_installed("encrypted_fields"):
+            errors.append(
+                checks.Error(
+                    "PrefixSearchField requires 'encrypted_fields' in "
+                    "INSTALLED_APPS, for its side table.",
+                    obj=self,
+                    id="encrypted_fields.E001",
+                )
+            )
+        if not isinstance(self.model._meta.pk, (models.AutoField, models.IntegerField)):
+            errors.append(
+                checks.Error(
+                    "PrefixSearchField requires a model with an integer primary key.",
+                    obj=self,
+                    id="encrypted_fields.E002",
+                )
+            )
+        return errors
+
+    def get_attname_column(self):
+        attname, _ = super().get_attname_column()
+        return attname, None
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, private_only=True)
+        if not cls._meta.abstract:
+            models.signals.post_init.connect(self.initialized, sender=cls, weak=False)
+            models.signals.post_save.connect(self.saved, sender=cls, weak=False)
+            models.signals.post_delete.connect(self.deleted, sender=cls, weak=False)
+
+    @cached_property
+    def label(self):
+        """The field's rows in the side table are marked with this."""
+        return f"{self.model._meta.label}.{self.name}"
+
+    def normalize(self, value):
+        value = unicodedata.normalize("NFKC", str(value)).strip()
+        return value if self.case_sensitive else value.casefold()
+
+    def prefix_hashes(self, value):
+        """Return the hashes of value's prefixes, to be stored."""
+        if value is None:
+            return []
+        value = self.normalize(value)
+        hasher = get_search_hasher("hmac-sha256", self.hash_key, PREFIX_HASH_SIZE)
+        longest = min(len(value), self.max_prefix_length)
+        return [hasher(value[:n]) for n in range(self.min_prefix_length, longest + 1)]
+
+    def lookup_hash(self, prefix):
+        """Return the hash to look up the rows starting with (normalized) prefix,
+        that of its first max_prefix_length characters if it is longer."""
+        if len(prefix) < self.min_prefix_length:
+            raise FieldError(
+                f"{self.label} only supports prefixes of at least "
+                f"{self.min_prefix_length} characters."
+            )
+        hasher = get_search_hasher("hmac-sha256", self.hash_key, PREFIX_HASH_SIZE)
+        return hasher(prefix[: self.max_prefix_length])
+
+    def indexed_value(self, value):
+        """The part of value its prefix hashes are made from."""
+        if value is None:
+            return None
+        return self.normalize(value)[: self.max_prefix_length]
+
+    def update_prefixes(self, instances, using=None, batch_size=500):
+        """Replace the prefix hashes of instances (saved model instances), eg after
+        bulk_create() or to fill the side table for existing rows."""
+        instances = list(instances)
+        if not instances:
+            return
+        using = using or instances[0]._state.db or router.db_for_write(self.model)
+        prefix_model = get_prefix_hash_model()
+        manager = prefix_model._base_manager.using(using)
+        for i in range(0, len(instances), batch_size):
+            batch = instances[i : i + batch_size]
+            rows = [
+                prefix_model(field=self.label, object_id=instance.pk, hash=hashed)
+                for instance in batch
+                for hashed in self.prefix_hashes(
+                    getattr(instance, self.encrypted_field_name)
+                )
+            ]
+            existing = manager.filter(
+                field=self.label, object_id__in=[obj.pk for obj in batch]
+            )
+            if not rows:
+                existing.delete()
+                continue
+            with transaction.atomic(using=using):
+                existing.delete()
+                manager.bulk_create(rows)
+
+    def initialized(self, sender, instance, **kwargs):
+        # Keep the value as it was loaded, to tell if its prefixes change.
+        values = instance._state.__dict__.setdefault("prefix_values", {})
+        values[self.name] = instance.__dict__.get(self.encrypted_field_name, _missing)
+
+    def saved(self, sender, instance, created, raw, using, update_fields, **kwargs):
+        if raw or (
+            update_fields is not None and self.encrypted_field_name not in update_fields
+        ):
+            return
+        value = instance.__dict__.get(self.encrypted_field_name, _missing)
+        if value is _missing or (isinstance(value, EncryptedValue) and not created):
+            # Not loaded, or never read, so it can't have changed.
+            return
+        values = instance._state.__dict__.setdefault("prefix_values", {})
+        loaded = values.get(self.name, _missing)
+        if not created and loaded is not _missing:
+            if isinstance(loaded, EncryptedValue):
+                loaded = loaded.decrypt()
+            if self.indexed_value(loaded) == self.indexed_value(value):
+                return
+        self.update_prefixes([instance], using=using)
+        values[self.name] = value
+
+    def deleted(self, sender, instance, using, **kwargs):
+        get_prefix_hash_model()._base_manager.using(using).filter(
+            field=self.label, object_id=instance.pk
+        ).delete()
+
+
+class PrefixSearchFieldStartsWith(models.Lookup):
+    """'startswith' lookup for PrefixSearchField: the rows whose pk is in the side
+    table with the prefix's hash.
+
+    A prefix longer than max_prefix_length is partial: the rows starting with its
+    first max_prefix_length characters have to be checked with matches(), which
+    EncryptedModelIterable does, so only it can run such lookups."""
+
+    lookup_name = "startswith"
+
+    def get_prep_lookup(self):
+        if hasattr(self.rhs, "resolve_expression"):
+            raise FieldError(
+                f"PrefixSearchField '{self.lookup_name}' lookups only support values."
+            )
+        field = self.lhs.output_field
+        self.prefix = field.normalize(self.rhs)
+        self.partial = len(self.prefix) > field.max_prefix_length
+        return field.lookup_hash(self.prefix)
+
+    def as_sql(self, compiler, connection):
+        field = self.lhs.output_field
+        if self.partial and not getattr(compiler.query, "post_filtering", False):
+            raise FieldError(
+                f"PrefixSearchField '{self.lookup_name}' lookups of prefixes longer "
+                "than max_prefix_length can only filter the model instances of an "
+                "EncryptedQuerySet"
+            )
+        pk_sql, pk_params = compiler.compile(
+            field.model._meta.pk.get_col(self.lhs.alias)
+        )
+        hashes = (
+            get_prefix_hash_model()
+            ._base_manager.filter(field=field.label, hash=self.rhs)
+            .values("object_id")
+        )
+        sql, params = hashes.query.get_compiler(connection=connection).as_sql()
+        return f"{pk_sql} IN ({sql})", [*pk_params, *params]
+
+    def matches(self, instance):
+        """Return True if instance's value starts with the prefix."""
+        field = self.lhs.output_field
+        value = getattr(instance, field.encrypted_field_name)
+        return value is not None and field.normalize(value).startswith(self.prefix)
+
+
+class PrefixSearchFieldIStartsWith(PrefixSearchFieldStartsWith):
+    lookup_name = "istartswith"
+
+    def get_prep_lookup(self):
+        if self.lhs.output_field.case_sensitive:
+            raise FieldError(
+                "A case sensitive PrefixSearchField does not support 'istartswith' "
+                "lookups"
+            )
+        return super().get_prep_lookup()
+
+
+# Range bucket hashes are truncated to this many bytes.
+RANGE_BUCKET_HASH_SIZE = 16
+# A RangeBucketField has at most this many buckets, which bounds the size of lookups.
+MAX_RANGE_BUCKETS = 10000
+# The numbers of the buckets of a date, for each date bucket_size.
+DATE_BUCKETS = {
+    "day": lambda value: value.toordinal(),
+    "month": lambda value: value.year * 12 + value.month - 1,
+    "year": lambda value: value.year,
+}
+
+
+class RangeBucketField(models.BinaryField):
+    """
+    A companion to an EncryptedField of integers, dates or datetimes, like
+    SearchField, for range lookups ('range', 'gt', 'gte', 'lt' and 'lte') without
+    decrypting every row.
+
+    Values are grouped in buckets of bucket_size integers, or by "day", "month" or
+    "year" for dates and datetimes (by their date in UTC), from min_value to
+    max_value. Values outside those go in the first or last bucket. A keyed hash of
+    the value's bucket is stored, and a lookup is an indexed 'IN' of the hashes of
+    the buckets covering its range.
+
+    Unless a lookup's range starts and ends on the edges of buckets, the buckets at
+    its ends also hold values outside it. The rows in those buckets are filtered in
+    python (decrypting only their values) when iterating an EncryptedQuerySet, and
+    anything else that would run such a lookup in the database, eg count(),
+    values(), update() or a subquery, raises FieldError.
+
+    Like a SearchField, the hash is not updated by QuerySet.update().
+    """
+
+    description = "Hashed buckets of an EncryptedField, for range lookups"
+
+    def __init__(
+        self,
+        hash_key=None,
+        encrypted_field_name=None,
+        *args,
+        bucket_size=None,
+        min_value=None,
+        max_value=None,
+        **kwargs,
+    ):
+        if hash_key is None:
+            raise ImproperlyConfigured("you must supply a hash_key")
+        if encrypted_field_name is None:
+            raise ImproperlyConfigured(
+                "you must supply the name of the accompanying Encrypted Field"
+                " that will hold the data"
+            )
+        if isinstance(bucket_size, int) and bucket_size > 0:
+            value_type, excluded_type = int, bool
+        elif bucket_size in DATE_BUCKETS:
+            value_type, excluded_type = datetime.date, datetime.datetime
+        else:
+            raise ImproperlyConfigured(
+                "'bucket_size' must be a positive integer, or one of "
+                f"{', '.join(DATE_BUCKETS)}"
+            )
+        if not all(
+            isinstance(value, value_type) and not isinstance(value, excluded_type)
+            for value in (min_value, max_value)
+        ):
+            raise ImproperlyConfigured(
+                f"'min_value' and 'max_value' must be {value_type.__name__}s"
+            )
+        if not min_value < max_value:
+            raise ImproperlyConfigured("'min_value' must be less than 'max_value'")
+        self.hash_key = hash_key
+        self.encrypted_field_name = encrypted_field_name
+        self.bucket_size = bucket_size
+        self.min_value = min_value
+        self.max_value = max_value
+        if self.bucket(max_value) - self.bucket(min_value) >= MAX_RANGE_BUCKETS:
+            raise ImproperlyConfigured(
+                f"A RangeBucketField can have at most {MAX_RANGE_BUCKETS} buckets, "
+                "use a larger 'bucket_size'"
+            )
+        if "db_index" not in kwargs:
+            kwargs["db_index"] = True
+        kwargs["max_length"] = RANGE_BUCKET_HASH_SIZE
+        kwargs["null"] = True
+        kwargs["blank"] = True
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["hash_key"] = self.hash_key
+        kwargs["encrypted_field_name"] = self.encrypted_field_name
+        kwargs["bucket_size"] = self.bucket_size
+        kwargs["min_value"] = self.min_value
+        kwargs["max_value"] = self.max_value
+        return name, path, args, kwargs
+
+    def check(self, **kwargs):
+        errors = super().check(**kwargs)
+        if isinstance(self.bucket_size, int):
+            field_class, kind = models.IntegerField, "an integer"
+        else:
+            field_class, kind = models.DateField, "a date or datetime"
+        try:
+            encrypted_field = self.encrypted_field
+        except FieldDoesNotExist:
+            encrypted_field = None
+        if not isinstance(encrypted_field, field_class):
+            errors.append(
+                checks.Error(
+                    f"RangeBucketField with bucket_size={self.bucket_size!r} requires "
+                    f"'{self.encrypted_field_name}' to be {kind} field.",
+                    obj=self,
+                    id="encrypted_fields.E003",
+                )
+            )
+        return errors
+
+    @cached_property
+    def encrypted_field(self):
+        return self.model._meta.get_field(self.encrypted_field_name)
+
+    @cached_property
+    def step(self):
+        """The difference between a value and the next one."""
+        if isinstance(self.bucket_size, int):
+            return 1
+        if isinstance(self.encrypted_field, models.DateTimeField):
+            return datetime.timedelta(microseconds=1)
+        return datetime.timedelta(days=1)
+
+    def domain_value(self, value):
+        """Return value as it is compared with min_value and max_value."""
+        if isinstance(value, datetime.datetime):
+            if timezone.is_aware(value):
+                value = value.astimezone(datetime.timezone.utc)
+            return value.date()
+        return value
+
+    def comparable_value(self, value, using):
+        """Return the EncryptedField's value, as compared with the bounds of lookups.
+
+        Datetimes are read as naive values, in the database's time zone, from
+        databases without time zone support."""
+        value = self.encrypted_field.to_python(value)
+        if (
+            settings.USE_TZ
+            and isinstance(value, datetime.datetime)
+            and timezone.is_naive(value)
+        ):
+            value = timezone.make_aware(value, connections[using].timezone)
+        return value
+
+    def bucket(self, value):
+        """Return the number of value's bucket."""
+        value = min(max(self.domain_value(value), self.min_value), self.max_value)
+        if isinstance(self.bucket_size, int):
+            return (value - self.min_value) // self.bucket_size
+        return DATE_BUCKETS[self.bucket_size](value)
+
+    def bucket_hash(self, number):
+        hasher = get_search_hasher("hmac-sha256", self.hash_key, RANGE_BUCKET_HASH_SIZE)
+        return hasher(f"{self.bucket_size}:{number}")
+
+    def covering_buckets(self, lower, upper):
+        """Return the hashes of the buckets holding the values from lower to upper
+        (inclusive, None for unbounded), and the set of those also holding values
+        outside that range."""
+        if lower is not None and upper is not None and lower > upper:
+            return [], set()
+        first = self.bucket(self.min_value if lower is None else lower)
+        last = self.bucket(self.max_value if upper is None else upper)
+        partial = set()
+        if lower is not None and not (
+            self.min_value < self.domain_value(lower)
+            and self.bucket(lower - self.step) != first
+        ):
+            partial.add(self.bucket_hash(first))
+        if upper is not None and not (
+            self.domain_value(upper) < self.max_value
+            and self.bucket(upper + self.step) != last
+        ):
+            partial.add(self.bucket_hash(last))
+        return [self.bucket_hash(n) for n in range(first, last + 1)], partial
+
+    def pre_save(self, model_instance, add):
+        value = model_instance.__dict__.get(self.encrypted_field_name, _missing)
+        hashed = model_instance.__dict__.get(self.attname)
+        if hashed is not None and (
+            value is _missing or isinstance(value, EncryptedValue)
+        ):
+            # Not loaded, or never read, so the stored hash is still correct.
+            return hashed
+        value = getattr(model_instance, self.encrypted_field_name)
+        if value is None:
+            hashed = None
+        else:
+            using = model_instance._state.db or router.db_for_write(self.model)
+            hashed = self.bucket_hash(self.bucket(self.comparable_value(value, using)))
+        setattr(model_instance, self.attname, hashed)
+        return hashed
+
+
+class RangeBucketFieldLookup(models.Lookup):
+    """Base of the lookups of RangeBucketField: the rows in the buckets covering the
+    values from lower to upper (inclusive, None for unbounded).
+
+    If the buckets at the ends also hold values outside that range, the rows have
+    to be checked with matches(), which EncryptedModelIterable does, so only it can
+    run such lookups in the database."""
+
+    def get_prep_lookup(self):
+        if hasattr(self.rhs, "resolve_expression"):
+            raise FieldError(
+                f"RangeBucketField '{self.lookup_name}' lookups only support values."
+            )
+        field = self.lhs.output_field
+        self.lower, self.upper = self.get_bounds(field)
+        self.hashes, self.partial = field.covering_buckets(self.lower, self.upper)
+        return self.rhs
+
+    def get_bounds(self, field):
+        raise NotImplementedError
+
+    def prepare_value(self, field, value):
+        if value is None:
+            raise ValueError("Cannot use None as a query value")
+        return field.encrypted_field.get_prep_value(
+            field.encrypted_field.to_python(value)
+        )
+
+    def as_sql(self, compiler, connection):
+        if self.partial and not getattr(compiler.query, "post_filtering", False):
+            raise FieldError(
+                f"RangeBucketField '{self.lookup_name}' lookups whose range doesn't "
+                "start and end on the edges of buckets can only filter the model "
+                "instances of an EncryptedQuerySet"
+            )
+        if not self.hashes:
+            raise EmptyResultSet
+        lhs_sql, params = self.process_lhs(compiler, connection)
+        placeholders = ", ".join(["%s"] * len(self.hashes))
+        params = list(params)
+        params.extend(connection.Database.Binary(hashed) for hashed in self.hashes)
+        return f"{lhs_sql} IN ({placeholders})", params
+
+    def matches(self, instance):
+        """Return True if instance's value is in the range."""
+        field = self.lhs.output_field
+        hashed = instance.__dict__.get(field.attname)
+        if hashed is not None and bytes(hashed) not in self.partial:
+            return True
+        value = getattr(instance, field.encrypted_field_name)
+        if value is not None:
+            value = field.comparable_value(value, instance._state.db)
+        return (
+            value is not None
+            and (self.lower is None or value >= self.lower)
+            and (self.upper is None or value <= self.upper)
+        )
+
+
+class RangeBucketFieldRange(RangeBucketFieldLookup):
+    lookup_name = "range"
+
+    def get_bounds(self, field):
+        lower, upper = self.rhs
+        return self.prepare_value(field, lower), self.prepare_value(field, upper)
+
+
+class RangeBucketFieldGreaterThan(RangeBucketFieldLookup):
+    lookup_name = "gt"
+
+    def get_bounds(self, field):
+        return self.prepare_value(field, self.rhs) + field.step, None
+
+
+class RangeBucketFieldGreaterThanOrEqual(RangeBucketFieldLookup):
+    lookup_name = "gte"
+
+    def get_bounds(self, field):
+        return self.prepare_value(field, self.rhs), None
+
+
+class RangeBucketFieldLessThan(RangeBucketFieldLookup):
+    lookup_name = "lt"
+
+    def get_bounds(self, field):
+        return None, self.prepare_value(field, self.rhs) - field.step
+
+
+class RangeBucketFieldLessThanOrEqual(RangeBucketFieldLookup):
+    lookup_name = "lte"
+
+    def get_bounds(self, field):
+        return None, self.prepare_value(field, self.rhs)
+
+
 def get_prep_lookup_error(self):
     """Raise errors for unsupported lookups"""
     raise FieldError(
@@ -377,9 +1800,40 @@ def get_prep_lookup_error(self):
     )
 
 
+class SearchFieldIExact(Exact):
+    """'iexact' lookup for a SearchField with a case-folding normalizer.
+
+    Values are normalized (so case-folded) before hashing, so this is an 'exact'
+    lookup on the hash, using the index."""
+
+    def get_prep_lookup(self):
+        if not self.lhs.output_field.folds_case:
+            raise FieldError(
+                f"{self.lhs.field.__class__.__name__} does not support 'iexact' "
+                "lookups without a normalizer that folds case"
+            )
+        return super().get_prep_lookup()
+
+
+class SearchFieldIn(In):
+    """'in' lookup for SearchField, hashing all the values in one batch."""
+
+    def get_prep_lookup(self):
+        if hasattr(self.rhs, "resolve_expression"):
+            return super().get_prep_lookup()
+        self.rhs = list(self.rhs)
+        if any(hasattr(value, "resolve_expression") for value in self.rhs):
+            return super().get_prep_lookup()
+        # NULL never matches 'in', so don't hash it.
+        values = [value for value in self.rhs if value is not None]
+        return list(dict.fromkeys(self.lhs.output_field.hash_many(values)))
+
+
 for name, lookup in models.Field.class_lookups.items():
     """Register inappropriate lookups with our error handler.
-    We allow 'isnull' for EncryptedField and 'isnull' and 'exact' for SearchField."""
+    We allow 'isnull' for EncryptedField, 'isnull', 'exact', 'iexact' and 'in'
+    for SearchField, only 'startswith' and 'istartswith' for PrefixSearchField and
+    'isnull' and the range lookups for RangeBucketField."""
     # Dynamically create classes that inherit from the right lookups
     if name != "isnull":
         lookup_class = type(
@@ -388,8 +1842,33 @@ for name, lookup in models.Field.class_lookups.items():
             {"get_prep_lookup": get_prep_lookup_error},
         )
         EncryptedFieldMixin.register_lookup(lookup_class)
-    if name not in ["isnull", "exact"]:
+    if name not in ["isnull", "exact", "iexact", "in"]:
         lookup_class = type(
             "SearchField" + name, (lookup,), {"get_prep_lookup": get_prep_lookup_error}
         )
         SearchField.register_lookup(lookup_class)
+    lookup_class = type(
+        "PrefixSearchField" + name,
+        (lookup,),
+        {"get_prep_lookup": get_prep_lookup_error},
+    )
+    PrefixSearchField.register_lookup(lookup_class)
+    if name != "isnull":
+        lookup_class = type(
+            "RangeBucketField" + name,
+            (lookup,),
+            {"get_prep_lookup": get_prep_lookup_error},
+        )
+        RangeBucketField.register_lookup(lookup_class)
+SearchField.register_lookup(SearchFieldIn)
+SearchField.register_lookup(SearchFieldIExact, lookup_name="iexact")
+PrefixSearchField.register_lookup(PrefixSearchFieldStartsWith)
+PrefixSearchField.register_lookup(PrefixSearchFieldIStartsWith)
+for lookup_class in (
+    RangeBucketFieldRange,
+    RangeBucketFieldGreaterThan,
+    RangeBucketFieldGreaterThanOrEqual,
+    RangeBucketFieldLessThan,
+    RangeBucketFieldLessThanOrEqual,
+):
+    RangeBucketField.register_lookup(lookup_class)
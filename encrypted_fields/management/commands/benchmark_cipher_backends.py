@@ -0,0 +1,98 @@
+import os
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from encrypted_fields.backends import get_backend
+from encrypted_fields.encryption import KeyRing
+
+BACKENDS = [
+    "encrypted_fields.backends.PycryptodomeBackend",
+    "encrypted_fields.backends.CryptographyBackend",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time each cipher backend encrypting and decrypting values of several sizes "
+        "on this host, and recommend the fastest for "
+        "settings.FIELD_ENCRYPTION_BACKEND. Backends whose library is not installed "
+        "are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backend",
+            action="append",
+            dest="backends",
+            metavar="DOTTED_PATH",
+            help="A backend class to time (repeatable, default: the built-in ones).",
+        )
+        parser.add_argument(
+            "--sizes",
+            default="16,256,4096",
+            help="Comma separated plaintext sizes in bytes (default: 16,256,4096).",
+        )
+        parser.add_argument(
+            "--min-time",
+            type=float,
+            default=0.2,
+            help="Minimum seconds spent timing each operation (default: 0.2).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",")]
+        except ValueError:
+            raise CommandError("--sizes should be a comma separated list of integers.")
+        key = os.urandom(32).hex()
+        keyrings = {}
+        for path in options["backends"] or BACKENDS:
+            try:
+                keyrings[path] = KeyRing([key], backend=get_backend(path))
+            except ImproperlyConfigured as e:
+                self.stdout.write(f"Skipping {path}: {e}")
+        if not keyrings:
+            raise CommandError("No backend is available.")
+
+        # Every backend must read what the others write.
+        for path, keyring in keyrings.items():
+            value = keyring.encrypt(b"check")
+            for other_path, other in keyrings.items():
+                if other.decrypt(value) != b"check":
+                    raise CommandError(f"{other_path} can't read values of {path}.")
+
+        totals = {}
+        for path, keyring in keyrings.items():
+            totals[path] = 0
+            for size in sizes:
+                plaintext = os.urandom(size)
+                value = keyring.encrypt(plaintext)
+                for operation, func in [
+                    ("encrypt", lambda: keyring.encrypt(plaintext)),
+                    ("decrypt", lambda: keyring.decrypt(value)),
+                ]:
+                    seconds = self.time(func, options["min_time"])
+                    totals[path] += seconds
+                    self.stdout.write(
+                        f"{keyring.backend.name} {operation} size={size}: "
+                        f"{seconds * 1e6:.2f}us"
+                    )
+        fastest = min(totals, key=totals.get)
+        self.stdout.write(
+            self.style.SUCCESS(f"Fastest backend on this host: {fastest}")
+        )
+        self.stdout.write(f'FIELD_ENCRYPTION_BACKEND = "{fastest}"')
+
+    def time(self, func, min_time):
+        """Return the time func takes per call, calling it for at least min_time."""
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                return elapsed / number
+            number *= 2
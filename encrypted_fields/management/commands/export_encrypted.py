@@ -0,0 +1,170 @@
+import base64
+import csv
+import datetime
+import decimal
+import gzip
+import json
+import os
+import time
+import uuid
+
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router
+from django.utils.duration import duration_iso_string
+
+from encrypted_fields.fields import RangeBucketField, SearchField
+from encrypted_fields.query import EncryptedQuerySet
+
+FORMATS = ["csv", "jsonl"]
+
+
+def csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, memoryview)):
+        return base64.b64encode(value).decode()
+    return value
+
+
+def json_value(value):
+    # Not DjangoJSONEncoder, which cuts times to milliseconds.
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return duration_iso_string(value)
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (bytes, memoryview)):
+        return base64.b64encode(value).decode()
+    return value
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the rows of a model, with their EncryptedFields decrypted, as CSV or "
+        "JSON lines, optionally gzipped. Rows are streamed in pk order a chunk at a "
+        "time, so memory use doesn't grow with the size of the table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("label", metavar="app_label.ModelName")
+        parser.add_argument(
+            "--output",
+            default="-",
+            help="File to write, '-' for stdout (default). A name ending in .gz is "
+            "gzipped.",
+        )
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="Output format (default: from the --output name, else csv).",
+        )
+        parser.add_argument("--gzip", action="store_true", help="Gzip the output file.")
+        parser.add_argument(
+            "--fields",
+            help="Comma separated names of the fields to export, SearchField names "
+            "for their decrypted values (default: all but SearchFields).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Number of rows fetched at a time (default: 2000).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes decrypting chunks while the next ones are "
+            "fetched (default: 1, decrypting as rows are read).",
+        )
+        parser.add_argument("--database", help="Database alias to use.")
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1.")
+        try:
+            model = apps.get_model(options["label"])
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+        fields = self.get_fields(model, options["fields"])
+        output = options["output"]
+        name = output[:-3] if output.endswith(".gz") else output
+        compress = options["gzip"] or output.endswith(".gz")
+        format = options["format"] or ("jsonl" if name.endswith(".jsonl") else "csv")
+        if output == "-" and compress:
+            raise CommandError("--gzip requires an --output file.")
+        # Keep stdout for the data when exporting to it.
+        self.report = self.stderr if output == "-" else self.stdout
+        self.verbosity = options["verbosity"]
+
+        database = options["database"] or router.db_for_read(model)
+        queryset = EncryptedQuerySet(model, using=database).order_by("pk")
+        if options["workers"] > 1:
+            rows = queryset.parallel_iterator(
+                workers=options["workers"], chunk_size=options["chunk_size"]
+            )
+        else:
+            rows = queryset.iterator(chunk_size=options["chunk_size"])
+
+        start = time.monotonic()
+        if output == "-":
+            count = self.write(rows, fields, format, self.stdout, options)
+        else:
+            if compress:
+                f = gzip.open(output, "wt", encoding="utf-8", newline="")
+            else:
+                f = open(output, "w", encoding="utf-8", newline="")
+            with f:
+                count = self.write(rows, fields, format, f, options)
+        seconds = time.monotonic() - start
+        size = "" if output == "-" else f", {os.path.getsize(output)} bytes"
+        self.report.write(
+            f"Exported {count} rows of {model._meta.label} in {seconds:.1f}s "
+            f"({count / seconds if seconds else 0:.0f} rows/s{size})."
+        )
+
+    def get_fields(self, model, names):
+        if not names:
+            return [
+                (field.attname, field)
+                for field in model._meta.concrete_fields
+                if not isinstance(field, (SearchField, RangeBucketField))
+            ]
+        fields = []
+        for name in names.split(","):
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist as e:
+                raise CommandError(str(e))
+            if not field.concrete or isinstance(field, RangeBucketField):
+                raise CommandError(f"{model._meta.label}.{name} can't be exported.")
+            fields.append((name, field))
+        return fields
+
+    def write(self, rows, fields, format, f, options):
+        """Write the rows to f, returning how many were written."""
+        names = [name for name, _ in fields]
+        # A SearchField's attribute is its decrypted value.
+        attnames = [field.attname for _, field in fields]
+        if format == "csv":
+            writer = csv.writer(f)
+            writer.writerow(names)
+        count = 0
+        for obj in rows:
+            values = [getattr(obj, attname) for attname in attnames]
+            if format == "csv":
+                writer.writerow([csv_value(value) for value in values])
+            else:
+                row = dict(zip(names, (json_value(value) for value in values)))
+                f.write(json.dumps(row) + "\n")
+            count += 1
+            if self.verbosity >= 2 and count % options["chunk_size"] == 0:
+                self.report.write(f"{count} rows exported...")
+        return count
@@ -0,0 +1,214 @@
+import csv
+import gzip
+import json
+import sys
+import time
+from itertools import islice
+
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+
+from encrypted_fields.fields import PrefixSearchField, RangeBucketField, SearchField
+from encrypted_fields.query import EncryptedQuerySet
+
+FORMATS = ["csv", "jsonl"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Import rows into a model from CSV or JSON lines (as written by "
+        "export_encrypted), optionally gzipped. Rows are streamed and inserted with "
+        "bulk_create(), encrypting and hashing the values of each field in batches. "
+        "Columns are mapped to fields by name, and setting a SearchField sets its "
+        "EncryptedField too. Values are converted but not validated."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("label", metavar="app_label.ModelName")
+        parser.add_argument(
+            "input",
+            help="File to read, '-' for stdin. A name ending in .gz is gunzipped.",
+        )
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="Input format (default: from the input name, else csv).",
+        )
+        parser.add_argument(
+            "--gzip", action="store_true", help="Gunzip the input file."
+        )
+        parser.add_argument(
+            "--map",
+            action="append",
+            default=[],
+            metavar="COLUMN=FIELD",
+            help="Import a column into a field of another name (repeatable).",
+        )
+        parser.add_argument(
+            "--exclude",
+            default="",
+            help="Comma separated names of columns not to import.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows inserted per query (default: 1000).",
+        )
+        parser.add_argument(
+            "--transaction-size",
+            type=int,
+            default=10000,
+            help="Number of rows read, encrypted and inserted per transaction "
+            "(default: 10000).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of threads encrypting the values of each field "
+            "(default: 1).",
+        )
+        parser.add_argument("--database", help="Database alias to use.")
+
+    def handle(self, *args, **options):
+        for option in ["batch_size", "transaction_size", "workers"]:
+            if options[option] < 1:
+                raise CommandError(f"--{option.replace('_', '-')} must be at least 1.")
+        try:
+            model = apps.get_model(options["label"])
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+        mapping = {}
+        for item in options["map"]:
+            column, sep, name = item.partition("=")
+            if not sep:
+                raise CommandError(f"--map should be COLUMN=FIELD, not '{item}'.")
+            mapping[column] = name
+        self.model = model
+        self.mapping = mapping
+        self.exclude = set(filter(None, options["exclude"].split(",")))
+        self.columns = {}
+        # Values for an EncryptedField are set through its SearchField, to hash them.
+        self.search_fields = {
+            field.encrypted_field_name: field
+            for field in model._meta.concrete_fields
+            if isinstance(field, SearchField)
+        }
+        self.verbosity = options["verbosity"]
+
+        path = options["input"]
+        name = path[:-3] if path.endswith(".gz") else path
+        format = options["format"] or ("jsonl" if name.endswith(".jsonl") else "csv")
+        if path == "-":
+            if options["gzip"]:
+                raise CommandError("--gzip requires an input file.")
+            f = sys.stdin
+        elif options["gzip"] or path.endswith(".gz"):
+            f = gzip.open(path, "rt", encoding="utf-8", newline="")
+        else:
+            f = open(path, encoding="utf-8", newline="")
+
+        database = options["database"] or router.db_for_write(model)
+        queryset = EncryptedQuerySet(model, using=database)
+        prefix_fields = [
+            field
+            for field in model._meta.private_fields
+            if isinstance(field, PrefixSearchField)
+        ]
+        count = unindexed = 0
+        start = time.monotonic()
+        try:
+            if format == "csv":
+                rows = csv.DictReader(f)
+            else:
+                rows = (json.loads(line) for line in f if line.strip())
+            instances = (
+                self.build(row, number, format == "csv")
+                for number, row in enumerate(rows, 1)
+            )
+            while True:
+                chunk = list(islice(instances, options["transaction_size"]))
+                if not chunk:
+                    break
+                with transaction.atomic(using=database):
+                    queryset.bulk_create(
+                        chunk,
+                        batch_size=options["batch_size"],
+                        encryption_workers=options["workers"],
+                    )
+                    # bulk_create() doesn't save prefix hashes, and without pks
+                    # (eg not given, and not returned by the database) they can't be.
+                    saved = [obj for obj in chunk if obj.pk is not None]
+                    for field in prefix_fields:
+                        field.update_prefixes(saved, using=database)
+                count += len(chunk)
+                unindexed += len(chunk) - len(saved)
+                if self.verbosity >= 2:
+                    self.stdout.write(f"{count} rows imported...")
+        finally:
+            if f is not sys.stdin:
+                f.close()
+        seconds = time.monotonic() - start
+        self.stdout.write(
+            f"Imported {count} rows into {model._meta.label} in {seconds:.1f}s "
+            f"({count / seconds if seconds else 0:.0f} rows/s)."
+        )
+        if prefix_fields and unindexed:
+            self.stderr.write(
+                f"The prefixes of {unindexed} rows were not saved, as their pks are "
+                "unknown: call PrefixSearchField.update_prefixes() for them."
+            )
+
+    def get_column(self, column):
+        """Return the field a column is imported into, or None if it is excluded."""
+        if column in self.columns:
+            return self.columns[column]
+        field = None
+        if column not in self.exclude:
+            name = self.mapping.get(column, column)
+            try:
+                field = self.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise CommandError(
+                    f"{self.model._meta.label} has no field '{name}' for column "
+                    f"'{column}': use --map or --exclude."
+                )
+            if not field.concrete or isinstance(field, RangeBucketField):
+                raise CommandError(f"{self.model._meta.label}.{name} can't be set.")
+            field = self.search_fields.get(field.name, field)
+        self.columns[column] = field
+        return field
+
+    def build(self, row, number, from_csv):
+        """Return a model instance with the values of a row."""
+        values = {}
+        search_values = {}
+        for column, value in row.items():
+            field = self.get_column(column)
+            if field is None:
+                continue
+            if isinstance(field, SearchField):
+                target = self.model._meta.get_field(field.encrypted_field_name)
+            else:
+                target = field
+            if from_csv and value == "":
+                if target.null or not target.empty_strings_allowed:
+                    value = None
+            try:
+                value = target.to_python(value)
+            except ValidationError as e:
+                raise CommandError(
+                    f"Row {number}, column '{column}': {'; '.join(e.messages)}"
+                )
+            if isinstance(field, SearchField):
+                search_values[field.name] = value
+            else:
+                values[field.attname] = value
+        obj = self.model(**values)
+        # Set after __init__, which would set their EncryptedFields to the default.
+        for name, value in search_values.items():
+            setattr(obj, name, value)
+        return obj
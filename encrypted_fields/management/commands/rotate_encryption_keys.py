@@ -0,0 +1,236 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router, transaction
+
+from encrypted_fields.encryption import get_keyring
+from encrypted_fields.fields import (
+    EncryptedFieldMixin,
+    decryption_deferred,
+    update_rotated_rows,
+)
+
+_worker_keys = None
+
+
+def _init_worker(keys):
+    global _worker_keys
+    _worker_keys = keys
+
+
+def _rotate_values(values):
+    """Re-encrypt a list of ciphertexts, returning None for those already using the
+    primary key (or that are NULL)."""
+    keyring = get_keyring(_worker_keys)
+    return [None if value is None else keyring.rotate(value) for value in values]
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-encrypt EncryptedField data with the first key in "
+        "settings.FIELD_ENCRYPTION_KEYS, in pk ordered chunks. Rows already using that "
+        "key are skipped and SearchFields are left untouched. Progress is saved to a "
+        "checkpoint file so an interrupted run can be resumed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "labels",
+            nargs="*",
+            metavar="app_label[.ModelName]",
+            help="Only rotate these apps/models (default: all models).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of rows fetched and updated at a time (default: 1000).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes used to re-encrypt each chunk (default: 1).",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0,
+            help="Seconds to pause between chunks, to reduce load (default: 0).",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default="rotate_encryption_keys.json",
+            help="Checkpoint file (default: rotate_encryption_keys.json). It is "
+            "removed once all models have been rotated.",
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Ignore any existing checkpoint and start from the beginning.",
+        )
+        parser.add_argument("--database", help="Database alias to use.")
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        if options["workers"] < 1:
+            raise CommandError("--workers must be at least 1.")
+        self.verbosity = options["verbosity"]
+        self.chunk_size = options["chunk_size"]
+        self.workers = options["workers"]
+        self.sleep = options["sleep"]
+        self.database = options["database"]
+        self.checkpoint_path = options["checkpoint"]
+        self.keyring = get_keyring()
+        # Rows before a checkpoint were rotated to the key it was saved with, so it
+        # only applies as long as that is still the first key.
+        key_id = self.keyring.primary_key_id.hex()
+        self.checkpoint = {"primary_key_id": key_id, "models": {}}
+        if not options["reset"] and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            if checkpoint.get("primary_key_id") == key_id:
+                self.checkpoint = checkpoint
+                self.stdout.write(f"Resuming from checkpoint '{self.checkpoint_path}'.")
+            else:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Ignoring checkpoint '{self.checkpoint_path}', saved with "
+                        "another first key in FIELD_ENCRYPTION_KEYS."
+                    )
+                )
+
+        self.executor = None
+        if self.workers > 1:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=([key.hex() for key in self.keyring.keys],),
+            )
+        try:
+            for model in self.get_models(options["labels"]):
+                self.rotate_model(model)
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        self.stdout.write(self.style.SUCCESS("Key rotation complete."))
+
+    def get_models(self, labels):
+        if labels:
+            selected = []
+            for label in labels:
+                try:
+                    if "." in label:
+                        selected.append(apps.get_model(label))
+                    else:
+                        selected.extend(apps.get_app_config(label).get_models())
+                except LookupError as e:
+                    raise CommandError(str(e))
+        else:
+            selected = apps.get_models()
+        return [
+            model
+            for model in selected
+            if not model._meta.proxy and self.get_encrypted_fields(model)
+        ]
+
+    def get_encrypted_fields(self, model):
+        # Fields inherited via multi-table inheritance are rotated with their parent.
+        return [
+            field
+            for field in model._meta.local_concrete_fields
+            if isinstance(field, EncryptedFieldMixin)
+        ]
+
+    def rotate_model(self, model):
+        label = model._meta.label
+        last_pk = self.checkpoint["models"].get(label)
+        if last_pk is True:
+            self.stdout.write(f"{label}: already rotated, skipping.")
+            return
+        fields = self.get_encrypted_fields(model)
+        attnames = [field.attname for field in fields]
+        database = self.database or router.db_for_write(model)
+        queryset = model._base_manager.using(database).order_by("pk")
+        rows_seen = rows_updated = 0
+        start = time.monotonic()
+        while True:
+            with transaction.atomic(using=database):
+                chunk = queryset.select_for_update()
+                if last_pk is not None:
+                    chunk = chunk.filter(pk__gt=last_pk)
+                # Load the ciphertexts without decrypting them.
+                with decryption_deferred():
+                    rows = list(chunk.values_list("pk", *attnames)[: self.chunk_size])
+                if not rows:
+                    break
+                updated = self.rotate_rows(model, fields, rows, database)
+            rows_seen += len(rows)
+            rows_updated += updated
+            last_pk = rows[-1][0]
+            self.save_checkpoint(label, last_pk)
+            if self.verbosity >= 2:
+                self.stdout.write(
+                    f"{label}: {rows_seen} rows checked, {rows_updated} updated..."
+                )
+            if self.sleep:
+                time.sleep(self.sleep)
+        self.save_checkpoint(label, True)
+        self.stdout.write(
+            f"{label}: {rows_seen} rows checked, {rows_updated} updated "
+            f"in {time.monotonic() - start:.1f}s."
+        )
+
+    def rotate_rows(self, model, fields, rows, database):
+        """Re-encrypt a chunk of (pk, *EncryptedValues) rows, updating those that
+        changed with bulk_update. Return the number of rows updated."""
+        num_rows = len(rows)
+        columns = list(zip(*rows))
+        # bytes, as memoryviews (eg from psycopg2) can't be pickled for the workers.
+        values = [
+            None if value is None else bytes(value.cypher_text)
+            for column in columns[1:]
+            for value in column
+        ]
+        rotated = self.rotate_values(values)
+        rotated_columns = [
+            rotated[i * num_rows : (i + 1) * num_rows] for i in range(len(fields))
+        ]
+        manager = model._base_manager.using(database)
+        return update_rotated_rows(
+            manager,
+            fields,
+            list(zip(columns[0], zip(*columns[1:]), zip(*rotated_columns))),
+        )
+
+    def rotate_values(self, values):
+        if self.executor is None:
+            return [
+                None if value is None else self.keyring.rotate(value)
+                for value in values
+            ]
+        batch_size = -(-len(values) // self.workers)
+        batches = [
+            values[i : i + batch_size] for i in range(0, len(values), batch_size)
+        ]
+        return [
+            value
+            for batch in self.executor.map(_rotate_values, batches)
+            for value in batch
+        ]
+
+    def save_checkpoint(self, label, last_pk):
+        self.checkpoint["models"][label] = last_pk
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.checkpoint, f, cls=DjangoJSONEncoder)
+        os.replace(tmp_path, self.checkpoint_path)
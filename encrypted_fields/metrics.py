@@ -0,0 +1,204 @@
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+__all__ = [
+    "CryptoMetrics",
+    "enable",
+    "disable",
+    "is_enabled",
+    "snapshot",
+    "reset",
+    "export_text",
+]
+
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+DEFAULT_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.1,
+)
+
+
+def get_labels(field):
+    """Return the (model label, field name) a field's metrics are recorded under."""
+    model = getattr(field, "model", None)
+    return (model._meta.label if model is not None else "", field.name or "")
+
+
+class CryptoMetrics:
+    """Counters and latency histograms of the work done by EncryptedFields and
+    SearchFields, per operation, model and field.
+
+    Timed operations are "encrypt", "decrypt" and "hash". Counted events are
+    "fallback_key" (a value decrypted with a key other than the first in
+    FIELD_ENCRYPTION_KEYS, ie still to be rotated) and "refresh_from_db" (a deferred
+    field loaded by its descriptor, one query each).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._counters = {}
+
+    def observe(self, operation, field, seconds, count=1):
+        """Record count operations on field, taking seconds in total."""
+        if not count:
+            return
+        key = (operation,) + get_labels(field)
+        bucket = bisect_left(self.buckets, seconds / count)
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                timer = self._timers[key] = [0, 0.0, [0] * (len(self.buckets) + 1)]
+            timer[0] += count
+            timer[1] += seconds
+            timer[2][bucket] += count
+
+    def increment(self, event, field, count=1):
+        key = (event,) + get_labels(field)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + count
+
+    def snapshot(self):
+        """Return a copy of the metrics collected so far:
+
+        {"timers": {(operation, model, field): {"count", "sum", "buckets"}},
+         "counters": {(event, model, field): count}}
+
+        where "buckets" maps each bucket's upper bound (ending with float("inf")) to
+        the cumulative number of operations that took at most that long.
+        """
+        bounds = self.buckets + (float("inf"),)
+        with self._lock:
+            timers = {
+                key: (count, total, list(buckets))
+                for key, (count, total, buckets) in self._timers.items()
+            }
+            counters = dict(self._counters)
+        snapshot = {"timers": {}, "counters": counters}
+        for key, (count, total, buckets) in sorted(timers.items()):
+            cumulative, running = {}, 0
+            for bound, value in zip(bounds, buckets):
+                running += value
+                cumulative[bound] = running
+            snapshot["timers"][key] = {
+                "count": count,
+                "sum": total,
+                "buckets": cumulative,
+            }
+        return snapshot
+
+    def reset(self):
+        with self._lock:
+            self._timers.clear()
+            self._counters.clear()
+
+    def export_text(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP encrypted_fields_operation_seconds "
+            "Time spent encrypting, decrypting and hashing field values.",
+            "# TYPE encrypted_fields_operation_seconds histogram",
+        ]
+        for (operation, model, field), timer in snapshot["timers"].items():
+            labels = format_labels(operation=operation, model=model, field=field)
+            for bound, count in timer["buckets"].items():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(
+                    f"encrypted_fields_operation_seconds_bucket"
+                    f'{{{labels},le="{le}"}} {count}'
+                )
+            lines.append(
+                f"encrypted_fields_operation_seconds_sum{{{labels}}} {timer['sum']!r}"
+            )
+            lines.append(
+                f"encrypted_fields_operation_seconds_count{{{labels}}} {timer['count']}"
+            )
+        lines += [
+            "# HELP encrypted_fields_events_total "
+            "Decryptions with a fallback key and deferred field loads.",
+            "# TYPE encrypted_fields_events_total counter",
+        ]
+        for (event, model, field), count in sorted(snapshot["counters"].items()):
+            labels = format_labels(event=event, model=model, field=field)
+            lines.append(f"encrypted_fields_events_total{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(**labels):
+    return ",".join(
+        '{}="{}"'.format(
+            name,
+            value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels.items()
+    )
+
+
+_metrics = CryptoMetrics()
+
+# Checked before any measuring is done, so disabled metrics cost a single lookup.
+enabled = settings.configured and bool(
+    getattr(settings, "ENCRYPTED_FIELDS_METRICS", False)
+)
+
+
+def enable():
+    """Start collecting metrics, whatever settings.ENCRYPTED_FIELDS_METRICS says."""
+    global enabled
+    enabled = True
+
+
+def disable():
+    """Stop collecting metrics. Those already collected are kept."""
+    global enabled
+    enabled = False
+
+
+def is_enabled():
+    return enabled
+
+
+def observe(operation, field, seconds, count=1):
+    _metrics.observe(operation, field, seconds, count)
+
+
+def increment(event, field, count=1):
+    _metrics.increment(event, field, count)
+
+
+def snapshot():
+    """See CryptoMetrics.snapshot()."""
+    return _metrics.snapshot()
+
+
+def reset():
+    """Forget all the metrics collected so far."""
+    _metrics.reset()
+
+
+def export_text():
+    """See CryptoMetrics.export_text()."""
+    return _metrics.export_text()
+
+
+@receiver(setting_changed)
+def update_enabled(*, setting, value, **kwargs):
+    global enabled
+    if setting == "ENCRYPTED_FIELDS_METRICS":
+        enabled = bool(value)
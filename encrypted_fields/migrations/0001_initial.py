@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrefixSearchHash',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('field', models.CharField(max_length=255)),
+                ('object_id', models.BigIntegerField()),
+                ('hash', models.BinaryField(max_length=16)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='prefixsearchhash',
+            index=models.Index(fields=['field', 'hash'], name='prefixsearchhash_hash'),
+        ),
+        migrations.AddIndex(
+            model_name='prefixsearchhash',
+            index=models.Index(fields=['field', 'object_id'], name='prefixsearchhash_object'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import models
+
+
+class PrefixSearchHash(models.Model):
+    """A keyed hash of one prefix of a PrefixSearchField's value.
+
+    Rows of every PrefixSearchField share this table, told apart by field (the
+    field's "app_label.ModelName.field_name").
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    field = models.CharField(max_length=255)
+    object_id = models.BigIntegerField()
+    hash = models.BinaryField(max_length=16)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["field", "hash"], name="prefixsearchhash_hash"),
+            models.Index(fields=["field", "object_id"], name="prefixsearchhash_object"),
+        ]
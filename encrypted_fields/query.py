@@ -0,0 +1,658 @@
+import asyncio
+import heapq
+import os
+import pickle
+import struct
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import chain, islice
+
+import django
+from django.apps import apps
+from django.db import connections, models, router, transaction
+from django.db.models.functions import Cast
+from django.core.exceptions import FieldError
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.query import ModelIterable
+from django.db.models.sql.where import OR, WhereNode
+
+from . import repair
+from .backends import get_backend
+from .encryption import get_keyring
+from .fields import (
+    DeferredFieldsBatch,
+    EncryptedFieldMixin,
+    EncryptedValue,
+    PrefixSearchFieldStartsWith,
+    RangeBucketFieldLookup,
+    SearchField,
+    decryption_deferred,
+    load_deferred_fields,
+    prepared_for_save,
+)
+
+__all__ = ["EncryptedQuerySet", "EncryptedManager"]
+
+
+def _has_deferred_encrypted_fields(obj):
+    return any(
+        isinstance(field, EncryptedFieldMixin) and field.attname not in obj.__dict__
+        for field in obj._meta.concrete_fields
+    )
+
+
+def _post_filtered_lookups(query):
+    """Return the RangeBucketField and PrefixSearchField lookups of query whose rows
+    have to be filtered in python, raising FieldError where that can't be done."""
+    lookups = []
+    nodes = [(query.where, False)]
+    while nodes:
+        node, optional = nodes.pop()
+        # Filtering only works for lookups that every row has to match.
+        optional = (
+            optional
+            or node.negated
+            or (node.connector == OR and len(node.children) > 1)
+        )
+        for child in node.children:
+            if isinstance(child, WhereNode):
+                nodes.append((child, optional))
+            elif (
+                isinstance(child, (RangeBucketFieldLookup, PrefixSearchFieldStartsWith))
+                and child.partial
+            ):
+                model = child.lhs.target.model
+                if (
+                    optional
+                    or not issubclass(query.model, model)
+                    or child.lhs.alias != model._meta.db_table
+                ):
+                    raise FieldError(
+                        "RangeBucketField lookups whose range doesn't start and end "
+                        "on the edges of buckets, and PrefixSearchField lookups of "
+                        "prefixes longer than max_prefix_length, can't be negated, "
+                        "combined with OR or span relations"
+                    )
+                lookups.append(child)
+    return lookups
+
+
+class EncryptedModelIterable(ModelIterable):
+    """Yield model instances, loading their deferred EncryptedFields in batches.
+
+    Instances are added to a DeferredFieldsBatch, so the first read of a deferred
+    EncryptedField loads it for all of them at once, or up front with
+    prefetch_encrypted().
+
+    RangeBucketField lookups that the database can only narrow down to buckets, and
+    PrefixSearchField lookups of prefixes longer than those stored, are completed
+    here, see post_filtered().
+
+    With read-repair enabled, values are loaded encrypted and decrypted once their
+    instance is built, so those using an old key are queued with it.
+    """
+
+    def __iter__(self):
+        if not getattr(self.queryset.query, "post_filtering", False):
+            lookups = _post_filtered_lookups(self.queryset.query)
+            if lookups:
+                yield from self.post_filtered(lookups)
+                return
+        prefetch = self.queryset._prefetch_encrypted
+        instances = self.instances()
+        first = next(instances, None)
+        if first is None:
+            return
+        instances = chain([first], instances)
+        if not _has_deferred_encrypted_fields(first):
+            yield from instances
+            return
+        # iterator() fetches rows chunk_size at a time, so batch them the same way
+        # rather than keep track of every instance of the iteration. Otherwise all
+        # the rows are fetched anyway, so they make one batch.
+        batch_size = self.chunk_size if self.chunked_fetch else None
+        while True:
+            chunk = list(islice(instances, batch_size))
+            if not chunk:
+                return
+            batch = DeferredFieldsBatch()
+            for obj in chunk:
+                batch.add(obj)
+            if prefetch is not None:
+                self.prefetch(chunk, prefetch)
+            yield from chunk
+
+    def instances(self):
+        if repair.enabled:
+            return map(_decrypt_loaded, self.deferred_instances())
+        return super().__iter__()
+
+    def deferred_instances(self):
+        """Yield the instances with their EncryptedField values as EncryptedValues."""
+        annotation_names = list(self.queryset.query.annotation_select)
+        rows = ModelIterable.__iter__(self)
+        while True:
+            # Only defer decryption while building each instance, never while the
+            # caller is handling it.
+            with decryption_deferred():
+                try:
+                    obj = next(rows)
+                except StopIteration:
+                    return
+            for name in annotation_names:
+                # Annotations are plain attributes, with no descriptor to decrypt them.
+                value = obj.__dict__.get(name)
+                if isinstance(value, EncryptedValue):
+                    setattr(obj, name, value.decrypt())
+            yield obj
+
+    def post_filtered(self, lookups):
+        """Return the instances matching the lookups, fetching the rows the database
+        narrowed them down to (eg the buckets covering their ranges). Any slice of
+        the queryset is taken after filtering."""
+        queryset = self.queryset._chain()
+        query = queryset.query
+        low_mark, high_mark = query.low_mark, query.high_mark
+        query.clear_limits()
+        query.post_filtering = True
+        instances = type(self)(queryset, self.chunked_fetch, self.chunk_size)
+        matching = (
+            obj for obj in instances if all(lookup.matches(obj) for lookup in lookups)
+        )
+        return islice(matching, low_mark, high_mark)
+
+    def prefetch(self, instances, names):
+        if names is None:
+            return
+        fields = [instances[0]._meta.get_field(name) for name in names] or instances[
+            0
+        ]._meta.concrete_fields
+        attnames = []
+        for field in fields:
+            if isinstance(field, SearchField):
+                field = field.model._meta.get_field(field.encrypted_field_name)
+            if (
+                isinstance(field, EncryptedFieldMixin)
+                and field.attname not in instances[0].__dict__
+                and field.attname not in attnames
+            ):
+                attnames.append(field.attname)
+        load_deferred_fields(instances, attnames)
+
+
+class DeferredDecryptionModelIterable(EncryptedModelIterable):
+    """Yield model instances whose EncryptedFields are decrypted when first read."""
+
+    def instances(self):
+        return self.deferred_instances()
+
+
+def _decrypt_loaded(obj):
+    """Decrypt the EncryptedValues of obj via their descriptors, which queue those
+    using an old key for read-repair."""
+    for field in obj._meta.concrete_fields:
+        if isinstance(field, EncryptedFieldMixin) and isinstance(
+            obj.__dict__.get(field.attname), EncryptedValue
+        ):
+            getattr(obj, field.attname)
+    return obj
+
+
+def _init_decryption_worker():
+    if not apps.ready:  # eg when worker processes are spawned rather than forked
+        django.setup()
+    get_keyring()
+
+
+_worker_fields = {}
+
+
+def _decrypt_values(values):
+    """Decrypt a list of (model label, field name, cypher_text) in a worker process."""
+    decrypted = []
+    for model_label, field_name, cypher_text in values:
+        field = _worker_fields.get((model_label, field_name))
+        if field is None:
+            field = apps.get_model(model_label)._meta.get_field(field_name)
+            _worker_fields[model_label, field_name] = field
+        decrypted.append(EncryptedValue(field, cypher_text).decrypt())
+    return decrypted
+
+
+def _encrypted_attributes(obj):
+    """Yield (instance, attname, EncryptedValue) for obj and the related instances
+    loaded with it by select_related()."""
+    for attname, value in list(obj.__dict__.items()):
+        if isinstance(value, EncryptedValue):
+            yield obj, attname, value
+    for related in obj._state.fields_cache.values():
+        if isinstance(related, models.Model):
+            yield from _encrypted_attributes(related)
+
+
+def _values_to_decrypt(chunk):
+    """Return the (instance, attname, EncryptedValue) of the instances of chunk and
+    the (model label, field name, cypher_text) to decrypt them with
+    _decrypt_values()."""
+    attributes = [
+        attribute for obj in chunk for attribute in _encrypted_attributes(obj)
+    ]
+    # Some drivers (eg psycopg2) load binary columns as memoryviews, which can't be
+    # pickled to send to worker processes.
+    values = [
+        (value.field.model._meta.label, value.field.name, bytes(value.cypher_text))
+        for _, _, value in attributes
+    ]
+    return attributes, values
+
+
+def _set_decrypted(attributes, values):
+    for (obj, attname, encrypted), value in zip(attributes, values):
+        if repair.enabled and not encrypted.uses_primary_key():
+            repair.add(encrypted.field, obj)
+        obj.__dict__[attname] = value
+
+
+def _prepare_for_save(objs, fields, connection, add, workers=None):
+    """Prepare the values of the EncryptedFields and SearchFields of objs for saving,
+    encrypting and hashing them a field at a time.
+
+    Return a dict of {(id(obj), attname): value} for prepared_for_save().
+    """
+    prepared = {}
+    for field in fields:
+        if isinstance(field, SearchField):
+            values = field.hash_many([field.pre_save(obj, add) for obj in objs])
+        elif add:
+            values = [field.pre_save(obj, add) for obj in objs]
+            values = field.get_db_prep_save_many(values, connection, workers)
+        else:
+            values = []
+            for obj in objs:
+                value = obj.__dict__.get(field.attname)
+                if not isinstance(value, EncryptedValue):  # ie it has been read
+                    value = getattr(obj, field.attname)
+                values.append(value)
+            values = field.get_db_prep_save_many(values, connection, workers)
+        for obj, value in zip(objs, values):
+            prepared[id(obj), field.attname] = value
+    return prepared
+
+
+def _batched_fields(fields):
+    return [f for f in fields if isinstance(f, (EncryptedFieldMixin, SearchField))]
+
+
+class _Descending:
+    """Reverses the order of a value in a sort key."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def _sort_key(values, descending):
+    """Return the sort key of a row's values: None first (last when descending)."""
+    key = []
+    for value, reverse in zip(values, descending):
+        value = (value is not None, value)
+        key.append(_Descending(value) if reverse else value)
+    return tuple(key)
+
+
+class _SortedRun:
+    """A sorted run of (sort key, pk) records spilled to a temporary file.
+
+    The records are written in blocks, so they can be read back a block at a time,
+    encrypted with a throwaway key: decrypted values never reach the disk.
+    """
+
+    _header = struct.Struct(">I12s16s")
+
+    def __init__(self, records, block_size):
+        self.backend = get_backend()
+        self.key = os.urandom(32)
+        self.file = tempfile.TemporaryFile()
+        for i in range(0, len(records), block_size):
+            data = pickle.dumps(records[i : i + block_size], pickle.HIGHEST_PROTOCOL)
+            nonce = os.urandom(12)
+            cypher_text, tag = self.backend.encrypt(self.key, nonce, data)
+            self.file.write(self._header.pack(len(cypher_text), nonce, tag))
+            self.file.write(cypher_text)
+        self.file.seek(0)
+
+    def __iter__(self):
+        try:
+            while True:
+                header = self.file.read(self._header.size)
+                if not header:
+                    return
+                size, nonce, tag = self._header.unpack(header)
+                data = self.backend.decrypt(self.key, nonce, self.file.read(size), tag)
+                yield from pickle.loads(data)
+        finally:
+            self.close()
+
+    def close(self):
+        self.file.close()
+
+
+class EncryptedQuerySet(models.QuerySet):
+    """A QuerySet with helpers for models that have EncryptedFields."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._iterable_class = EncryptedModelIterable
+        self._prefetch_encrypted = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._prefetch_encrypted = self._prefetch_encrypted
+        return clone
+
+    def prefetch_encrypted(self, *fields):
+        """Load the given EncryptedFields, if deferred by only() or defer(), for all
+        the instances in one extra query (per chunk of iterator()), rather than when
+        first read. The name of a SearchField stands for its EncryptedField. By
+        default all deferred EncryptedFields are loaded.
+
+        Call with None to clear the list.
+        """
+        if self._fields is not None:
+            raise TypeError(
+                "Cannot call prefetch_encrypted() after .values() or .values_list()"
+            )
+        clone = self._chain()
+        if fields == (None,):
+            clone._prefetch_encrypted = None
+        else:
+            clone._prefetch_encrypted = fields
+        return clone
+
+    def defer_decryption(self):
+        """Keep EncryptedField values encrypted until they are read.
+
+        Useful for wide models where only a few fields are used, eg in list views.
+        Values that are never read are saved back to the database unchanged.
+        """
+        if self._fields is not None:
+            raise TypeError(
+                "Cannot call defer_decryption() after .values() or .values_list()"
+            )
+        clone = self._chain()
+        clone._iterable_class = DeferredDecryptionModelIterable
+        return clone
+
+    def bulk_create(self, objs, *args, encryption_workers=None, **kwargs):
+        """bulk_create(), encrypting and hashing the values of each field in one batch,
+        optionally split between encryption_workers threads."""
+        objs = list(objs)
+        fields = _batched_fields(self.model._meta.concrete_fields)
+        if not objs or not fields:
+            return super().bulk_create(objs, *args, **kwargs)
+        connection = connections[self._db or router.db_for_write(self.model)]
+        prepared = _prepare_for_save(
+            objs, fields, connection, add=True, workers=encryption_workers
+        )
+        with prepared_for_save(prepared):
+            return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, batch_size=None, encryption_workers=None):
+        """bulk_update(), encrypting and hashing the values of each field in one batch,
+        optionally split between encryption_workers threads. Values of EncryptedFields
+        that have not been read since loading are saved as they are."""
+        objs = tuple(objs)
+        model_fields = [self.model._meta.get_field(name) for name in fields]
+        batched_fields = _batched_fields(model_fields)
+        if not objs or not batched_fields:
+            return super().bulk_update(objs, fields, batch_size=batch_size)
+        if batch_size is not None and batch_size < 0:
+            raise ValueError("Batch size must be a positive integer.")
+        if any(obj.pk is None for obj in objs):
+            raise ValueError("All bulk_update() objects must have a primary key set.")
+        if any(not f.concrete or f.many_to_many for f in model_fields):
+            raise ValueError("bulk_update() can only be used with concrete fields.")
+        if any(f.primary_key for f in model_fields):
+            raise ValueError("bulk_update() cannot be used with primary key fields.")
+
+        connection = connections[self.db]
+        prepared = _prepare_for_save(
+            objs, batched_fields, connection, add=False, workers=encryption_workers
+        )
+        # PK is used twice in the resulting update query, once in the filter
+        # and once in the WHEN. Each field will also have one CAST.
+        max_batch_size = connection.ops.bulk_batch_size(
+            ["pk", "pk"] + model_fields, objs
+        )
+        batch_size = min(batch_size, max_batch_size) if batch_size else max_batch_size
+        requires_casting = getattr(
+            connection.features, "requires_casted_case_in_updates", False
+        )
+        rows_updated = 0
+        with transaction.atomic(using=self.db, savepoint=False):
+            for i in range(0, len(objs), batch_size):
+                batch_objs = objs[i : i + batch_size]
+                update_kwargs = {}
+                for field in model_fields:
+                    when_statements = []
+                    for obj in batch_objs:
+                        if field in batched_fields:
+                            attr = prepared[id(obj), field.attname]
+                        else:
+                            attr = getattr(obj, field.attname)
+                        if not isinstance(attr, models.Expression):
+                            attr = models.Value(attr, output_field=field)
+                        when_statements.append(models.When(pk=obj.pk, then=attr))
+                    case_statement = models.Case(*when_statements, output_field=field)
+                    if requires_casting:
+                        case_statement = Cast(case_statement, output_field=field)
+                    update_kwargs[field.attname] = case_statement
+                rows_updated += self.filter(
+                    pk__in=[obj.pk for obj in batch_objs]
+                ).update(**update_kwargs)
+        return rows_updated
+
+    def bulk_get(self, values, field_name=None):
+        """Return a dict mapping each of values to the instance whose SearchField
+        field_name matches it, fetched in as few queries as possible.
+
+        field_name may be omitted if the model has only one SearchField. Values are
+        hashed once each, and values with no match are left out of the result. If
+        several rows match a value, the one with the lowest pk is used.
+        """
+        if not self.query.can_filter():
+            raise TypeError("Cannot use 'limit' or 'offset' with bulk_get().")
+        if field_name is None:
+            search_fields = [
+                f
+                for f in self.model._meta.concrete_fields
+                if isinstance(f, SearchField)
+            ]
+            if len(search_fields) != 1:
+                raise ValueError(
+                    f"bulk_get() requires a field_name, as {self.model._meta.label} "
+                    f"has {len(search_fields)} SearchFields."
+                )
+            field = search_fields[0]
+        else:
+            field = self.model._meta.get_field(field_name)
+            if not isinstance(field, SearchField):
+                raise ValueError(
+                    f"bulk_get()'s field_name '{field_name}' is not a SearchField."
+                )
+
+        values = [value for value in dict.fromkeys(values) if value is not None]
+        values_by_hash = {}
+        for value, hashed in zip(values, field.hash_many(values)):
+            values_by_hash.setdefault(hashed, []).append(value)
+        if not values_by_hash:
+            return {}
+
+        hashes = list(values_by_hash)
+        batch_size = connections[self.db].features.max_query_params
+        if batch_size and len(hashes) > batch_size:
+            batches = [
+                hashes[i : i + batch_size] for i in range(0, len(hashes), batch_size)
+            ]
+        else:
+            batches = [hashes]
+        result = {}
+        for batch in batches:
+            lookup = {field.name + "__in": batch}
+            for obj in self.filter(**lookup).order_by("-pk"):
+                # The stored hash, before the descriptor swaps in the decrypted value.
+                for value in values_by_hash[obj.__dict__[field.attname]]:
+                    result[value] = obj
+        return result
+
+    def parallel_iterator(self, workers=None, chunk_size=2000):
+        """Like iterator(), but decrypt the rows in a pool of worker processes.
+
+        Rows are fetched chunk_size at a time and each chunk is decrypted by one of
+        the workers (os.cpu_count() by default). Instances are yielded in the order
+        of the queryset, with at most two chunks per worker in memory at a time.
+        """
+        workers = workers or os.cpu_count() or 1
+        rows = self.defer_decryption().iterator(chunk_size=chunk_size)
+        pending = deque()
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_decryption_worker
+        ) as executor:
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if chunk:
+                    attributes, values = _values_to_decrypt(chunk)
+                    pending.append(
+                        (chunk, attributes, executor.submit(_decrypt_values, values))
+                    )
+                if pending and (not chunk or len(pending) >= 2 * workers):
+                    done_chunk, done_attributes, future = pending.popleft()
+                    _set_decrypted(done_attributes, future.result())
+                    yield from done_chunk
+                elif not chunk:
+                    return
+
+    async def parallel_aiterator(self, workers=None, chunk_size=2000, processes=False):
+        """An asynchronous parallel_iterator(), for async views: `async for obj in
+        queryset.parallel_aiterator()`.
+
+        Rows are fetched chunk_size at a time with sync_to_async(), and each chunk
+        is decrypted in a pool of threads (or of worker processes, with
+        processes=True) of workers (os.cpu_count() by default), so decryption never
+        runs on the event loop. Instances are yielded in the order of the queryset.
+        Chunks are only fetched as instances are consumed, with at most two chunks
+        per worker in memory at a time, so a slow consumer holds back the fetching.
+        """
+        from asgiref.sync import sync_to_async
+
+        workers = workers or os.cpu_count() or 1
+        rows = self.defer_decryption().iterator(chunk_size=chunk_size)
+        # The cursor is only used from the thread of the connection.
+        fetch = sync_to_async(
+            lambda: list(islice(rows, chunk_size)), thread_sensitive=True
+        )
+        if processes:
+            executor = ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_decryption_worker
+            )
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers)
+        loop = asyncio.get_event_loop()
+        pending = deque()
+        try:
+            while True:
+                chunk = await fetch()
+                if chunk:
+                    attributes, values = _values_to_decrypt(chunk)
+                    future = loop.run_in_executor(executor, _decrypt_values, values)
+                    pending.append((chunk, attributes, future))
+                if pending and (not chunk or len(pending) >= 2 * workers):
+                    done_chunk, done_attributes, future = pending.popleft()
+                    _set_decrypted(done_attributes, await future)
+                    for obj in done_chunk:
+                        yield obj
+                elif not chunk:
+                    return
+        finally:
+            executor.shutdown(wait=False)
+            await sync_to_async(rows.close, thread_sensitive=True)()
+
+    def sorted_iterator(
+        self, *field_names, limit=None, chunk_size=2000, run_size=100000
+    ):
+        """Yield the instances ordered by the decrypted values of field_names, as
+        order_by() can't sort by encrypted values. Prefix a name with '-' for
+        descending order; the name of a SearchField stands for its EncryptedField.
+        Nulls come first (last when descending) and ties are in pk order.
+
+        Memory is bounded whatever the size of the queryset: the values are fetched
+        chunk_size rows at a time and sorted in runs of run_size (value, pk) records,
+        spilled to temporary files (encrypted, with a throwaway key) and merged.
+        With a limit only the first limit rows are kept, in a heap, eg for the first
+        page of a "newest first" list. The instances are then fetched chunk_size at
+        a time, in order.
+        """
+        if not field_names:
+            raise TypeError("sorted_iterator() requires at least one field name")
+        if not self.query.can_filter():
+            raise TypeError("Cannot use 'limit' or 'offset' with sorted_iterator().")
+        names, descending = [], []
+        for name in field_names:
+            descending.append(name.startswith("-"))
+            name = name.lstrip("-")
+            if LOOKUP_SEP not in name:
+                name = getattr(
+                    self.model._meta.get_field(name), "encrypted_field_name", name
+                )
+            names.append(name)
+        return self._sorted_iterator(names, descending, limit, chunk_size, run_size)
+
+    def _sorted_iterator(self, names, descending, limit, chunk_size, run_size):
+        pk_name = self.model._meta.pk.attname
+        rows = self.order_by().values_list(*names, pk_name).iterator(chunk_size)
+        records = ((_sort_key(row[:-1], descending), row[-1]) for row in rows)
+        if limit is not None:
+            # (key, pk) records are unique, so they sort without comparing further.
+            pks = iter([pk for _, pk in heapq.nsmallest(limit, records)])
+        else:
+            pks = (pk for _, pk in self._merge_sorted_runs(records, run_size))
+
+        queryset = self.order_by()
+        while True:
+            batch = list(islice(pks, chunk_size))
+            if not batch:
+                return
+            instances = {obj.pk: obj for obj in queryset.filter(pk__in=batch)}
+            for pk in batch:
+                if pk in instances:  # not deleted in the meantime
+                    yield instances[pk]
+
+    def _merge_sorted_runs(self, records, run_size):
+        """Return an iterator of records in order, sorting them in runs of run_size
+        and merging those spilled to temporary files."""
+        runs = []
+        try:
+            while True:
+                run = sorted(islice(records, run_size))
+                if len(run) < run_size and not runs:
+                    return iter(run)  # all in memory, no need to spill
+                if run:
+                    runs.append(_SortedRun(run, block_size=max(run_size // 100, 1)))
+                if len(run) < run_size:
+                    return heapq.merge(*runs)
+        except BaseException:
+            for run in runs:
+                run.close()
+            raise
+
+
+class EncryptedManager(models.Manager.from_queryset(EncryptedQuerySet)):
+    pass
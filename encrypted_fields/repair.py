@@ -0,0 +1,209 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections, router, transaction
+from django.dispatch import receiver
+
+__all__ = [
+    "ReadRepairQueue",
+    "enable",
+    "disable",
+    "is_enabled",
+    "flush",
+    "pending",
+    "clear",
+]
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 5.0
+DEFAULT_MAX_SIZE = 10000
+DEFAULT_BATCH_SIZE = 500
+
+
+class ReadRepairQueue:
+    """The rows with EncryptedField values read with a key other than the first in
+    FIELD_ENCRYPTION_KEYS (or saved without a key id, by early versions), to be
+    re-encrypted with it.
+
+    Rows are queued as (model, database, pk) with the attnames of their fields. A
+    background thread flushes the queue every interval seconds, or sooner once
+    batch_size rows are queued; with interval=None call flush() yourself. At most
+    max_size rows are queued, others are ignored until they are next read.
+    """
+
+    def __init__(
+        self,
+        interval=DEFAULT_INTERVAL,
+        max_size=DEFAULT_MAX_SIZE,
+        batch_size=DEFAULT_BATCH_SIZE,
+    ):
+        self.interval = interval
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._rows = {}
+        self._size = 0
+
+    def add(self, field, database, pk):
+        """Queue the value of field (an EncryptedField) in the row with pk."""
+        group = (field.model, database)
+        with self._lock:
+            rows = self._rows.setdefault(group, {})
+            attnames = rows.get(pk)
+            if attnames is None:
+                if self._size >= self.max_size:
+                    return
+                attnames = rows[pk] = set()
+                self._size += 1
+            attnames.add(field.attname)
+            if self.interval is not None:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="read-repair", daemon=True
+                    )
+                    self._thread.start()
+                if self._size >= self.batch_size:
+                    self._wake.set()
+
+    def pending(self):
+        """Return a list of the queued (model, database, pk, attnames)."""
+        with self._lock:
+            return [
+                (model, database, pk, set(attnames))
+                for (model, database), rows in self._rows.items()
+                for pk, attnames in rows.items()
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._rows = {}
+            self._size = 0
+
+    def flush(self):
+        """Re-encrypt the queued values with the first key, in a transaction and a
+        bulk_update() per batch of rows. Return the number of rows updated."""
+        with self._lock:
+            queued, self._rows, self._size = self._rows, {}, 0
+        updated = 0
+        for (model, database), rows in queued.items():
+            pks = list(rows)
+            for i in range(0, len(pks), self.batch_size):
+                batch = pks[i : i + self.batch_size]
+                attnames = set().union(*(rows[pk] for pk in batch))
+                updated += repair_rows(model, database, batch, sorted(attnames))
+        return updated
+
+    def _run(self):
+        while True:
+            interval = self.interval
+            if interval is not None:
+                self._wake.wait(interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Read-repair of EncryptedField values failed.")
+            finally:
+                # Connections are per thread, so these are this thread's own.
+                connections.close_all()
+            with self._lock:
+                if not self._rows or self.interval is None:
+                    self._thread = None
+                    return
+
+
+def repair_rows(model, database, pks, attnames):
+    """Re-encrypt the values of attnames (of EncryptedFields of model) in the rows
+    with pks that aren't using the first key, locking the rows while they are.
+    database is the one they were read from. Return the number of rows updated."""
+    from .fields import decryption_deferred, update_rotated_rows
+
+    fields = [model._meta.get_field(attname) for attname in attnames]
+    keyring = fields[0].keyring
+    hint = model(pk=pks[0])
+    hint._state.db = database
+    database = router.db_for_write(model, instance=hint)
+    manager = model._base_manager.using(database)
+    with transaction.atomic(using=database):
+        queryset = manager.select_for_update().filter(pk__in=pks)
+        with decryption_deferred():
+            rows = list(queryset.values_list("pk", *attnames))
+        rotated = []
+        for pk, *values in rows:
+            new_values = [
+                None if value is None else keyring.rotate(value.cypher_text)
+                for value in values
+            ]
+            rotated.append((pk, values, new_values))
+        return update_rotated_rows(manager, fields, rotated)
+
+
+_queue = ReadRepairQueue()
+
+
+def add(field, instance):
+    """Queue the value of field in the (saved) model instance."""
+    if instance.pk is not None and instance._state.db is not None:
+        _queue.add(field, instance._state.db, instance.pk)
+
+
+# Checked before any value is checked, so disabled read-repair costs a single lookup.
+enabled = False
+
+
+def _set_enabled(value):
+    global enabled
+    enabled = value
+
+
+def enable():
+    """Start queueing values read with an old key, whatever
+    settings.FIELD_ENCRYPTION_READ_REPAIR says."""
+    _set_enabled(True)
+
+
+def disable():
+    """Stop queueing values. Those already queued are still flushed."""
+    _set_enabled(False)
+
+
+def is_enabled():
+    return enabled
+
+
+def flush():
+    """See ReadRepairQueue.flush()."""
+    return _queue.flush()
+
+
+def pending():
+    """See ReadRepairQueue.pending()."""
+    return _queue.pending()
+
+
+def clear():
+    """Forget the queued rows."""
+    _queue.clear()
+
+
+def get_interval():
+    return getattr(settings, "FIELD_ENCRYPTION_READ_REPAIR_INTERVAL", DEFAULT_INTERVAL)
+
+
+if settings.configured:
+    _queue.interval = get_interval()
+    if getattr(settings, "FIELD_ENCRYPTION_READ_REPAIR", False):
+        _set_enabled(True)
+
+
+@receiver(setting_changed)
+def update_enabled(*, setting, value, **kwargs):
+    if setting == "FIELD_ENCRYPTION_READ_REPAIR":
+        _set_enabled(bool(value))
+    elif setting == "FIELD_ENCRYPTION_READ_REPAIR_INTERVAL":
+        _queue.interval = get_interval()
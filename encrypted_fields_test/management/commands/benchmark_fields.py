@@ -0,0 +1,317 @@
+import datetime
+import hashlib
+import json
+import platform
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from encrypted_fields import fields
+from encrypted_fields import encryption
+from encrypted_fields.encryption import KeyRing, get_key_id
+from encrypted_fields.fields import get_search_hash, is_hashed_already
+
+# Payload sizes (in characters) for string based fields. Other fields have one,
+# natural, size.
+STRING_SIZES = {
+    "EncryptedTextField": [16, 1024, 65536],
+    "EncryptedCharField": [16, 255, 1024],
+    "EncryptedEmailField": [16, 254],
+}
+FIXED_VALUES = {
+    "EncryptedIntegerField": 2147483647,
+    "EncryptedPositiveIntegerField": 2147483647,
+    "EncryptedPositiveSmallIntegerField": 32767,
+    "EncryptedSmallIntegerField": -32768,
+    "EncryptedBigIntegerField": 9223372036854775807,
+    "EncryptedDateField": datetime.date(2020, 9, 10),
+}
+KEY_COUNTS = [1, 3, 10]
+HASH_ALGORITHMS = ["sha256", "hmac-sha256", "blake2b"]
+HASH_KEY = "f164ec6bd6fbc4aef5647abc15199da0"
+
+
+def make_keys(count):
+    return [hashlib.sha256(str(i).encode()).hexdigest() for i in range(count)]
+
+
+def legacy_encrypt(key, data):
+    """Encrypt data using the original, headerless, 'nonce+tag+cypher_text' layout."""
+    from Crypto.Cipher import AES
+
+    cipher = AES.new(bytes.fromhex(key), AES.MODE_GCM)
+    cypher_text, tag = cipher.encrypt_and_digest(data)
+    return cipher.nonce + tag + cypher_text
+
+
+def v1_encrypt(key, data):
+    """Encrypt data using the v1 layout, with its 16 byte nonce."""
+    from Crypto.Cipher import AES
+
+    key = bytes.fromhex(key)
+    cipher = AES.new(key, AES.MODE_GCM)
+    cypher_text, tag = cipher.encrypt_and_digest(data)
+    header = encryption.FORMAT_MAGIC + bytes([encryption.FORMAT_V1])
+    return header + cipher.nonce + get_key_id(key) + tag + cypher_text
+
+
+def string_value(class_name, size):
+    if class_name == "EncryptedEmailField":
+        return "a" * (size - len("@example.com")) + "@example.com"
+    return "a" * size
+
+
+def field_values(class_name):
+    """Yield (size label, value) pairs to benchmark class_name with."""
+    if class_name in STRING_SIZES:
+        for size in STRING_SIZES[class_name]:
+            yield str(size), string_value(class_name, size)
+    elif class_name == "EncryptedDateTimeField":
+        value = datetime.datetime(2020, 9, 10, 12, 30, 15, 123456)
+        if settings.USE_TZ:
+            value = timezone.make_aware(value, timezone.utc)
+        yield "-", value
+    else:
+        yield "-", FIXED_VALUES[class_name]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the encryption, decryption and hashing done by encrypted_fields, "
+        "optionally saving the results as a baseline and/or comparing them with "
+        "a previously saved baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--filter",
+            action="append",
+            default=[],
+            help="Only run benchmarks whose name contains this text (repeatable).",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Number of timing runs per benchmark, the fastest is kept "
+            "(default: 5).",
+        )
+        parser.add_argument(
+            "--min-time",
+            type=float,
+            default=0.1,
+            help="Minimum duration in seconds of each timing run (default: 0.1).",
+        )
+        parser.add_argument("--save", metavar="PATH", help="Save results as JSON.")
+        parser.add_argument(
+            "--compare", metavar="PATH", help="Compare results with a saved baseline."
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=10,
+            help="Percentage slowdown reported as a regression (default: 10).",
+        )
+        parser.add_argument(
+            "--fail-on-regression",
+            action="store_true",
+            help="Exit with an error if any benchmark regressed.",
+        )
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1.")
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as f:
+                    baseline = json.load(f)["results"]
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Cannot read baseline '{options['compare']}': {e}")
+
+        results = {}
+        for name, func in self.get_benchmarks():
+            if options["filter"] and not any(f in name for f in options["filter"]):
+                continue
+            results[name] = self.time(func, options["repeat"], options["min_time"])
+            if options["verbosity"] >= 2:
+                self.stdout.write(f"{name}: {format_time(results[name])}")
+        if not results:
+            raise CommandError("No benchmarks match the given --filter.")
+
+        regressions = self.report(results, baseline, options["threshold"])
+        if options["save"]:
+            with open(options["save"], "w") as f:
+                json.dump(
+                    {"environment": environment(), "results": results}, f, indent=2
+                )
+            self.stdout.write(f"Results saved to '{options['save']}'.")
+        if regressions and options["fail_on_regression"]:
+            raise CommandError(f"{regressions} benchmark(s) regressed.")
+
+    def time(self, func, repeat, min_time):
+        """Return the fastest time per call of func, in seconds."""
+
+        def run(number):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            return time.perf_counter() - start
+
+        # Calibrate the number of calls per run so that it takes at least min_time.
+        number = 1
+        elapsed = run(number)
+        while elapsed < min_time:
+            number = max(number * 2, int(number * min_time * 1.1 / max(elapsed, 1e-9)))
+            elapsed = run(number)
+        best = min([elapsed] + [run(number) for _ in range(repeat - 1)])
+        return best / number
+
+    def report(self, results, baseline, threshold):
+        """Print the results, compared with baseline if given, returning the number
+        of regressions."""
+        width = max(len(name) for name in results)
+        if baseline is None:
+            self.stdout.write(f"{'benchmark':<{width}}  {'time':>10}")
+            for name, value in results.items():
+                self.stdout.write(f"{name:<{width}}  {format_time(value):>10}")
+            return 0
+
+        self.stdout.write(
+            f"{'benchmark':<{width}}  {'baseline':>10}  {'time':>10}  {'change':>8}"
+        )
+        regressions = 0
+        for name, value in results.items():
+            old = baseline.get(name)
+            if old is None:
+                self.stdout.write(
+                    f"{name:<{width}}  {'-':>10}  {format_time(value):>10}  {'new':>8}"
+                )
+                continue
+            change = (value - old) / old * 100
+            line = (
+                f"{name:<{width}}  {format_time(old):>10}  {format_time(value):>10}  "
+                f"{change:>+7.1f}%"
+            )
+            if change > threshold:
+                regressions += 1
+                line = self.style.ERROR(line + "  REGRESSION")
+            elif change < -threshold:
+                line = self.style.SUCCESS(line + "  faster")
+            self.stdout.write(line)
+        missing = sum(1 for name in baseline if name not in results)
+        if missing:
+            self.stdout.write(f"{missing} benchmark(s) in the baseline were not run.")
+        summary = f"{regressions} regression(s) over {threshold:g}%."
+        self.stdout.write(
+            self.style.ERROR(summary) if regressions else self.style.SUCCESS(summary)
+        )
+        return regressions
+
+    def get_benchmarks(self):
+        """Yield (name, function) pairs. The functions are built lazily, so
+        settings overridden while building one do not leak into the others."""
+        yield from self.field_benchmarks()
+        yield from self.key_benchmarks()
+        yield from self.search_benchmarks()
+
+    def field_benchmarks(self):
+        """encrypt and decrypt every EncryptedField class, with a single key."""
+        keys = make_keys(1)
+        for class_name in fields.__all__:
+            field_class = getattr(fields, class_name)
+            if field_class is fields.EncryptedFieldMixin or not issubclass(
+                field_class, fields.EncryptedFieldMixin
+            ):
+                continue
+            for size, value in field_values(class_name):
+                with override_settings(FIELD_ENCRYPTION_KEYS=keys):
+                    field = field_class()
+                    field.keys  # cache the keys while the setting is overridden
+                    cypher_text = bytes(field.get_db_prep_save(value, connection))
+                yield (
+                    f"encrypt {class_name} size={size}",
+                    lambda field=field, value=value: field.get_db_prep_save(
+                        value, connection
+                    ),
+                )
+                yield (
+                    f"decrypt {class_name} size={size}",
+                    lambda field=field, value=cypher_text: field.from_db_value(
+                        value, None, connection
+                    ),
+                )
+
+    def key_benchmarks(self):
+        """Decrypt with 1, 3 or 10 keys, the value matching the first or last one,
+        in the current (v3), v1 and legacy (headerless) formats."""
+        plaintext = string_value("EncryptedCharField", 16)
+        for count in KEY_COUNTS:
+            keys = make_keys(count)
+            with override_settings(FIELD_ENCRYPTION_KEYS=keys):
+                field = fields.EncryptedCharField()
+                field.keys
+            for hit in ["first", "last"]:
+                if count == 1 and hit == "last":
+                    continue
+                key = keys[0] if hit == "first" else keys[-1]
+                values = {
+                    "v3": KeyRing([key]).encrypt(plaintext.encode()),
+                    "v1": v1_encrypt(key, plaintext.encode()),
+                    "legacy": legacy_encrypt(key, plaintext.encode()),
+                }
+                for format_name, cypher_text in values.items():
+                    yield (
+                        f"decrypt keys={count} hit={hit} format={format_name}",
+                        lambda field=field, value=cypher_text: field.from_db_value(
+                            value, None, connection
+                        ),
+                    )
+
+    def search_benchmarks(self):
+        """SearchField hashing, with and without the lookup cache."""
+        for algorithm in HASH_ALGORITHMS:
+            field = fields.SearchField(
+                hash_key=HASH_KEY, encrypted_field_name="value", algorithm=algorithm
+            )
+            for size in [16, 1024]:
+                value = "a" * size
+                yield (
+                    f"hash {algorithm} size={size}",
+                    lambda value=value, algorithm=algorithm: get_search_hash(
+                        HASH_KEY, value, algorithm
+                    ),
+                )
+                yield (
+                    f"get_prep_value {algorithm} size={size}",
+                    lambda field=field, value=value: field.get_prep_value(value),
+                )
+        hashed = get_search_hash(HASH_KEY, "a" * 16)
+        yield "is_hashed_already hashed", lambda: is_hashed_already(hashed)
+        yield "is_hashed_already plain", lambda: is_hashed_already("a" * 66)
+
+
+def format_time(seconds):
+    for unit, scale in [("s", 1), ("ms", 1e-3), ("us", 1e-6)]:
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+def environment():
+    try:
+        from Crypto import __version__ as pycryptodome_version
+    except ImportError:
+        pycryptodome_version = None
+    return {
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "pycryptodome": pycryptodome_version,
+        "machine": platform.machine(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+import encrypted_fields.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encrypted_fields_test', '0006_rotate_keys_migration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchKeyedHash',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', encrypted_fields.fields.EncryptedCharField(max_length=25)),
+                ('search', encrypted_fields.fields.SearchField(algorithm='hmac-sha256', blank=True, db_index=True, encrypted_field_name='value', hash_key='abc123', max_length=66, null=True)),
+                ('value_2', encrypted_fields.fields.EncryptedCharField(max_length=25, null=True)),
+                ('search_2', encrypted_fields.fields.SearchField(algorithm='blake2b', blank=True, db_index=True, encrypted_field_name='value_2', hash_key='abc123', max_length=66, null=True)),
+            ],
+        ),
+    ]
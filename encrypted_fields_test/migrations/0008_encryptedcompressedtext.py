@@ -0,0 +1,20 @@
+from django.db import migrations, models
+import encrypted_fields.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encrypted_fields_test', '0007_searchkeyedhash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EncryptedCompressedText',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', encrypted_fields.fields.EncryptedTextField(compress=True, compress_threshold=64)),
+                ('value_dict', encrypted_fields.fields.EncryptedTextField(compress=True, compress_dictionary=b'{"name": "", "email": ""}', null=True)),
+            ],
+        ),
+    ]
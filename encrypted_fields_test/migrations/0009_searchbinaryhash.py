@@ -0,0 +1,24 @@
+from django.db import migrations, models
+import encrypted_fields.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encrypted_fields_test', '0008_encryptedcompressedtext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchBinaryHash',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', encrypted_fields.fields.EncryptedCharField(max_length=25, null=True)),
+                ('search', encrypted_fields.fields.SearchField(binary=True, blank=True, db_index=True, encrypted_field_name='value', hash_key='abc123', max_length=32, null=True)),
+                ('value_16', encrypted_fields.fields.EncryptedCharField(max_length=25, null=True)),
+                ('search_16', encrypted_fields.fields.SearchField(algorithm='blake2b', binary=True, blank=True, db_index=True, digest_size=16, encrypted_field_name='value_16', hash_key='abc123', max_length=16, null=True)),
+                ('value_hex', encrypted_fields.fields.EncryptedCharField(max_length=25, null=True)),
+                ('search_hex', encrypted_fields.fields.SearchField(blank=True, db_index=True, encrypted_field_name='value_hex', hash_key='abc123', max_length=66, null=True)),
+            ],
+        ),
+    ]
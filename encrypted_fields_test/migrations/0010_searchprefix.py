@@ -0,0 +1,20 @@
+from django.db import migrations, models
+import encrypted_fields.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encrypted_fields_test', '0009_searchbinaryhash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchPrefix',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', encrypted_fields.fields.EncryptedCharField(max_length=50, null=True)),
+                ('value_2', encrypted_fields.fields.EncryptedCharField(max_length=50, null=True)),
+            ],
+        ),
+    ]
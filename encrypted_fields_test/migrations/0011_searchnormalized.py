@@ -0,0 +1,22 @@
+from django.db import migrations, models
+import encrypted_fields.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encrypted_fields_test', '0010_searchprefix'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchNormalized',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', encrypted_fields.fields.EncryptedEmailField(max_length=254, null=True)),
+                ('email_search', encrypted_fields.fields.SearchField(blank=True, db_index=True, encrypted_field_name='email', hash_key='abc123', max_length=66, normalizer='email', null=True)),
+                ('name', encrypted_fields.fields.EncryptedCharField(max_length=50, null=True)),
+                ('name_search', encrypted_fields.fields.SearchField(binary=True, blank=True, db_index=True, encrypted_field_name='name', hash_key='abc123', max_length=32, normalizer=['nfkc', 'strip', 'casefold'], null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+import datetime
+from django.db import migrations, models
+import encrypted_fields.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encrypted_fields_test', '0011_searchnormalized'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchRange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('age', encrypted_fields.fields.EncryptedPositiveSmallIntegerField(null=True)),
+                ('age_bucket', encrypted_fields.fields.RangeBucketField(blank=True, bucket_size=10, db_index=True, encrypted_field_name='age', hash_key='abc123', max_length=16, max_value=119, min_value=0, null=True)),
+                ('born', encrypted_fields.fields.EncryptedDateField(null=True)),
+                ('born_bucket', encrypted_fields.fields.RangeBucketField(blank=True, bucket_size='month', db_index=True, encrypted_field_name='born', hash_key='abc123', max_length=16, max_value=datetime.date(2099, 12, 31), min_value=datetime.date(1900, 1, 1), null=True)),
+                ('created', encrypted_fields.fields.EncryptedDateTimeField(null=True)),
+                ('created_bucket', encrypted_fields.fields.RangeBucketField(blank=True, bucket_size='day', db_index=True, encrypted_field_name='created', hash_key='abc123', max_length=16, max_value=datetime.date(2029, 12, 31), min_value=datetime.date(2020, 1, 1), null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+import encrypted_fields.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encrypted_fields_test', '0012_searchrange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EncryptedEnvelope',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', encrypted_fields.fields.EncryptedTextField(compress=True, compress_threshold=64, envelope=True)),
+                ('number', encrypted_fields.fields.EncryptedIntegerField(envelope=True, null=True)),
+                ('search', encrypted_fields.fields.SearchField(blank=True, db_index=True, encrypted_field_name='number', hash_key='abc123', max_length=66, null=True)),
+            ],
+        ),
+    ]
@@ -5,6 +5,7 @@ from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.urls import reverse
 from encrypted_fields import fields
+from encrypted_fields.query import EncryptedManager
 
 
 class EncryptedText(models.Model):
@@ -31,10 +32,27 @@ class EncryptedDateTime(models.Model):
     value = fields.EncryptedDateTimeField()
 
 
+class EncryptedCompressedText(models.Model):
+    value = fields.EncryptedTextField(compress=True, compress_threshold=64)
+    value_dict = fields.EncryptedTextField(
+        null=True, compress=True, compress_dictionary='{"name": "", "email": ""}'
+    )
+
+
 class EncryptedNullable(models.Model):
     value = fields.EncryptedIntegerField(null=True)
 
 
+class EncryptedEnvelope(models.Model):
+    value = fields.EncryptedTextField(
+        envelope=True, compress=True, compress_threshold=64
+    )
+    number = fields.EncryptedIntegerField(envelope=True, null=True)
+    search = fields.SearchField(hash_key="abc123", encrypted_field_name="number")
+
+    objects = EncryptedManager()
+
+
 class SearchText(models.Model):
     value = fields.EncryptedTextField()
     search = fields.SearchField(hash_key="abc123", encrypted_field_name="value")
@@ -85,6 +103,99 @@ class SearchDateTime(models.Model):
     search = fields.SearchField(hash_key="abc123", encrypted_field_name="value")
 
 
+class SearchKeyedHash(models.Model):
+    value = fields.EncryptedCharField(max_length=25)
+    search = fields.SearchField(
+        hash_key="abc123", encrypted_field_name="value", algorithm="hmac-sha256"
+    )
+    value_2 = fields.EncryptedCharField(max_length=25, null=True)
+    search_2 = fields.SearchField(
+        hash_key="abc123", encrypted_field_name="value_2", algorithm="blake2b"
+    )
+
+    objects = EncryptedManager()
+
+
+class SearchPrefix(models.Model):
+    value = fields.EncryptedCharField(max_length=50, null=True)
+    prefix = fields.PrefixSearchField(
+        hash_key="abc123", encrypted_field_name="value", max_prefix_length=5
+    )
+    value_2 = fields.EncryptedCharField(max_length=50, null=True)
+    prefix_2 = fields.PrefixSearchField(
+        hash_key="abc123",
+        encrypted_field_name="value_2",
+        min_prefix_length=2,
+        case_sensitive=True,
+    )
+
+    objects = EncryptedManager()
+
+
+class SearchBinaryHash(models.Model):
+    value = fields.EncryptedCharField(max_length=25, null=True)
+    search = fields.SearchField(
+        hash_key="abc123", encrypted_field_name="value", binary=True
+    )
+    value_16 = fields.EncryptedCharField(max_length=25, null=True)
+    search_16 = fields.SearchField(
+        hash_key="abc123",
+        encrypted_field_name="value_16",
+        algorithm="blake2b",
+        binary=True,
+        digest_size=16,
+    )
+    value_hex = fields.EncryptedCharField(max_length=25, null=True)
+    search_hex = fields.SearchField(hash_key="abc123", encrypted_field_name="value_hex")
+
+    objects = EncryptedManager()
+
+
+class SearchNormalized(models.Model):
+    email = fields.EncryptedEmailField(null=True)
+    email_search = fields.SearchField(
+        hash_key="abc123", encrypted_field_name="email", normalizer="email"
+    )
+    name = fields.EncryptedCharField(max_length=50, null=True)
+    name_search = fields.SearchField(
+        hash_key="abc123",
+        encrypted_field_name="name",
+        binary=True,
+        normalizer=["nfkc", "strip", "casefold"],
+    )
+
+    objects = EncryptedManager()
+
+
+class SearchRange(models.Model):
+    age = fields.EncryptedPositiveSmallIntegerField(null=True)
+    age_bucket = fields.RangeBucketField(
+        hash_key="abc123",
+        encrypted_field_name="age",
+        bucket_size=10,
+        min_value=0,
+        max_value=119,
+    )
+    born = fields.EncryptedDateField(null=True)
+    born_bucket = fields.RangeBucketField(
+        hash_key="abc123",
+        encrypted_field_name="born",
+        bucket_size="month",
+        min_value=datetime.date(1900, 1, 1),
+        max_value=datetime.date(2099, 12, 31),
+    )
+    created = fields.EncryptedDateTimeField(null=True)
+    created_bucket = fields.RangeBucketField(
+        hash_key="abc123",
+        encrypted_field_name="created",
+        bucket_size="day",
+        min_value=datetime.date(2020, 1, 1),
+        max_value=datetime.date(2029, 12, 31),
+    )
+
+    objects = EncryptedManager()
+
+
 class SearchCharWithDefault(models.Model):
     value = fields.EncryptedCharField(max_length=25, default="foo")
     search = fields.SearchField(hash_key="abc123", encrypted_field_name="value")
@@ -153,6 +264,8 @@ class DemoModel(models.Model):
     created_at = fields.EncryptedDateTimeField(auto_now_add=True)
     updated_at = fields.EncryptedDateTimeField(auto_now=True)
 
+    objects = EncryptedManager()
+
     def __str__(self):
         return f"{self.pk}: {self.name}"
 
@@ -0,0 +1,71 @@
+from io import StringIO
+import json
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+import pytest
+
+from encrypted_fields import fields
+
+QUICK = {"repeat": 1, "min_time": 0.0001}
+
+
+def run(*args, **options):
+    out = StringIO()
+    call_command("benchmark_fields", *args, stdout=out, **QUICK, **options)
+    return out.getvalue()
+
+
+def test_covers_all_fields_keys_and_hashing(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    run(save=path)
+    with open(path) as f:
+        results = json.load(f)["results"]
+    for class_name in fields.__all__:
+        if class_name not in [
+            "EncryptedFieldMixin",
+            "SearchField",
+            "PrefixSearchField",
+            "RangeBucketField",
+        ]:
+            assert any(class_name in name for name in results)
+    for count in [1, 3, 10]:
+        assert f"decrypt keys={count} hit=first format=v1" in results
+        assert f"decrypt keys={count} hit=first format=v3" in results
+    assert "decrypt keys=10 hit=last format=legacy" in results
+    for algorithm in ["sha256", "hmac-sha256", "blake2b"]:
+        assert f"hash {algorithm} size=16" in results
+    assert all(value > 0 for value in results.values())
+
+
+def test_compare(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    run("--filter", "EncryptedCharField", save=path)
+    with open(path) as f:
+        baseline = json.load(f)
+    # make the baseline look much faster, so every benchmark has regressed
+    baseline["results"] = {name: 1e-12 for name in baseline["results"]}
+    baseline["results"]["removed"] = 1
+    with open(path, "w") as f:
+        json.dump(baseline, f)
+
+    out = run(
+        "--filter", "EncryptedCharField", "--filter", "hash blake2b", compare=path
+    )
+    assert "REGRESSION" in out
+    assert "new" in out
+    assert "1 benchmark(s) in the baseline were not run." in out
+    with pytest.raises(CommandError, match="regressed"):
+        run(
+            "--filter",
+            "encrypt EncryptedCharField",
+            compare=path,
+            fail_on_regression=True,
+        )
+
+
+def test_errors(tmp_path):
+    with pytest.raises(CommandError, match="No benchmarks"):
+        run("--filter", "no such benchmark")
+    with pytest.raises(CommandError, match="Cannot read baseline"):
+        run(compare=str(tmp_path / "missing.json"))
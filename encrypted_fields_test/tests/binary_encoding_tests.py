@@ -0,0 +1,109 @@
+import datetime
+
+from django.db import connection
+from django.utils import timezone
+import pytest
+
+from encrypted_fields import encoding, fields
+from encrypted_fields.encryption import get_keyring
+from encrypted_fields.query import EncryptedQuerySet
+from .. import models
+
+pytestmark = pytest.mark.django_db
+
+
+def raw_plaintext(model):
+    with connection.cursor() as cur:
+        cur.execute(f"SELECT value FROM {model._meta.db_table}")
+        cypher_text = bytes(cur.fetchone()[0])
+    return get_keyring().decrypt(cypher_text)
+
+
+@pytest.mark.parametrize(
+    "value,size",
+    [(0, 2), (-128, 2), (127, 2), (128, 3), (-32769, 5), (2 ** 31, 9), (-(2 ** 63), 9)],
+)
+def test_int_widths(value, size):
+    payload = encoding.encode_int(value)
+    assert len(payload) == size
+    assert encoding.decode(payload) == value
+
+
+def test_int_too_big_falls_back_to_text():
+    assert encoding.encode_int(2 ** 63) is None
+    field = fields.EncryptedIntegerField()
+    assert field.encode_plaintext(2 ** 63) == (str(2 ** 63).encode(), 0)
+    assert field.decrypt(field.encrypt(2 ** 63)) == "9223372036854775808"
+
+
+@pytest.mark.parametrize(
+    "encode,value",
+    [
+        (encoding.encode_date, datetime.date(1, 1, 1)),
+        (encoding.encode_date, datetime.date(9999, 12, 31)),
+        (encoding.encode_datetime, datetime.datetime(1969, 12, 31, 23, 59, 59, 1)),
+        (encoding.encode_datetime, datetime.datetime(9999, 12, 31, 23, 59, 59)),
+        (
+            encoding.encode_datetime,
+            datetime.datetime(2020, 9, 10, 12, 30, 15, 123456, tzinfo=timezone.utc),
+        ),
+    ],
+)
+def test_dates_round_trip(encode, value):
+    assert encoding.decode(encode(value)) == value
+
+
+def test_aware_datetimes_stored_as_utc():
+    tz = datetime.timezone(datetime.timedelta(hours=2))
+    value = datetime.datetime(2020, 9, 10, 14, 30, tzinfo=tz)
+    decoded = encoding.decode(encoding.encode_datetime(value))
+    assert decoded == value
+    assert decoded.tzinfo == datetime.timezone.utc
+
+
+def test_decode_errors():
+    with pytest.raises(ValueError, match="Unsupported plaintext encoding"):
+        encoding.decode(b"\x1f")
+    with pytest.raises(ValueError, match="corrupted"):
+        encoding.decode(bytes([encoding.TAG_INT32, 1]))
+
+
+def test_stored_binary():
+    models.EncryptedInt.objects.create(value=300)
+    assert raw_plaintext(models.EncryptedInt) == b"\x02\x01\x2c"
+    models.EncryptedDate.objects.create(value=datetime.date(2020, 9, 10))
+    assert len(raw_plaintext(models.EncryptedDate)) == 4
+    models.EncryptedDateTime.objects.create(
+        value=datetime.datetime(2020, 9, 10, 12, 30, tzinfo=timezone.utc)
+    )
+    assert len(raw_plaintext(models.EncryptedDateTime)) == 9
+
+
+def test_datetime_read_back_as_before():
+    value = datetime.datetime(2020, 9, 10, 12, 30, tzinfo=timezone.utc)
+    models.EncryptedDateTime.objects.create(value=value)
+    found = models.EncryptedDateTime.objects.get().value
+    assert found == (
+        value
+        if connection.features.supports_timezones
+        else timezone.make_naive(value, timezone.utc)
+    )
+
+
+def test_text_rows_still_read():
+    for model, value in [
+        (models.EncryptedInt, -5),
+        (models.EncryptedDate, datetime.date(2020, 9, 10)),
+        (models.EncryptedDateTime, datetime.datetime(2020, 9, 10, 12, 30, 15, 5)),
+    ]:
+        field = model._meta.get_field("value")
+        cypher_text = get_keyring().encrypt(str(value).encode())
+        assert field.from_db_value(cypher_text, None, connection) == value
+
+
+def test_bulk_create():
+    dates = [datetime.date(2020, 1, day) for day in range(1, 4)]
+    EncryptedQuerySet(models.EncryptedDate).bulk_create(
+        [models.EncryptedDate(value=value) for value in dates]
+    )
+    assert sorted(models.EncryptedDate.objects.values_list("value", flat=True)) == dates
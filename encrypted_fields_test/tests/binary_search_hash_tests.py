@@ -0,0 +1,127 @@
+import hashlib
+from types import SimpleNamespace
+
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+import pytest
+
+from encrypted_fields import fields
+from encrypted_fields.fields import (
+    SearchHash,
+    convert_search_hashes,
+    get_search_hash,
+    hex_to_binary_search_hash,
+)
+from .. import models
+from .utils import raw_values
+
+pytestmark = pytest.mark.django_db
+
+
+def test_hashes():
+    hashed = get_search_hash("abc123", "foo", digest_size=32)
+    assert isinstance(hashed, SearchHash)
+    assert hashed == hashlib.sha256(b"fooabc123").digest()
+    assert get_search_hash("abc123", "foo", "blake2b", 16) == (
+        hashlib.blake2b(b"foo", key=b"abc123", digest_size=32).digest()[:16]
+    )
+    # hashes are not hashed again, whatever they look like
+    assert get_search_hash("abc123", hashed, digest_size=32) is hashed
+    assert get_search_hash("abc123", bytes(hashed).hex(), digest_size=32) != hashed
+
+
+def test_round_trip():
+    models.SearchBinaryHash.objects.create(search="foo", search_16="bar")
+    assert [
+        bytes(value) for value in raw_values(models.SearchBinaryHash, "search")
+    ] == [hashlib.sha256(b"fooabc123").digest()]
+    assert len(raw_values(models.SearchBinaryHash, "search_16")[0]) == 16
+    found = models.SearchBinaryHash.objects.get(search="foo", search_16="bar")
+    assert isinstance(found.__dict__["search"], SearchHash)
+    assert found.search == "foo"
+    assert found.search_16 == "bar"
+    assert not models.SearchBinaryHash.objects.filter(search="bar").exists()
+    # saving what was loaded keeps the data
+    found.save()
+    assert models.SearchBinaryHash.objects.get(search="foo").value == "foo"
+
+
+def test_in_lookup_and_bulk_get():
+    for value in ["a", "b", "c"]:
+        models.SearchBinaryHash.objects.create(search_16=value)
+    queryset = models.SearchBinaryHash.objects.filter(search_16__in=["a", "c", "d"])
+    assert sorted(obj.search_16 for obj in queryset) == ["a", "c"]
+    found = models.SearchBinaryHash.objects.bulk_get(["b", "d"], "search_16")
+    assert list(found) == ["b"]
+    assert found["b"].value_16 == "b"
+
+
+def test_hex_to_binary():
+    hashed = get_search_hash("abc123", "foo")
+    assert hex_to_binary_search_hash(hashed) == get_search_hash(
+        "abc123", "foo", digest_size=32
+    )
+    assert hex_to_binary_search_hash(hashed, 16) == get_search_hash(
+        "abc123", "foo", digest_size=16
+    )
+    assert hex_to_binary_search_hash("foo") is None
+
+
+def test_convert_search_hashes():
+    for value in ["a", "b", None]:
+        models.SearchBinaryHash.objects.create(search_hex=value)
+    operation = convert_search_hashes(
+        "encrypted_fields_test.SearchBinaryHash", "search_hex", "search", batch_size=1
+    )
+    operation.code(apps, SimpleNamespace(connection=connection))
+    # found by the converted hashes, nothing was decrypted
+    assert models.SearchBinaryHash.objects.get(search="b").value_hex == "b"
+    assert models.SearchBinaryHash.objects.filter(search__isnull=True).count() == 1
+
+
+def test_convert_search_hashes_skips_other_algorithms():
+    models.SearchBinaryHash.objects.create(search_hex="a")
+    obj = models.SearchBinaryHash.objects.create(search_hex="b")
+    # a hash left by another algorithm, as after changing the field's
+    blake2b = get_search_hash("abc123", "b", "blake2b")
+    models.SearchBinaryHash.objects.filter(pk=obj.pk).update(search_hex=blake2b)
+    operation = convert_search_hashes(
+        "encrypted_fields_test.SearchBinaryHash", "search_hex", "search"
+    )
+    operation.code(apps, SimpleNamespace(connection=connection))
+    assert models.SearchBinaryHash.objects.get(search="a").value_hex == "a"
+    assert models.SearchBinaryHash.objects.get(search__isnull=True).value_hex == "b"
+
+
+def test_convert_search_hashes_checks_fields(monkeypatch):
+    operation = convert_search_hashes(
+        "encrypted_fields_test.SearchBinaryHash", "search_hex", "search_16"
+    )
+    with pytest.raises(ValueError, match="same hash_key, algorithm and normalizer"):
+        operation.code(apps, SimpleNamespace(connection=connection))
+    operation = convert_search_hashes(
+        "encrypted_fields_test.SearchBinaryHash", "search_hex", "search"
+    )
+    field = models.SearchBinaryHash._meta.get_field("search")
+    monkeypatch.setattr(field, "normalizer", "casefold")
+    with pytest.raises(ValueError, match="normalizer"):
+        operation.code(apps, SimpleNamespace(connection=connection))
+
+
+@pytest.mark.parametrize(
+    "kwargs", [{"digest_size": 16}, {"binary": True, "digest_size": 20}]
+)
+def test_invalid_options(kwargs):
+    with pytest.raises(ImproperlyConfigured):
+        fields.SearchField(hash_key="abc", encrypted_field_name="value", **kwargs)
+
+
+def test_deconstruct():
+    field = models.SearchBinaryHash._meta.get_field("search_16")
+    _, _, _, kwargs = field.deconstruct()
+    assert kwargs["binary"] is True
+    assert kwargs["digest_size"] == 16
+    assert field.db_type(connection) == connection.data_types["BinaryField"]
+    _, _, _, kwargs = models.SearchBinaryHash._meta.get_field("search").deconstruct()
+    assert "digest_size" not in kwargs
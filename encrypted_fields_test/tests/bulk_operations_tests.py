@@ -0,0 +1,115 @@
+import datetime
+
+from django.db import connection
+import pytest
+
+from encrypted_fields import fields
+from encrypted_fields.encryption import get_keyring
+from .. import models
+
+pytestmark = pytest.mark.django_db
+
+
+def make_demo(i):
+    return models.DemoModel(
+        email=f"{i}@example.com",
+        name=f"name {i}",
+        date=datetime.date(2020, 1, i + 1),
+        number=i,
+        text=f"text {i}",
+        info="info",
+    )
+
+
+@pytest.mark.parametrize("workers", [None, 3])
+def test_encrypt_many(workers):
+    field = models.EncryptedChar._meta.get_field("value")
+    values = ["one", 2, "three", datetime.date(2020, 1, 1)]
+    encrypted = field.encrypt_many(values, workers=workers)
+
+    assert len({value[2:18] for value in encrypted}) == 4  # unique nonces
+    assert [field.decrypt(value) for value in encrypted] == [
+        "one",
+        "2",
+        "three",
+        "2020-01-01",
+    ]
+    assert field.encrypt_many([]) == []
+
+
+def test_get_db_prep_save_many():
+    field = models.EncryptedNullable._meta.get_field("value")
+    loaded = fields.EncryptedValue(field, field.encrypt(5))
+    prepared = field.get_db_prep_save_many([1, None, loaded], connection)
+
+    assert prepared[0].decrypt() == 1
+    assert prepared[1] is None
+    assert prepared[2] is loaded
+
+
+def test_hash_many():
+    field = models.SearchChar._meta.get_field("search")
+    values = ["a", None, "b", "a", field.get_prep_value("c")]
+
+    assert field.hash_many(values) == [
+        field.get_prep_value("a"),
+        None,
+        field.get_prep_value("b"),
+        field.get_prep_value("a"),
+        field.get_prep_value("c"),
+    ]
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_bulk_create(monkeypatch, workers):
+    def fail(*args, **kwargs):
+        raise AssertionError("Values should be encrypted in batches")
+
+    monkeypatch.setattr(fields.EncryptedFieldMixin, "encrypt", fail)
+    objs = models.DemoModel.objects.bulk_create(
+        [make_demo(i) for i in range(5)], encryption_workers=workers
+    )
+    monkeypatch.undo()
+
+    assert objs[2].email == "2@example.com"
+    assert objs[2].created_at is not None
+    obj = models.DemoModel.objects.get(email="3@example.com")
+    assert obj.name == "name 3"
+    assert obj.date == datetime.date(2020, 1, 4)
+    assert obj.created_at is not None
+    assert models.DemoModel.objects.get(number=4).text == "text 4"
+    assert models.DemoModel.objects.get(default_char="foo default", number=1)
+
+
+def test_bulk_update():
+    for i in range(4):
+        make_demo(i).save()
+    objs = list(models.DemoModel.objects.order_by("pk"))
+    for obj in objs:
+        obj.name = obj.name.upper()
+        obj.info = "updated"
+
+    models.DemoModel.objects.bulk_update(
+        objs, ["name", "_name_data", "info"], batch_size=3
+    )
+
+    assert models.DemoModel.objects.get(name="NAME 2").email == "2@example.com"
+    assert set(models.DemoModel.objects.values_list("info", flat=True)) == {"updated"}
+
+
+def test_bulk_update_keeps_unread_values():
+    make_demo(1).save()
+    with connection.cursor() as cur:
+        cur.execute(f"SELECT _text_data FROM {models.DemoModel._meta.db_table}")
+        before = bytes(cur.fetchone()[0])
+    objs = list(models.DemoModel.objects.defer_decryption())
+    objs[0].info = "updated"
+
+    models.DemoModel.objects.bulk_update(objs, ["_text_data", "text", "info"])
+
+    with connection.cursor() as cur:
+        cur.execute(f"SELECT _text_data FROM {models.DemoModel._meta.db_table}")
+        assert bytes(cur.fetchone()[0]) == before
+    obj = models.DemoModel.objects.get(text="text 1")
+    assert obj.info == "updated"
+    assert get_keyring().decrypt(before) == b"text 1"
@@ -0,0 +1,82 @@
+from io import StringIO
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+import pytest
+
+from encrypted_fields import backends, encryption
+from encrypted_fields.backends import CryptographyBackend, PycryptodomeBackend
+from encrypted_fields.encryption import KeyRing, get_keyring
+from .. import models
+from .utils import KEY1
+
+pytest.importorskip("cryptography")
+
+PYCRYPTODOME = "encrypted_fields.backends.PycryptodomeBackend"
+CRYPTOGRAPHY = "encrypted_fields.backends.CryptographyBackend"
+
+
+@pytest.mark.parametrize("nonce_size", [12, 16])
+@pytest.mark.parametrize("associated_data", [None, b"\xef\x03\x00"])
+def test_identical_output(nonce_size, associated_data):
+    key, nonce = bytes.fromhex(KEY1), b"n" * nonce_size
+    encrypted = PycryptodomeBackend().encrypt(key, nonce, b"hello", associated_data)
+    assert CryptographyBackend().encrypt(key, nonce, b"hello", associated_data) == (
+        encrypted
+    )
+    for backend in [PycryptodomeBackend(), CryptographyBackend()]:
+        assert backend.decrypt(key, nonce, *encrypted, associated_data) == b"hello"
+        with pytest.raises(ValueError):
+            backend.decrypt(key, nonce, encrypted[0], b"x" * 16, associated_data)
+
+
+def test_data_keys_not_cached():
+    backend = CryptographyBackend()
+    keyring = KeyRing([KEY1], backend)
+    values = keyring.encrypt_many([b"a", b"b", b"c"], envelope=True)
+    assert [keyring.decrypt(value) for value in values] == [b"a", b"b", b"c"]
+    # only the key wrapping the data keys is
+    assert backend.get_cipher.cache_info().currsize == 1
+
+
+@pytest.mark.parametrize("flags", [0, encryption.FLAG_ZLIB])
+def test_keyrings_read_each_other(flags):
+    pycryptodome = KeyRing([KEY1], backends.get_backend(PYCRYPTODOME))
+    cryptography = KeyRing([KEY1], backends.get_backend(CRYPTOGRAPHY))
+    for writer, reader in [(pycryptodome, cryptography), (cryptography, pycryptodome)]:
+        assert reader.decrypt_and_identify(writer.encrypt(b"hello", flags)) == (
+            b"hello",
+            reader.primary_key,
+            flags,
+        )
+        assert reader.decrypt(writer.encrypt_many([b"a", b"b"])[1]) == b"b"
+
+
+def test_backend_setting(settings, db):
+    assert isinstance(get_keyring().backend, PycryptodomeBackend)
+    models.EncryptedChar.objects.create(value="written by pycryptodome")
+    settings.FIELD_ENCRYPTION_BACKEND = CRYPTOGRAPHY
+    assert isinstance(get_keyring().backend, CryptographyBackend)
+    models.EncryptedChar.objects.create(value="written by cryptography")
+    assert sorted(models.EncryptedChar.objects.values_list("value", flat=True)) == [
+        "written by cryptography",
+        "written by pycryptodome",
+    ]
+
+
+def test_unknown_backend(settings):
+    settings.FIELD_ENCRYPTION_BACKEND = "encrypted_fields.backends.Missing"
+    with pytest.raises(ImproperlyConfigured):
+        get_keyring()
+
+
+def test_benchmark_command():
+    out = StringIO()
+    call_command("benchmark_cipher_backends", sizes="16", min_time=0.001, stdout=out)
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith("pycryptodome encrypt size=16: ")
+    assert any(line.startswith("cryptography decrypt size=16: ") for line in lines)
+    assert lines[-1] in [
+        f'FIELD_ENCRYPTION_BACKEND = "{PYCRYPTODOME}"',
+        f'FIELD_ENCRYPTION_BACKEND = "{CRYPTOGRAPHY}"',
+    ]
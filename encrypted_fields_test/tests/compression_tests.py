@@ -0,0 +1,126 @@
+import json
+import zlib
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+import pytest
+
+from encrypted_fields import encryption, fields
+from encrypted_fields.encryption import KeyRing, compress_payload, decode_payload
+from encrypted_fields.query import EncryptedQuerySet
+from .. import models
+from .utils import KEY1, KEY2, raw_value
+
+pytestmark = pytest.mark.django_db
+
+
+TEXT = json.dumps([{"name": "Jo", "email": "jo@example.com"}] * 50)
+
+
+def test_compress_payload():
+    assert compress_payload(b"a" * 10, threshold=64) == (b"a" * 10, 0)
+    payload, flags = compress_payload(b"a" * 100, threshold=64)
+    assert flags == encryption.FLAG_ZLIB
+    assert zlib.decompress(payload) == b"a" * 100
+    # not compressed if that doesn't make it smaller
+    assert compress_payload(b"abc", threshold=0) == (b"abc", 0)
+
+
+def test_decode_payload_errors():
+    with pytest.raises(ValueError, match="Unsupported payload flags"):
+        decode_payload(b"abc", 0x80)
+    payload, flags = compress_payload(b"a" * 100, zdict=b"aaaa")
+    with pytest.raises(ValueError, match="Cannot decompress"):
+        decode_payload(payload, flags)
+
+
+def test_flag_byte_format():
+    keyring = KeyRing([KEY1])
+    value = keyring.encrypt(b"hello", encryption.FLAG_ZLIB)
+    assert value[:3] == encryption.FORMAT_MAGIC + bytes(
+        [encryption.FORMAT_V3, encryption.FLAG_ZLIB]
+    )
+    assert keyring.decrypt_and_identify(value) == (
+        b"hello",
+        keyring.primary_key,
+        encryption.FLAG_ZLIB,
+    )
+    # the flags are authenticated
+    tampered = value[:2] + b"\x00" + value[3:]
+    with pytest.raises(ValueError):
+        keyring.decrypt(tampered)
+    # values without flags have a zero flags byte
+    assert keyring.encrypt(b"hello")[:3] == encryption.FORMAT_MAGIC + bytes(
+        [encryption.FORMAT_V3, 0]
+    )
+
+
+def test_round_trip_compressed():
+    obj = models.EncryptedCompressedText.objects.create(value=TEXT, value_dict=TEXT)
+    stored = raw_value(obj)
+    assert stored[2] == encryption.FLAG_ZLIB
+    assert len(stored) < len(TEXT) / 5
+    assert len(raw_value(obj, "value_dict")) < len(stored)
+    found = models.EncryptedCompressedText.objects.get()
+    assert found.value == TEXT
+    assert found.value_dict == TEXT
+
+
+def test_below_threshold_not_compressed():
+    obj = models.EncryptedCompressedText.objects.create(value="a" * 63)
+    assert raw_value(obj)[2] == 0
+    assert models.EncryptedCompressedText.objects.get().value == "a" * 63
+
+
+def test_bulk_create_compressed():
+    objs = [
+        models.EncryptedCompressedText(value=value)
+        for value in [TEXT, "short", TEXT + "!"]
+    ]
+    EncryptedQuerySet(models.EncryptedCompressedText).bulk_create(objs)
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT value FROM encrypted_fields_test_encryptedcompressedtext "
+            "ORDER BY id"
+        )
+        flags = [bytes(row[0])[2] for row in cur.fetchall()]
+    assert flags == [encryption.FLAG_ZLIB, 0, encryption.FLAG_ZLIB]
+    assert list(
+        models.EncryptedCompressedText.objects.order_by("pk").values_list(
+            "value", flat=True
+        )
+    ) == [TEXT, "short", TEXT + "!"]
+
+
+def test_uncompressed_rows_still_read():
+    field = models.EncryptedCompressedText._meta.get_field("value")
+    plain = fields.EncryptedTextField()
+    assert field.decrypt(plain.encrypt(TEXT)) == TEXT
+    # and compressed rows are read when compression is turned off
+    assert plain.decrypt(field.encrypt(TEXT)) == TEXT
+
+
+def test_rotation_keeps_compression(settings):
+    settings.FIELD_ENCRYPTION_KEYS = [KEY2]
+    field = models.EncryptedCompressedText._meta.get_field("value_dict")
+    value = field.encrypt(TEXT)
+    rotated = KeyRing([KEY1, KEY2]).rotate(value)
+    assert rotated[2] == encryption.FLAG_ZLIB
+    assert len(rotated) == len(value)
+    settings.FIELD_ENCRYPTION_KEYS = [KEY1]
+    assert field.decrypt(rotated) == TEXT
+
+
+def test_deconstruct():
+    field = models.EncryptedCompressedText._meta.get_field("value_dict")
+    _, _, _, kwargs = field.deconstruct()
+    assert kwargs["compress"] is True
+    assert kwargs["compress_dictionary"] == b'{"name": "", "email": ""}'
+    assert "compress_threshold" not in kwargs
+    _, _, _, kwargs = fields.EncryptedTextField().deconstruct()
+    assert not {"compress", "compress_threshold", "compress_dictionary"} & set(kwargs)
+
+
+def test_invalid_threshold():
+    with pytest.raises(ImproperlyConfigured):
+        fields.EncryptedTextField(compress=True, compress_threshold=-1)
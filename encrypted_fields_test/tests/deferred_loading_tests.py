@@ -0,0 +1,117 @@
+import datetime
+import pickle
+
+import pytest
+
+from encrypted_fields.fields import EncryptedValue
+from .. import models
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def demos():
+    return [
+        models.DemoModel.objects.create(
+            email=f"{i}@example.com",
+            name=f"Jo {i}",
+            date=datetime.date(2020, 1, i + 1),
+            number=i,
+            text="some text",
+            info="info",
+        )
+        for i in range(5)
+    ]
+
+
+def test_batch_loaded_on_first_access(demos, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        objs = list(models.DemoModel.objects.only("email", "name", "number"))
+    # one query per deferred EncryptedField read, for every instance
+    with django_assert_num_queries(4):
+        values = [(obj.email, obj.name, obj.number, obj.info) for obj in objs]
+    assert values == [
+        (f"{i}@example.com", f"Jo {i}", i, "info") for i in range(len(demos))
+    ]
+
+
+def test_loaded_values_decrypted_when_read(demos):
+    objs = list(models.DemoModel.objects.defer("_email_data", "_text_data"))
+    assert objs[0].email == "0@example.com"
+    assert isinstance(objs[1].__dict__["_email_data"], EncryptedValue)
+    assert objs[1].email == "1@example.com"
+
+
+def test_other_deferred_fields_left_deferred(demos, django_assert_num_queries):
+    objs = list(models.DemoModel.objects.defer("_email_data", "_text_data"))
+    assert objs[0].email == "0@example.com"
+    assert not any("_text_data" in obj.__dict__ for obj in objs)
+    with django_assert_num_queries(1):
+        assert [obj.text for obj in objs] == ["some text"] * len(demos)
+
+
+def test_set_values_kept(demos):
+    objs = list(models.DemoModel.objects.order_by("pk").only("id"))
+    objs[1].name = "Bob"
+    assert objs[0].name == "Jo 0"
+    assert objs[1].name == "Bob"
+    objs[1].save()
+    assert models.DemoModel.objects.get(name="Bob").pk == objs[1].pk
+
+
+def test_iterator_batches_per_chunk(demos, django_assert_num_queries):
+    queryset = models.DemoModel.objects.only("id").iterator(chunk_size=2)
+    with django_assert_num_queries(4):  # the rows, then one query per chunk of 2
+        assert [obj.number for obj in queryset] == list(range(len(demos)))
+
+
+def test_collected_instances_are_skipped(demos, django_assert_num_queries):
+    objs = list(models.DemoModel.objects.order_by("pk").only("id"))
+    del objs[1:]
+    with django_assert_num_queries(1):
+        assert objs[0].name == "Jo 0"
+
+
+def test_pickled_instance(demos, django_assert_num_queries):
+    obj = pickle.loads(pickle.dumps(models.DemoModel.objects.only("id").first()))
+    with django_assert_num_queries(2):
+        assert obj.name == "Jo 0"
+        assert obj.email == "0@example.com"
+
+
+def test_plain_manager_not_batched(django_assert_num_queries):
+    for value in ["a", "b"]:
+        models.SearchChar.objects.create(search=value)
+    objs = list(models.SearchChar.objects.order_by("pk").only("id"))
+    with django_assert_num_queries(2):
+        assert [obj.search for obj in objs] == ["a", "b"]
+
+
+def test_prefetch_encrypted(demos, django_assert_num_queries):
+    queryset = models.DemoModel.objects.only("id").prefetch_encrypted("name", "info")
+    with django_assert_num_queries(2):
+        objs = list(queryset)
+    with django_assert_num_queries(0):
+        assert [(obj.name, obj.info) for obj in objs][0] == ("Jo 0", "info")
+    # the others are still loaded in a batch
+    with django_assert_num_queries(1):
+        assert [obj.email for obj in objs][0] == "0@example.com"
+
+
+def test_prefetch_encrypted_defaults_to_all(demos, django_assert_num_queries):
+    with django_assert_num_queries(3):  # the rows, then one query per chunk of 3
+        objs = list(
+            models.DemoModel.objects.only("id")
+            .prefetch_encrypted()
+            .iterator(chunk_size=3)
+        )
+    with django_assert_num_queries(0):
+        assert [obj.date for obj in objs] == [d.date for d in demos]
+
+
+def test_prefetch_encrypted_cleared():
+    queryset = models.DemoModel.objects.prefetch_encrypted("name")
+    assert queryset.filter(pk=1)._prefetch_encrypted == ("name",)
+    assert queryset.prefetch_encrypted(None)._prefetch_encrypted is None
+    with pytest.raises(TypeError):
+        models.DemoModel.objects.values("pk").prefetch_encrypted()
@@ -0,0 +1,140 @@
+from django.core.management import call_command
+import pytest
+
+from encrypted_fields import backends, encryption, fields
+from encrypted_fields.encryption import KeyRing, get_keyring
+from .. import models
+from .utils import KEY1, KEY2, raw_values
+
+# Where the payload's tag and cypher text start in a v4 value.
+PAYLOAD_OFFSET = encryption.HEADER_SIZE + 1 + encryption.WRAPPING_SIZE
+
+
+class TestKeyRing:
+    def test_envelope_format(self):
+        keyring = KeyRing([KEY1])
+        value = keyring.encrypt(b"hello", envelope=True)
+        assert value[:3] == encryption.FORMAT_MAGIC + bytes([encryption.FORMAT_V4, 0])
+        assert keyring.uses_primary_key(value)
+        # the payload is encrypted by the data key, with the same overhead as v3
+        assert len(value) == PAYLOAD_OFFSET + encryption.TAG_SIZE + len(b"hello")
+        assert keyring.decrypt_and_identify(value) == (
+            b"hello",
+            keyring.primary_key,
+            0,
+        )
+
+    @pytest.mark.parametrize(
+        "path", [None, "encrypted_fields.backends.CryptographyBackend"]
+    )
+    def test_encrypt_many(self, path):
+        keyring = KeyRing([KEY1], backend=backends.get_backend(path))
+        plaintexts = [b"a", b"b" * 100, b""]
+        values = keyring.encrypt_many(
+            plaintexts, [0, encryption.FLAG_ZLIB, 0], envelope=True
+        )
+        assert [keyring.decrypt_and_identify(v)[::2] for v in values] == [
+            (b"a", 0),
+            (b"b" * 100, encryption.FLAG_ZLIB),
+            (b"", 0),
+        ]
+        # every value has a data key of its own
+        wrapped = {v[encryption.HEADER_SIZE + 1 : PAYLOAD_OFFSET] for v in values}
+        assert len(wrapped) == 3
+        # and can be read with the other backend
+        assert KeyRing([KEY1]).decrypt(values[0]) == b"a"
+
+    def test_rotate_rewraps_the_data_key(self):
+        old = KeyRing([KEY2]).encrypt(b"x" * 1000, envelope=True)
+        keyring = KeyRing([KEY1, KEY2])
+
+        rotated = keyring.rotate(old)
+
+        assert keyring.uses_primary_key(rotated)
+        assert rotated[:3] == old[:3]
+        assert rotated[PAYLOAD_OFFSET:] == old[PAYLOAD_OFFSET:]
+        assert KeyRing([KEY1]).decrypt(rotated) == b"x" * 1000
+        assert keyring.rotate(rotated) is None
+
+    def test_rotate_needs_the_old_key(self):
+        old = KeyRing([KEY2]).encrypt(b"x", envelope=True)
+        with pytest.raises(ValueError, match="AES Key incorrect"):
+            KeyRing([KEY1]).rotate(old)
+
+    @pytest.mark.parametrize(
+        "index", [2, encryption.HEADER_SIZE + 20, PAYLOAD_OFFSET, PAYLOAD_OFFSET + 17]
+    )
+    def test_tampering_detected(self, index):
+        keyring = KeyRing([KEY1])
+        value = bytearray(keyring.encrypt(b"hello", envelope=True))
+        value[index] ^= 1
+        with pytest.raises(ValueError):
+            keyring.decrypt(bytes(value))
+
+    def test_data_keys_cached(self):
+        keyring = KeyRing([KEY1], data_key_cache_size=2)
+        values = keyring.encrypt_many([b"a", b"b", b"c"], envelope=True)
+        for value in [values[0], values[0], values[1], values[2], values[0]]:
+            keyring.decrypt(value)
+        info = keyring.unwrap.cache_info()
+        # values[0] was evicted by values[2]
+        assert (info.hits, info.misses, info.currsize) == (1, 4, 2)
+
+    def test_data_key_cache_setting(self, settings):
+        settings.FIELD_ENCRYPTION_DATA_KEY_CACHE_SIZE = 0
+        keyring = get_keyring()
+        assert not hasattr(keyring.unwrap, "cache_info")
+        assert keyring.decrypt(keyring.encrypt(b"a", envelope=True)) == b"a"
+        settings.FIELD_ENCRYPTION_DATA_KEY_CACHE_SIZE = 10
+        assert get_keyring().unwrap.cache_info().maxsize == 10
+
+
+def test_deconstruct():
+    field = models.EncryptedEnvelope._meta.get_field("number")
+    assert field.deconstruct()[3]["envelope"] is True
+    assert "envelope" not in fields.EncryptedIntegerField().deconstruct()[3]
+
+
+@pytest.mark.django_db
+def test_field():
+    text = "hello " * 50
+    obj = models.EncryptedEnvelope.objects.create(value=text, search=7)
+    models.EncryptedEnvelope.objects.bulk_create(
+        [models.EncryptedEnvelope(value="bulk", search=i) for i in range(3)]
+    )
+
+    keyring = get_keyring()
+    for value in raw_values(models.EncryptedEnvelope, "value"):
+        assert value[1] == encryption.FORMAT_V4
+    # compressed, then encrypted with the data key
+    value = raw_values(models.EncryptedEnvelope, "value")[0]
+    assert keyring.decrypt_and_identify(value)[2] == encryption.FLAG_ZLIB
+    obj = models.EncryptedEnvelope.objects.get(search=7)
+    assert (obj.value, obj.number) == (text, 7)
+    assert list(
+        models.EncryptedEnvelope.objects.filter(search__in=[0, 1, 2])
+        .order_by("pk")
+        .values_list("value", "number")
+    ) == [("bulk", 0), ("bulk", 1), ("bulk", 2)]
+
+
+@pytest.mark.django_db
+def test_rotate_command(settings, tmp_path):
+    settings.FIELD_ENCRYPTION_KEYS = [KEY2]
+    models.EncryptedEnvelope.objects.create(value="x" * 1000, search=1)
+    old = raw_values(models.EncryptedEnvelope, "value")[0]
+    settings.FIELD_ENCRYPTION_KEYS = [KEY1, KEY2]
+
+    call_command(
+        "rotate_encryption_keys",
+        "encrypted_fields_test.EncryptedEnvelope",
+        checkpoint=str(tmp_path / "checkpoint.json"),
+        verbosity=0,
+    )
+
+    rotated = raw_values(models.EncryptedEnvelope, "value")[0]
+    assert get_keyring().uses_primary_key(rotated)
+    assert rotated[PAYLOAD_OFFSET:] == old[PAYLOAD_OFFSET:]
+    settings.FIELD_ENCRYPTION_KEYS = [KEY1]
+    obj = models.EncryptedEnvelope.objects.get(search=1)
+    assert (obj.value, obj.number) == ("x" * 1000, 1)
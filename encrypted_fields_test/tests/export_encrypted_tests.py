@@ -0,0 +1,100 @@
+import csv
+import datetime
+import gzip
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+import pytest
+
+from .. import models
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def demos():
+    return [
+        models.DemoModel.objects.create(
+            email=f"{i}@example.com",
+            name=f"name {i}" if i else None,
+            date=datetime.date(2020, 1, i + 1),
+            number=i,
+            text=f"text, {i}\nwith a new line",
+            info="info",
+        )
+        for i in range(5)
+    ]
+
+
+def export(*args, **options):
+    out, err = StringIO(), StringIO()
+    call_command("export_encrypted", *args, stdout=out, stderr=err, **options)
+    return out.getvalue(), err.getvalue()
+
+
+def test_csv_to_stdout(demos):
+    out, err = export("encrypted_fields_test.DemoModel", chunk_size=2)
+    rows = list(csv.DictReader(StringIO(out)))
+    assert [row["id"] for row in rows] == [str(obj.pk) for obj in demos]
+    assert "email" not in rows[0]  # SearchFields are left out
+    assert rows[1]["_email_data"] == "1@example.com"
+    assert rows[1]["_text_data"] == "text, 1\nwith a new line"
+    assert rows[1]["_date_data"] == "2020-01-02"
+    assert rows[0]["_name_data"] == ""
+    assert err.startswith("Exported 5 rows of encrypted_fields_test.DemoModel in ")
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_jsonl_gzip_file(demos, tmp_path, workers):
+    path = tmp_path / "demos.jsonl.gz"
+    out, _ = export(
+        "encrypted_fields_test.DemoModel",
+        output=str(path),
+        fields="id,email,_number_data,date_2",
+        workers=workers,
+        chunk_size=2,
+        verbosity=2,
+    )
+    with gzip.open(path, "rt") as f:
+        rows = [json.loads(line) for line in f]
+    assert rows[3] == {
+        "id": demos[3].pk,
+        "email": "3@example.com",
+        "_number_data": 3,
+        "date_2": None,
+    }
+    assert len(rows) == 5
+    assert "4 rows exported..." in out
+    assert out.splitlines()[-1].endswith(" bytes).")
+
+
+def test_format_option(demos, tmp_path):
+    path = tmp_path / "demos.txt"
+    export("encrypted_fields_test.DemoModel", output=str(path), format="jsonl")
+    assert json.loads(path.read_text().splitlines()[0])["_email_data"] == (
+        "0@example.com"
+    )
+
+
+def test_empty():
+    out, err = export("encrypted_fields_test.SearchRange")
+    assert out.splitlines() == ["id,age,born,created"]
+    assert err.startswith("Exported 0 rows")
+
+
+@pytest.mark.parametrize(
+    "args,options",
+    [
+        (["encrypted_fields_test.Missing"], {}),
+        (["encrypted_fields_test"], {}),
+        (["encrypted_fields_test.DemoModel"], {"fields": "missing"}),
+        (["encrypted_fields_test.SearchRange"], {"fields": "age_bucket"}),
+        (["encrypted_fields_test.DemoModel"], {"gzip": True}),
+        (["encrypted_fields_test.DemoModel"], {"chunk_size": 0}),
+    ],
+)
+def test_errors(args, options):
+    with pytest.raises(CommandError):
+        export(*args, **options)
@@ -0,0 +1,171 @@
+import datetime
+import gzip
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import pytest
+
+from .. import models
+
+pytestmark = pytest.mark.django_db
+
+
+def run(*args, **options):
+    out, err = StringIO(), StringIO()
+    call_command("import_encrypted", *args, stdout=out, stderr=err, **options)
+    return out.getvalue(), err.getvalue()
+
+
+@pytest.mark.parametrize("name", ["demos.csv", "demos.jsonl.gz"])
+def test_round_trip(tmp_path, name):
+    demos = [
+        models.DemoModel.objects.create(
+            email=f"{i}@example.com",
+            name=f"name {i}" if i else None,
+            date=datetime.date(2020, 1, i + 1),
+            number=i,
+            text=f"text, {i}\nwith a new line",
+            info="",
+        )
+        for i in range(5)
+    ]
+    path = tmp_path / name
+    call_command(
+        "export_encrypted", "encrypted_fields_test.DemoModel", output=str(path)
+    )
+    models.DemoModel.objects.all().delete()
+
+    out, _ = run("encrypted_fields_test.DemoModel", str(path), transaction_size=2)
+
+    assert out.startswith("Imported 5 rows into encrypted_fields_test.DemoModel in ")
+    found = list(models.DemoModel.objects.order_by("pk"))
+    assert [obj.pk for obj in found] == [obj.pk for obj in demos]
+    for obj, expected in zip(found, demos):
+        for name in ["email", "name", "date", "number", "text", "info", "date_2"]:
+            assert getattr(obj, name) == getattr(expected, name)
+    # the hashes were saved, though the columns were for the EncryptedFields
+    assert models.DemoModel.objects.get(email="3@example.com").pk == demos[3].pk
+    assert (
+        models.DemoModel.objects.get(date=datetime.date(2020, 1, 2)).pk == demos[1].pk
+    )
+    assert models.DemoModel.objects.get(name=None).pk == demos[0].pk
+
+
+def test_round_trip_keeps_microseconds(tmp_path):
+    models.EncryptedDateTime.objects.create(
+        value=datetime.datetime(
+            2020, 1, 1, 1, 1, 1, 123456, tzinfo=datetime.timezone.utc
+        )
+    )
+    value = models.EncryptedDateTime.objects.get().value
+    path = tmp_path / "values.jsonl"
+    call_command(
+        "export_encrypted", "encrypted_fields_test.EncryptedDateTime", output=str(path)
+    )
+    assert json.loads(path.read_text())["value"].startswith(
+        "2020-01-01T01:01:01.123456"
+    )
+    models.EncryptedDateTime.objects.all().delete()
+
+    run("encrypted_fields_test.EncryptedDateTime", str(path))
+
+    assert models.EncryptedDateTime.objects.get().value == value
+
+
+def test_map_and_exclude(tmp_path):
+    path = tmp_path / "people.csv"
+    path.write_text("e-mail,value,skip\nA@Example.com,Al,x\n,,y\n")
+
+    run(
+        "encrypted_fields_test.SearchNormalized",
+        str(path),
+        map=["e-mail=email_search", "value=name"],
+        exclude="skip",
+    )
+
+    first, second = models.SearchNormalized.objects.order_by("pk")
+    assert first.email == "A@Example.com" and first.name == "Al"
+    assert second.email is None and second.name is None
+    assert models.SearchNormalized.objects.get(email_search="a@example.com") == first
+    assert models.SearchNormalized.objects.get(name_search__iexact="AL") == first
+
+
+def test_batches_and_transactions(tmp_path):
+    path = tmp_path / "values.jsonl"
+    path.write_text("".join(json.dumps({"value": str(i)}) + "\n" for i in range(5)))
+
+    with CaptureQueriesContext(connection) as queries:
+        out, _ = run(
+            "encrypted_fields_test.SearchChar",
+            str(path),
+            batch_size=2,
+            transaction_size=3,
+            workers=2,
+            verbosity=2,
+        )
+
+    inserts = [q for q in queries if q["sql"].startswith("INSERT")]
+    # 3 rows in batches of 2, then 2 rows
+    assert len(inserts) == 3
+    assert sum(q["sql"].startswith("SAVEPOINT") for q in queries) == 2
+    assert "3 rows imported..." in out and "5 rows imported..." in out
+    assert sorted(obj.value for obj in models.SearchChar.objects.all()) == list("01234")
+    assert models.SearchChar.objects.get(search="4").value == "4"
+
+
+def test_prefixes(tmp_path):
+    path = tmp_path / "prefixes.jsonl.gz"
+    with gzip.open(path, "wt") as f:
+        f.write(json.dumps({"id": 7, "value": "Alice", "value_2": "Bob"}) + "\n")
+
+    _, err = run("encrypted_fields_test.SearchPrefix", str(path))
+
+    assert err == ""
+    assert models.SearchPrefix.objects.get(prefix__startswith="ali").pk == 7
+    assert models.SearchPrefix.objects.get(prefix_2__startswith="Bo").pk == 7
+
+
+def test_prefixes_without_pks(tmp_path):
+    path = tmp_path / "prefixes.csv"
+    path.write_text("value,value_2\nAlice,Bob\n")
+
+    _, err = run("encrypted_fields_test.SearchPrefix", str(path))
+
+    assert "The prefixes of 1 rows were not saved" in err
+    assert models.SearchPrefix.objects.get().value == "Alice"
+
+
+def test_invalid_value_rolls_back_its_transaction(tmp_path):
+    path = tmp_path / "values.csv"
+    path.write_text("value\n1\n2\nthree\n")
+
+    with pytest.raises(CommandError, match="Row 3, column 'value': "):
+        run("encrypted_fields_test.SearchInt", str(path), transaction_size=2)
+    assert sorted(obj.value for obj in models.SearchInt.objects.all()) == [1, 2]
+
+
+@pytest.mark.parametrize(
+    "header, options, message",
+    [
+        ("nope", {}, "has no field 'nope' for column 'nope'"),
+        ("value", {"map": ["value"]}, "--map should be COLUMN=FIELD"),
+        ("value", {"batch_size": 0}, "--batch-size must be at least 1"),
+        ("search", {"map": ["search=bad"]}, "has no field 'bad'"),
+    ],
+)
+def test_errors(tmp_path, header, options, message):
+    path = tmp_path / "values.csv"
+    path.write_text(f"{header}\nx\n")
+    with pytest.raises(CommandError, match=message):
+        run("encrypted_fields_test.SearchChar", str(path), **options)
+
+
+def test_range_bucket_field_is_not_set(tmp_path):
+    path = tmp_path / "values.csv"
+    path.write_text("age,age_bucket\n1,x\n")
+    with pytest.raises(CommandError, match="SearchRange.age_bucket can't be set"):
+        run("encrypted_fields_test.SearchRange", str(path))
@@ -0,0 +1,143 @@
+from Crypto.Cipher import AES
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+import pytest
+
+from encrypted_fields import backends, encryption, fields
+from encrypted_fields.encryption import KeyRing, get_key_id, get_keyring
+from .. import models
+from .utils import KEY1, KEY2, KEY3
+
+
+def legacy_encrypt(key, data):
+    """Encrypt data using the original 'nonce+tag+cypher_text' layout."""
+    cipher = AES.new(bytes.fromhex(key), AES.MODE_GCM)
+    cypher_text, tag = cipher.encrypt_and_digest(data)
+    return cipher.nonce + tag + cypher_text
+
+
+class TestKeyRing:
+    def test_keys_parsed_once(self):
+        keyring = KeyRing([KEY1, KEY2])
+        assert keyring.keys == (bytes.fromhex(KEY1), bytes.fromhex(KEY2))
+        assert keyring.primary_key == bytes.fromhex(KEY1)
+        assert keyring.get_keys(get_key_id(bytes.fromhex(KEY2))) == (
+            bytes.fromhex(KEY2),
+        )
+        assert keyring.get_keys(b"1234") == ()
+
+    @pytest.mark.parametrize("keys", ["secret", [], ["not hex"]])
+    def test_improperly_configured(self, keys):
+        with pytest.raises(ImproperlyConfigured):
+            KeyRing(keys)
+
+    def test_versioned_format(self):
+        keyring = KeyRing([KEY1])
+        value = keyring.encrypt(b"hello")
+        assert value[:3] == encryption.FORMAT_MAGIC + bytes([encryption.FORMAT_V3, 0])
+        assert value[15:19] == keyring.primary_key_id
+        assert len(value) == 3 + 12 + 4 + 16 + len(b"hello")
+        assert keyring.decrypt(value) == b"hello"
+        assert keyring.decrypt(memoryview(value)) == b"hello"
+        # the header is authenticated
+        with pytest.raises(ValueError):
+            keyring.decrypt(value[:2] + b"\x02" + value[3:])
+
+    def test_encrypt_many_format(self):
+        keyring = KeyRing([KEY1])
+        values = keyring.encrypt_many([b"hello", b"world"], [0, encryption.FLAG_ZLIB])
+        assert [value[:3] for value in values] == [
+            encryption.FORMAT_MAGIC + bytes([encryption.FORMAT_V3, flags])
+            for flags in [0, encryption.FLAG_ZLIB]
+        ]
+        assert keyring.decrypt_and_identify(values[1])[0] == b"world"
+
+    @pytest.mark.parametrize("flags", [None, encryption.FLAG_ZLIB])
+    def test_decrypt_16_byte_nonce_formats(self, flags):
+        """Values written before the 12 byte nonce format are still read."""
+        keyring = KeyRing([KEY1])
+        cipher = AES.new(keyring.primary_key, AES.MODE_GCM)
+        if flags is None:
+            header = encryption.FORMAT_MAGIC + bytes([encryption.FORMAT_V1])
+        else:
+            header = encryption.FORMAT_MAGIC + bytes([encryption.FORMAT_V2, flags])
+            cipher.update(header)
+        cypher_text, tag = cipher.encrypt_and_digest(b"hello")
+        value = header + cipher.nonce + keyring.primary_key_id + tag + cypher_text
+        assert keyring.decrypt_and_identify(value) == (
+            b"hello",
+            keyring.primary_key,
+            flags or 0,
+        )
+        assert keyring.uses_primary_key(value)
+
+    def test_decrypt_with_old_key_single_attempt(self, monkeypatch):
+        value = KeyRing([KEY3]).encrypt(b"hello")
+        keyring = KeyRing([KEY1, KEY2, KEY3])
+        calls = []
+        original = backends.AES.new
+
+        def counting_new(key, mode, *args, **kwargs):
+            if mode == AES.MODE_GCM:
+                calls.append(key)
+            return original(key, mode, *args, **kwargs)
+
+        monkeypatch.setattr(backends.AES, "new", counting_new)
+        assert keyring.decrypt(value) == b"hello"
+        assert calls == [bytes.fromhex(KEY3)]
+
+    def test_decrypt_legacy_format(self):
+        keyring = KeyRing([KEY1, KEY2])
+        assert keyring.decrypt(legacy_encrypt(KEY1, b"hello")) == b"hello"
+        assert keyring.decrypt(legacy_encrypt(KEY2, b"world")) == b"world"
+
+    def test_decrypt_legacy_nonce_looks_like_header(self):
+        """A legacy nonce that starts with our header is still decrypted."""
+        keyring = KeyRing([KEY1])
+        header = encryption.FORMAT_MAGIC + bytes([encryption.FORMAT_V1])
+        cipher = AES.new(bytes.fromhex(KEY1), AES.MODE_GCM, nonce=header + b"x" * 14)
+        cypher_text, tag = cipher.encrypt_and_digest(b"hello")
+        assert keyring.decrypt(cipher.nonce + tag + cypher_text) == b"hello"
+
+    def test_unknown_key(self):
+        value = KeyRing([KEY3]).encrypt(b"hello")
+        with pytest.raises(ValueError):
+            KeyRing([KEY1, KEY2]).decrypt(value)
+
+
+def test_keyring_reset_on_setting_changed(settings):
+    settings.FIELD_ENCRYPTION_KEYS = [KEY1]
+    keyring = get_keyring()
+    assert get_keyring() is keyring
+    assert get_keyring([KEY1]) is keyring
+    settings.FIELD_ENCRYPTION_KEYS = [KEY2, KEY1]
+    assert get_keyring() is not keyring
+    assert get_keyring().primary_key == bytes.fromhex(KEY2)
+
+
+def test_field_keyring(settings):
+    settings.FIELD_ENCRYPTION_KEYS = [KEY1]
+    field = fields.EncryptedCharField()
+    assert field.keyring is get_keyring()
+    assert field.keyring.primary_key == bytes.fromhex(KEY1)
+
+
+def test_rotation_reads_legacy_rows(settings, db):
+    """Rows stored in the legacy format are still readable, and re-saved in the
+    versioned format."""
+    settings.FIELD_ENCRYPTION_KEYS = [KEY1, KEY2]
+    models.EncryptedChar.objects.create(value="placeholder")
+    field = models.EncryptedChar._meta.get_field("value")
+    with connection.cursor() as cur:
+        cur.execute(
+            "UPDATE %s SET value = %%s" % models.EncryptedChar._meta.db_table,
+            [legacy_encrypt(KEY2, b"hello")],
+        )
+    obj = models.EncryptedChar.objects.get()
+    assert obj.value == "hello"
+    obj.save()
+    with connection.cursor() as cur:
+        cur.execute("SELECT value FROM %s" % models.EncryptedChar._meta.db_table)
+        value = bytes(cur.fetchone()[0])
+    assert value[:1] == encryption.FORMAT_MAGIC
+    assert field.decrypt(value) == "hello"
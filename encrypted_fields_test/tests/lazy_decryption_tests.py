@@ -0,0 +1,110 @@
+import datetime
+
+from django.db import connection, models as dj_models
+import pytest
+
+from encrypted_fields.fields import EncryptedValue
+from .. import models
+
+pytestmark = pytest.mark.django_db
+
+
+def raw_row(obj):
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT _email_data, email, _text_data, text FROM %s WHERE id = %%s"
+            % models.DemoModel._meta.db_table,
+            [obj.pk],
+        )
+        return tuple(
+            bytes(v) if isinstance(v, memoryview) else v for v in cur.fetchone()
+        )
+
+
+@pytest.fixture
+def demo():
+    return models.DemoModel.objects.create(
+        email="a@example.com",
+        name="Jo",
+        date=datetime.date(2020, 1, 1),
+        number=3,
+        text="some text",
+        info="info",
+    )
+
+
+def test_values_not_decrypted_until_read(demo):
+    obj = models.DemoModel.objects.defer_decryption().get(pk=demo.pk)
+    assert isinstance(obj.__dict__["_text_data"], EncryptedValue)
+    assert isinstance(obj.__dict__["info"], EncryptedValue)
+
+    assert obj.info == "info"
+    assert obj.__dict__["info"] == "info"
+    assert isinstance(obj.__dict__["_text_data"], EncryptedValue)
+
+
+def test_search_field(demo):
+    obj = models.DemoModel.objects.defer_decryption().get(email="a@example.com")
+    assert obj.email == "a@example.com"
+    assert obj.date == datetime.date(2020, 1, 1)
+    assert obj.number == 3
+
+
+def test_unread_values_saved_unchanged(demo):
+    before = raw_row(demo)
+    obj = models.DemoModel.objects.defer_decryption().get(pk=demo.pk)
+    obj.info = "changed"
+    obj.save()
+    assert raw_row(obj) == before
+
+    obj = models.DemoModel.objects.get(pk=demo.pk)
+    assert obj.info == "changed"
+    assert obj.text == "some text"
+
+
+def test_changed_values_saved(demo):
+    before = raw_row(demo)
+    obj = models.DemoModel.objects.defer_decryption().get(pk=demo.pk)
+    obj.text = "new text"
+    obj.save()
+    after = raw_row(obj)
+    assert after[:2] == before[:2]
+    assert after[2:] != before[2:]
+
+    obj = models.DemoModel.objects.get(text="new text")
+    assert obj._text_data == "new text"
+
+
+def test_refresh_from_db(demo):
+    obj = models.DemoModel.objects.defer_decryption().get(pk=demo.pk)
+    models.DemoModel.objects.filter(pk=demo.pk).update(info="updated")
+    obj.refresh_from_db()
+    assert obj.info == "updated"
+    assert obj.text == "some text"
+
+
+def test_deferred_fields(demo):
+    obj = models.DemoModel.objects.defer_decryption().only("id").get(pk=demo.pk)
+    assert obj.info == "info"
+    assert obj.email == "a@example.com"
+
+
+def test_annotations_decrypted(demo):
+    obj = (
+        models.DemoModel.objects.defer_decryption()
+        .annotate(info_copy=dj_models.F("info"))
+        .get(pk=demo.pk)
+    )
+    assert obj.info_copy == "info"
+
+
+def test_values_not_affected(demo):
+    qs = models.DemoModel.objects.defer_decryption()
+    assert list(qs.values_list("info", flat=True)) == ["info"]
+    with pytest.raises(TypeError):
+        models.DemoModel.objects.values("info").defer_decryption()
+
+
+def test_default_queryset_decrypts(demo):
+    obj = models.DemoModel.objects.get(pk=demo.pk)
+    assert obj.__dict__["info"] == "info"
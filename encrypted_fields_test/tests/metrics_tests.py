@@ -0,0 +1,110 @@
+import pytest
+
+from encrypted_fields import metrics
+from encrypted_fields.metrics import CryptoMetrics
+from encrypted_fields.query import EncryptedQuerySet
+from .. import models
+from .utils import KEY1, KEY2
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def enabled(settings):
+    settings.ENCRYPTED_FIELDS_METRICS = True
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def counts(kind):
+    return {key: value for key, value in metrics.snapshot()[kind].items()}
+
+
+def test_disabled_by_default(settings):
+    assert not metrics.is_enabled()
+    metrics.reset()
+    models.SearchChar.objects.create(search="foo")
+    assert models.SearchChar.objects.get(search="foo")
+    assert metrics.snapshot() == {"timers": {}, "counters": {}}
+
+
+def test_enable_disable(settings):
+    settings.ENCRYPTED_FIELDS_METRICS = False
+    metrics.enable()
+    assert metrics.is_enabled()
+    metrics.disable()
+    assert not metrics.is_enabled()
+
+
+def test_encrypt_decrypt_hash(enabled):
+    models.SearchChar.objects.create(search="foo")
+    models.SearchChar.objects.get(search="foo").search
+    timers = metrics.snapshot()["timers"]
+    label = "encrypted_fields_test.SearchChar"
+    assert timers["encrypt", label, "value"]["count"] == 1
+    assert timers["decrypt", label, "value"]["count"] == 1
+    # saving and the lookup
+    assert timers["hash", label, "search"]["count"] == 2
+    timer = timers["encrypt", label, "value"]
+    assert timer["sum"] > 0
+    assert list(timer["buckets"])[-1] == float("inf")
+    assert timer["buckets"][float("inf")] == 1
+
+
+def test_bulk_operations(enabled):
+    EncryptedQuerySet(models.SearchChar).bulk_create(
+        [models.SearchChar(search=value) for value in ["a", "b", "a"]]
+    )
+    timers = metrics.snapshot()["timers"]
+    label = "encrypted_fields_test.SearchChar"
+    assert timers["encrypt", label, "value"]["count"] == 3
+    assert timers["hash", label, "search"]["count"] == 2  # distinct values
+
+
+def test_fallback_key(enabled, settings):
+    settings.FIELD_ENCRYPTION_KEYS = [KEY2]
+    models.EncryptedChar.objects.create(value="old")
+    settings.FIELD_ENCRYPTION_KEYS = [KEY1, KEY2]
+    models.EncryptedChar.objects.create(value="new")
+    metrics.reset()
+    assert sorted(models.EncryptedChar.objects.values_list("value", flat=True)) == [
+        "new",
+        "old",
+    ]
+    assert counts("counters") == {
+        ("fallback_key", "encrypted_fields_test.EncryptedChar", "value"): 1
+    }
+
+
+def test_refresh_from_db(enabled):
+    models.SearchChar.objects.create(search="foo")
+    metrics.reset()
+    models.SearchChar.objects.only("search").get().search
+    models.SearchChar.objects.only("id").get().value
+    assert counts("counters") == {
+        ("refresh_from_db", "encrypted_fields_test.SearchChar", "search"): 1,
+        ("refresh_from_db", "encrypted_fields_test.SearchChar", "value"): 1,
+    }
+
+
+def test_export_text():
+    registry = CryptoMetrics(buckets=[0.001, 0.01])
+    field = models.SearchChar._meta.get_field("value")
+    registry.observe("decrypt", field, 0.002)
+    registry.observe("decrypt", field, 0.0005)
+    registry.increment("fallback_key", field, 2)
+    labels = 'model="encrypted_fields_test.SearchChar",field="value"'
+    assert registry.export_text().splitlines()[2:] == [
+        f'encrypted_fields_operation_seconds_bucket{{operation="decrypt",{labels},le="0.001"}} 1',
+        f'encrypted_fields_operation_seconds_bucket{{operation="decrypt",{labels},le="0.01"}} 2',
+        f'encrypted_fields_operation_seconds_bucket{{operation="decrypt",{labels},le="+Inf"}} 2',
+        f'encrypted_fields_operation_seconds_sum{{operation="decrypt",{labels}}} 0.0025',
+        f'encrypted_fields_operation_seconds_count{{operation="decrypt",{labels}}} 2',
+        "# HELP encrypted_fields_events_total "
+        "Decryptions with a fallback key and deferred field loads.",
+        "# TYPE encrypted_fields_events_total counter",
+        f'encrypted_fields_events_total{{event="fallback_key",{labels}}} 2',
+    ]
+    registry.reset()
+    assert registry.snapshot() == {"timers": {}, "counters": {}}
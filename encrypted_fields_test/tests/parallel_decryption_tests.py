@@ -0,0 +1,142 @@
+import datetime
+import threading
+
+import pytest
+
+from encrypted_fields import query
+from encrypted_fields.fields import EncryptedFieldMixin, EncryptedValue
+from encrypted_fields.query import _decrypt_values, _values_to_decrypt
+from .. import models
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def demos():
+    return [
+        models.DemoModel.objects.create(
+            email=f"{i}@example.com",
+            name=f"name {i}",
+            date=datetime.date(2020, 1, i + 1),
+            number=i,
+            text=f"text {i}",
+            info="info",
+        )
+        for i in range(7)
+    ]
+
+
+def test_parallel_iterator(demos):
+    qs = models.DemoModel.objects.order_by("pk")
+    found = list(qs.parallel_iterator(workers=2, chunk_size=2))
+
+    assert [o.pk for o in found] == [o.pk for o in demos]
+    for obj, expected in zip(found, qs):
+        assert not any(isinstance(v, EncryptedValue) for v in obj.__dict__.values())
+        assert obj.email == expected.email
+        assert obj.date == expected.date
+        assert obj.number == expected.number
+        assert obj.created_at == expected.created_at
+
+
+def test_parallel_iterator_filtered(demos):
+    qs = models.DemoModel.objects.filter(email="3@example.com")
+    found = list(qs.parallel_iterator(workers=1))
+
+    assert len(found) == 1
+    assert found[0].name == "name 3"
+
+
+@pytest.fixture
+def memoryview_ciphertexts(monkeypatch):
+    """Load ciphertexts as memoryviews, as psycopg2 does for bytea columns."""
+    from_db_value = EncryptedFieldMixin.from_db_value
+
+    def memoryview_from_db_value(self, value, expression, connection):
+        if value is not None:
+            value = memoryview(bytes(value))
+        return from_db_value(self, value, expression, connection)
+
+    monkeypatch.setattr(EncryptedFieldMixin, "from_db_value", memoryview_from_db_value)
+
+
+def test_parallel_iterator_memoryview_ciphertexts(demos, memoryview_ciphertexts):
+    qs = models.DemoModel.objects.order_by("pk")
+    found = list(qs.parallel_iterator(workers=2, chunk_size=3))
+
+    assert [o.email for o in found] == [o.email for o in demos]
+    assert [o.date for o in found] == [o.date for o in demos]
+
+
+def test_parallel_iterator_empty():
+    assert list(models.DemoModel.objects.parallel_iterator(workers=1)) == []
+
+
+def collect(queryset, limit=None, **kwargs):
+    """Run queryset.parallel_aiterator() on an event loop, returning the instances
+    and the id of the event loop's thread. Skips the test where asgiref isn't
+    installed (Django < 3.0)."""
+    async_to_sync = pytest.importorskip("asgiref.sync").async_to_sync
+
+    async def run():
+        found = []
+        async for obj in queryset.parallel_aiterator(**kwargs):
+            found.append(obj)
+            if len(found) == limit:
+                break
+        return found, threading.get_ident()
+
+    return async_to_sync(run)()
+
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_parallel_aiterator(demos, processes):
+    qs = models.DemoModel.objects.order_by("pk")
+    found, _ = collect(qs, workers=2, chunk_size=2, processes=processes)
+
+    assert [o.pk for o in found] == [o.pk for o in demos]
+    for obj, expected in zip(found, qs):
+        assert not any(isinstance(v, EncryptedValue) for v in obj.__dict__.values())
+        assert obj.email == expected.email
+        assert obj.date == expected.date
+
+
+def test_parallel_aiterator_off_the_event_loop(demos, monkeypatch):
+    threads = []
+
+    def decrypt_values(values):
+        threads.append(threading.get_ident())
+        return _decrypt_values(values)
+
+    monkeypatch.setattr(query, "_decrypt_values", decrypt_values)
+    qs = models.DemoModel.objects.filter(email="3@example.com")
+    found, loop_thread = collect(qs, workers=1)
+
+    assert [obj.name for obj in found] == ["name 3"]
+    assert threads and loop_thread not in threads
+
+
+def test_parallel_aiterator_backpressure(demos, monkeypatch):
+    chunks = []
+
+    def values_to_decrypt(chunk):
+        chunks.append(chunk)
+        return _values_to_decrypt(chunk)
+
+    monkeypatch.setattr(query, "_values_to_decrypt", values_to_decrypt)
+    found, _ = collect(models.DemoModel.objects.all(), 1, workers=1, chunk_size=1)
+
+    assert len(found) == 1
+    # the consumer stopped after the first instance, so few chunks were fetched
+    assert len(chunks) == 2
+
+
+def test_parallel_aiterator_memoryview_ciphertexts(demos, memoryview_ciphertexts):
+    qs = models.DemoModel.objects.order_by("pk")
+    found, _ = collect(qs, workers=2, chunk_size=3, processes=True)
+
+    assert [o.email for o in found] == [o.email for o in demos]
+
+
+def test_parallel_aiterator_empty():
+    assert collect(models.DemoModel.objects.all(), workers=1)[0] == []
@@ -0,0 +1,176 @@
+from django.core.exceptions import FieldError, ImproperlyConfigured
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import pytest
+
+from encrypted_fields import fields
+from encrypted_fields.models import PrefixSearchHash
+from encrypted_fields.query import EncryptedQuerySet
+from .. import models
+
+pytestmark = pytest.mark.django_db
+
+NAMES = ["Jo", "Joanna", "JOHN", "Bob", "Ｊｏｓｅ"]
+
+
+@pytest.fixture
+def people():
+    return [models.SearchPrefix.objects.create(value=name) for name in NAMES]
+
+
+def names(queryset):
+    return sorted(obj.value for obj in queryset)
+
+
+def test_startswith(people):
+    assert names(models.SearchPrefix.objects.filter(prefix__startswith="jo")) == [
+        "JOHN",
+        "Jo",
+        "Joanna",
+        "Ｊｏｓｅ",  # NFKC normalized
+    ]
+    assert names(models.SearchPrefix.objects.filter(prefix__istartswith="JOA")) == [
+        "Joanna"
+    ]
+    assert names(models.SearchPrefix.objects.filter(prefix__startswith=" b ")) == [
+        "Bob"
+    ]
+    assert not models.SearchPrefix.objects.filter(prefix__startswith="x").exists()
+    assert names(models.SearchPrefix.objects.exclude(prefix__startswith="jo")) == [
+        "Bob"
+    ]
+
+
+def test_indexed_subquery(people):
+    with CaptureQueriesContext(connection) as queries:
+        list(models.SearchPrefix.objects.filter(prefix__startswith="jo"))
+    sql = queries[0]["sql"]
+    assert " IN (SELECT " in sql
+    assert PrefixSearchHash._meta.db_table in sql
+
+
+def test_stored_prefixes(people):
+    rows = PrefixSearchHash.objects.filter(object_id=people[1].pk)
+    assert rows.filter(field="encrypted_fields_test.SearchPrefix.prefix").count() == 5
+    assert all(len(row.hash) == 16 for row in rows)
+    # min_prefix_length=2 and no value
+    assert not rows.filter(field="encrypted_fields_test.SearchPrefix.prefix_2")
+
+
+def test_prefix_length_limits(people):
+    with pytest.raises(FieldError, match="at least 1 characters"):
+        models.SearchPrefix.objects.filter(prefix__startswith="")
+    with pytest.raises(FieldError, match="at least 2 characters"):
+        models.SearchPrefix.objects.filter(prefix_2__startswith="J")
+
+
+def test_long_prefixes(people):
+    models.SearchPrefix.objects.create(value="Joannes")
+    # looked up by their first 5 characters, and checked in python
+    queryset = models.SearchPrefix.objects.filter(prefix__startswith="JOANNA")
+    with CaptureQueriesContext(connection) as queries:
+        assert names(queryset) == ["Joanna"]
+    assert len(queries) == 1
+    assert names(queryset.filter(prefix__startswith="joann")) == ["Joanna"]
+    # slices are taken after filtering
+    queryset = models.SearchPrefix.objects.filter(prefix__startswith="joanne")
+    assert names(queryset.order_by("pk")[:1]) == ["Joannes"]
+    assert not models.SearchPrefix.objects.filter(prefix__startswith="joanx")
+    with pytest.raises(FieldError):
+        list(models.SearchPrefix.objects.exclude(prefix__startswith="joanna"))
+    with pytest.raises(FieldError):
+        models.SearchPrefix.objects.filter(prefix__startswith="joanna").count()
+
+
+def test_case_sensitive():
+    models.SearchPrefix.objects.create(value_2="Alice")
+    models.SearchPrefix.objects.create(value_2="alice")
+    queryset = models.SearchPrefix.objects.filter(prefix_2__startswith="Al")
+    assert [obj.value_2 for obj in queryset] == ["Alice"]
+    with pytest.raises(FieldError):
+        models.SearchPrefix.objects.filter(prefix_2__istartswith="Al")
+
+
+def test_save_and_delete(people, django_assert_num_queries):
+    obj = people[3]
+    obj.value = "Jolene"
+    obj.save()
+    assert names(models.SearchPrefix.objects.filter(prefix__startswith="jol")) == [
+        "Jolene"
+    ]
+    assert not models.SearchPrefix.objects.filter(prefix__startswith="bo").exists()
+    # unchanged values are not rehashed
+    obj = models.SearchPrefix.objects.create(value="Al", value_2="Alice")
+    for queryset in [
+        models.SearchPrefix.objects.defer_decryption(),
+        models.SearchPrefix.objects.all(),
+    ]:
+        obj = queryset.get(pk=obj.pk)
+        with django_assert_num_queries(1):
+            obj.save()
+    # nor are those whose first max_prefix_length characters are unchanged
+    obj.value = "al"
+    obj.value_2 = "Alice "
+    with django_assert_num_queries(1):
+        obj.save()
+    obj.value = "Bo"
+    # only prefix is rewritten, in a savepoint
+    with django_assert_num_queries(5):
+        obj.save()
+    with django_assert_num_queries(1):
+        obj.save()
+    assert names(models.SearchPrefix.objects.filter(prefix__startswith="bo")) == ["Bo"]
+    with django_assert_num_queries(1):
+        obj.save(update_fields=["value_2"])
+    obj.value_2 = None
+    with django_assert_num_queries(2):  # and no prefixes to insert
+        obj.save()
+    obj.delete()
+    assert not PrefixSearchHash.objects.filter(object_id=obj.pk).exists()
+
+
+def test_update_prefixes():
+    EncryptedQuerySet(models.SearchPrefix).bulk_create(
+        [models.SearchPrefix(value=name) for name in NAMES]
+    )
+    assert not PrefixSearchHash.objects.exists()
+    field = models.SearchPrefix._meta.get_field("prefix")
+    field.update_prefixes(models.SearchPrefix.objects.all(), batch_size=2)
+    assert names(models.SearchPrefix.objects.filter(prefix__startswith="jo")) == [
+        "JOHN",
+        "Jo",
+        "Joanna",
+        "Ｊｏｓｅ",
+    ]
+
+
+def test_unsupported_lookups():
+    with pytest.raises(FieldError):
+        models.SearchPrefix.objects.filter(prefix="Jo")
+
+
+def test_no_column():
+    field = models.SearchPrefix._meta.get_field("prefix")
+    assert not field.concrete
+    assert field not in models.SearchPrefix._meta.concrete_fields
+    _, _, _, kwargs = field.deconstruct()
+    assert kwargs == {
+        "hash_key": "abc123",
+        "encrypted_field_name": "value",
+        "max_prefix_length": 5,
+    }
+    assert field.check() == []
+
+
+def test_invalid_options():
+    with pytest.raises(ImproperlyConfigured):
+        fields.PrefixSearchField(
+            hash_key="abc", encrypted_field_name="value", min_prefix_length=0
+        )
+    with pytest.raises(ImproperlyConfigured):
+        fields.PrefixSearchField(
+            hash_key="abc",
+            encrypted_field_name="value",
+            min_prefix_length=4,
+            max_prefix_length=3,
+        )
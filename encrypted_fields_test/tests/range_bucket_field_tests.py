@@ -0,0 +1,193 @@
+import datetime
+
+from django.core.exceptions import FieldError, ImproperlyConfigured
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import pytest
+
+from encrypted_fields import fields
+from encrypted_fields.fields import EncryptedValue
+from .. import models
+
+pytestmark = pytest.mark.django_db
+
+AGES = [None, 5, 17, 18, 29, 30, 45, 64, 65, 130]
+
+
+@pytest.fixture
+def people():
+    return [models.SearchRange.objects.create(age=age) for age in AGES]
+
+
+def ages(queryset):
+    return sorted(obj.age for obj in queryset)
+
+
+@pytest.mark.parametrize(
+    "lookup,expected",
+    [
+        ({"age_bucket__gte": 18}, [18, 29, 30, 45, 64, 65, 130]),
+        ({"age_bucket__gt": 17}, [18, 29, 30, 45, 64, 65, 130]),
+        ({"age_bucket__lt": 18}, [5, 17]),
+        ({"age_bucket__lte": 30}, [5, 17, 18, 29, 30]),
+        ({"age_bucket__range": (18, 64)}, [18, 29, 30, 45, 64]),
+        ({"age_bucket__range": (20, 39)}, [29, 30]),
+        ({"age_bucket__gte": 125}, [130]),
+        ({"age_bucket__range": (50, 40)}, []),
+        ({"age_bucket__range": (18, 64), "age_bucket__lt": 60}, [18, 29, 30, 45]),
+    ],
+)
+def test_lookups(people, lookup, expected):
+    assert ages(models.SearchRange.objects.filter(**lookup)) == expected
+    assert ages(models.SearchRange.objects.filter(**lookup).iterator(2)) == expected
+
+
+def test_indexed_in(people):
+    with CaptureQueriesContext(connection) as queries:
+        list(models.SearchRange.objects.filter(age_bucket__range=(18, 64)))
+    assert len(queries) == 1
+    sql = queries[0]["sql"]
+    assert '"age_bucket" IN (X' in sql
+    assert sql.count("X'") == 6
+
+
+def test_only_boundary_buckets_decrypted(people):
+    queryset = models.SearchRange.objects.defer_decryption()
+    found = list(queryset.filter(age_bucket__range=(18, 64)).order_by("pk"))
+    assert [obj.__dict__["age"] for obj in (found[0], found[-1])] == [18, 64]
+    # 29, 30 and 45 are in buckets wholly in the range
+    assert all(isinstance(obj.__dict__["age"], EncryptedValue) for obj in found[1:-1])
+    assert [obj.age for obj in found] == [18, 29, 30, 45, 64]
+
+
+def test_bucket_aligned_lookups(people):
+    """A range starting and ending on the edges of buckets is exact in SQL."""
+    queryset = models.SearchRange.objects.filter(age_bucket__range=(10, 39))
+    assert queryset.count() == 4
+    assert sorted(queryset.values_list("age", flat=True)) == [17, 18, 29, 30]
+    assert models.SearchRange.objects.filter(age_bucket__gte=30).count() == 5
+
+
+def test_slices_and_get(people):
+    queryset = models.SearchRange.objects.filter(age_bucket__gte=18).order_by("pk")
+    assert [obj.age for obj in queryset[1:3]] == [29, 30]
+    assert queryset.first().age == 18
+    assert models.SearchRange.objects.get(age_bucket__range=(60, 64)).age == 64
+
+
+def test_unsupported_queries(people):
+    queryset = models.SearchRange.objects.filter(age_bucket__gte=18)
+    for query in [
+        queryset.count,
+        queryset.exists,
+        queryset.values("age").__iter__,
+        lambda: queryset.update(age=1),
+        lambda: list(models.SearchRange.objects.exclude(age_bucket__gte=18)),
+        lambda: list(
+            models.SearchRange.objects.filter(Q(age_bucket__gte=18) | Q(pk=1))
+        ),
+        lambda: list(models.SearchRange.objects.filter(pk__in=queryset)),
+    ]:
+        with pytest.raises(FieldError):
+            query()
+    with pytest.raises(ValueError):
+        models.SearchRange.objects.filter(age_bucket__gte=None)
+    with pytest.raises(FieldError):
+        models.SearchRange.objects.filter(age_bucket=18)
+
+
+def test_dates():
+    for born in ["1999-12-31", "2000-01-10", "2000-01-15", "2000-02-01", "2101-01-01"]:
+        models.SearchRange.objects.create(born=born)
+    queryset = models.SearchRange.objects.filter(
+        born_bucket__gte=datetime.date(2000, 1, 15)
+    )
+    assert sorted(str(obj.born) for obj in queryset) == [
+        "2000-01-15",
+        "2000-02-01",
+        "2101-01-01",
+    ]
+    queryset = models.SearchRange.objects.filter(born_bucket__lt="2000-02-01")
+    assert queryset.count() == 3  # month aligned
+    assert models.SearchRange.objects.filter(born_bucket__gte="2000-02-01").count() == 2
+
+
+def test_datetimes():
+    utc = datetime.timezone.utc
+    for day in [1, 2, 3]:
+        models.SearchRange.objects.create(
+            created=datetime.datetime(2021, 3, day, 12, tzinfo=utc)
+        )
+    queryset = models.SearchRange.objects.filter(
+        created_bucket__gt=datetime.datetime(2021, 3, 2, 12, tzinfo=utc)
+    )
+    assert [obj.created.day for obj in queryset] == [3]
+    queryset = models.SearchRange.objects.filter(
+        created_bucket__range=(
+            datetime.datetime(2021, 3, 2, tzinfo=utc),
+            datetime.datetime(2021, 3, 3, 13, tzinfo=utc),
+        )
+    )
+    assert sorted(obj.created.day for obj in queryset) == [2, 3]
+    # midnight UTC is on the edge of a bucket
+    midnight = timezone.make_aware(datetime.datetime(2021, 3, 2), utc)
+    assert models.SearchRange.objects.filter(created_bucket__gte=midnight).count() == 2
+
+
+def test_save_and_bulk_create(people):
+    obj = people[1]
+    obj.age = 50
+    obj.save()
+    assert ages(models.SearchRange.objects.filter(age_bucket__range=(50, 55))) == [50]
+    models.SearchRange.objects.bulk_create([models.SearchRange(age=52)])
+    assert ages(models.SearchRange.objects.filter(age_bucket__range=(50, 55))) == [
+        50,
+        52,
+    ]
+    # the stored hash is kept when the value wasn't read
+    obj = models.SearchRange.objects.defer_decryption().get(pk=obj.pk)
+    obj.save()
+    assert isinstance(obj.__dict__["age"], EncryptedValue)
+    assert ages(models.SearchRange.objects.filter(age_bucket__range=(50, 55))) == [
+        50,
+        52,
+    ]
+    obj.age = None
+    obj.save()
+    assert models.SearchRange.objects.get(pk=obj.pk).age_bucket is None
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"bucket_size": 0, "min_value": 0, "max_value": 10},
+        {"bucket_size": "week", "min_value": 0, "max_value": 10},
+        {"bucket_size": 10, "min_value": 10, "max_value": 0},
+        {"bucket_size": 10, "min_value": 0.0, "max_value": 10},
+        {"bucket_size": 1, "min_value": 0, "max_value": 100000},
+        {
+            "bucket_size": "day",
+            "min_value": datetime.datetime(2020, 1, 1),
+            "max_value": datetime.date(2021, 1, 1),
+        },
+    ],
+)
+def test_invalid_options(kwargs):
+    with pytest.raises(ImproperlyConfigured):
+        fields.RangeBucketField(hash_key="abc", encrypted_field_name="value", **kwargs)
+
+
+def test_checks():
+    assert models.SearchRange._meta.get_field("born_bucket").check() == []
+    field = fields.RangeBucketField(
+        hash_key="abc",
+        encrypted_field_name="age",
+        bucket_size="day",
+        min_value=datetime.date(2020, 1, 1),
+        max_value=datetime.date(2021, 1, 1),
+    )
+    field.set_attributes_from_name("bucket")
+    field.model = models.SearchRange
+    assert [error.id for error in field.check()] == ["encrypted_fields.E003"]
@@ -0,0 +1,183 @@
+import datetime
+import threading
+
+import pytest
+
+from encrypted_fields import repair
+from encrypted_fields.encryption import get_keyring
+from encrypted_fields.repair import ReadRepairQueue
+from .. import models
+from .utils import KEY1, KEY2, raw_values
+
+pytestmark = pytest.mark.django_db
+
+
+def pending():
+    return sorted(
+        (model.__name__, database, pk, sorted(attnames))
+        for model, database, pk, attnames in repair.pending()
+    )
+
+
+@pytest.fixture
+def enabled(settings):
+    settings.FIELD_ENCRYPTION_READ_REPAIR_INTERVAL = None
+    settings.FIELD_ENCRYPTION_READ_REPAIR = True
+    repair.clear()
+    yield
+    repair.clear()
+
+
+@pytest.fixture
+def old_key_rows(settings):
+    settings.FIELD_ENCRYPTION_KEYS = [KEY2]
+    rows = [
+        models.SearchKeyedHash.objects.create(search=f"value {i}", search_2=None)
+        for i in range(3)
+    ]
+    settings.FIELD_ENCRYPTION_KEYS = [KEY1, KEY2]
+    return rows
+
+
+def test_disabled_by_default(old_key_rows):
+    assert not repair.is_enabled()
+    assert len(list(models.SearchKeyedHash.objects.all())) == 3
+    assert repair.pending() == []
+
+
+def test_read_repair(enabled, old_key_rows):
+    obj = models.SearchKeyedHash.objects.create(search="new", search_2=None)
+    hashes = raw_values(models.SearchKeyedHash, "search")
+
+    found = list(models.SearchKeyedHash.objects.order_by("pk"))
+    # values are still decrypted as the instances are loaded
+    assert [o.__dict__["value"] for o in found] == [
+        "value 0",
+        "value 1",
+        "value 2",
+        "new",
+    ]
+
+    # the row using the first key isn't queued
+    assert pending() == [
+        ("SearchKeyedHash", "default", row.pk, ["value"]) for row in old_key_rows
+    ]
+    assert repair.flush() == 3
+    assert repair.pending() == []
+    keyring = get_keyring()
+    assert all(
+        map(keyring.uses_primary_key, raw_values(models.SearchKeyedHash, "value"))
+    )
+    assert raw_values(models.SearchKeyedHash, "search") == hashes
+    assert models.SearchKeyedHash.objects.get(search="value 1").value == "value 1"
+    assert models.SearchKeyedHash.objects.get(pk=obj.pk).value == "new"
+    assert repair.pending() == []
+
+
+def test_values_are_not_queued(enabled, old_key_rows):
+    assert len(models.SearchKeyedHash.objects.values_list("value", flat=True)) == 3
+    assert repair.pending() == []
+
+
+def test_deferred_decryption(enabled, settings):
+    settings.FIELD_ENCRYPTION_KEYS = [KEY2]
+    obj = models.DemoModel.objects.create(
+        email="a@example.com",
+        name="a",
+        date=datetime.date(2020, 1, 1),
+        number=1,
+        text="text",
+        info="info",
+    )
+    settings.FIELD_ENCRYPTION_KEYS = [KEY1, KEY2]
+
+    found = models.DemoModel.objects.defer_decryption().get()
+    assert repair.pending() == []
+    assert found.email == "a@example.com"
+    assert found.name == "a"
+    assert pending() == [
+        ("DemoModel", "default", obj.pk, ["_email_data", "_name_data"])
+    ]
+
+    assert repair.flush() == 1
+    # every value of the row's queued fields is re-encrypted
+    keyring = get_keyring()
+    assert keyring.uses_primary_key(raw_values(models.DemoModel, "_name_data")[0])
+    assert not keyring.uses_primary_key(raw_values(models.DemoModel, "_text_data")[0])
+    found = models.DemoModel.objects.get()
+    assert (found.email, found.name, found.text) == ("a@example.com", "a", "text")
+
+
+def test_parallel_iterator(enabled, settings):
+    settings.FIELD_ENCRYPTION_KEYS = [KEY2]
+    obj = models.SearchKeyedHash.objects.create(search="a", search_2=None)
+    settings.FIELD_ENCRYPTION_KEYS = [KEY1, KEY2]
+
+    found = list(models.SearchKeyedHash.objects.parallel_iterator(workers=1))
+
+    assert found[0].value == "a"
+    assert pending() == [("SearchKeyedHash", "default", obj.pk, ["value"])]
+
+
+def test_saved_values_are_not_overwritten(enabled, old_key_rows):
+    obj = models.SearchKeyedHash.objects.get(pk=old_key_rows[0].pk)
+    obj.search = "changed"
+    obj.save()
+
+    assert repair.flush() == 0
+    assert models.SearchKeyedHash.objects.get(pk=obj.pk).value == "changed"
+
+
+def test_disable(enabled, old_key_rows):
+    repair.disable()
+    try:
+        list(models.SearchKeyedHash.objects.all())
+        assert repair.pending() == []
+    finally:
+        repair.enable()
+
+
+def test_max_size(old_key_rows):
+    queue = ReadRepairQueue(interval=None, max_size=2)
+    field = models.SearchKeyedHash._meta.get_field("value")
+    for row in old_key_rows:
+        queue.add(field, "default", row.pk)
+    queue.add(field, "default", old_key_rows[0].pk)
+    assert [pk for _, _, pk, _ in queue.pending()] == [
+        old_key_rows[0].pk,
+        old_key_rows[1].pk,
+    ]
+
+
+def test_background_flush(monkeypatch):
+    flushed = threading.Event()
+    calls = []
+
+    def repair_rows(model, database, pks, attnames):
+        calls.append((model, database, pks, attnames))
+        flushed.set()
+        return len(pks)
+
+    monkeypatch.setattr(repair, "repair_rows", repair_rows)
+    queue = ReadRepairQueue(interval=60, batch_size=2)
+    field = models.SearchKeyedHash._meta.get_field("value")
+    queue.add(field, "default", 1)
+    thread = queue._thread
+    assert thread.is_alive()
+    assert not flushed.wait(0.1)
+    # a full batch wakes the flusher up
+    queue.add(field, "default", 2)
+
+    assert flushed.wait(5)
+    assert calls == [(models.SearchKeyedHash, "default", [1, 2], ["value"])]
+    # and stops once the queue is empty
+    thread.join(5)
+    assert not thread.is_alive() and queue._thread is None
+
+
+def test_plain_querysets_are_not_queued(enabled, settings):
+    settings.FIELD_ENCRYPTION_KEYS = [KEY2]
+    models.SearchChar.objects.create(search="a")
+    settings.FIELD_ENCRYPTION_KEYS = [KEY1, KEY2]
+    assert models.SearchChar.objects.get().value == "a"
+    assert repair.pending() == []
@@ -0,0 +1,148 @@
+import json
+from io import StringIO
+
+from django.core.management import call_command
+import pytest
+
+from encrypted_fields.encryption import get_keyring
+from encrypted_fields.fields import EncryptedFieldMixin
+from .. import models
+from .utils import KEY1, KEY2, raw_values
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def old_key_rows(settings):
+    settings.FIELD_ENCRYPTION_KEYS = [KEY2]
+    for i in range(5):
+        models.SearchChar.objects.create(search=f"value {i}")
+    models.EncryptedNullable.objects.create(value=None)
+    models.EncryptedNullable.objects.create(value=3)
+    settings.FIELD_ENCRYPTION_KEYS = [KEY1, KEY2]
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    return str(tmp_path / "checkpoint.json")
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_rotate(old_key_rows, checkpoint, workers):
+    keyring = get_keyring()
+    hashes = raw_values(models.SearchChar, "search")
+    assert not any(
+        map(keyring.uses_primary_key, raw_values(models.SearchChar, "value"))
+    )
+
+    call_command(
+        "rotate_encryption_keys",
+        "encrypted_fields_test",
+        chunk_size=2,
+        workers=workers,
+        checkpoint=checkpoint,
+        verbosity=0,
+    )
+
+    assert all(map(keyring.uses_primary_key, raw_values(models.SearchChar, "value")))
+    # SearchFields are not rehashed
+    assert raw_values(models.SearchChar, "search") == hashes
+    values = raw_values(models.EncryptedNullable, "value")
+    assert values[0] is None
+    assert keyring.uses_primary_key(values[1])
+    assert [o.search for o in models.SearchChar.objects.order_by("id")] == [
+        f"value {i}" for i in range(5)
+    ]
+    assert models.EncryptedNullable.objects.get(value__isnull=False).value == 3
+
+
+def test_rotate_memoryview_ciphertexts(old_key_rows, checkpoint, monkeypatch):
+    # psycopg2 loads bytea columns as memoryviews, which can't be pickled.
+    from_db_value = EncryptedFieldMixin.from_db_value
+
+    def memoryview_from_db_value(self, value, expression, connection):
+        if value is not None:
+            value = memoryview(bytes(value))
+        return from_db_value(self, value, expression, connection)
+
+    monkeypatch.setattr(EncryptedFieldMixin, "from_db_value", memoryview_from_db_value)
+
+    call_command(
+        "rotate_encryption_keys",
+        "encrypted_fields_test.SearchChar",
+        workers=2,
+        checkpoint=checkpoint,
+        verbosity=0,
+    )
+
+    keyring = get_keyring()
+    assert all(map(keyring.uses_primary_key, raw_values(models.SearchChar, "value")))
+    assert models.SearchChar.objects.get(search="value 3").value == "value 3"
+
+
+def test_rows_using_primary_key_not_updated(old_key_rows, checkpoint):
+    obj = models.SearchChar.objects.first()
+    obj.save()
+    before = raw_values(models.SearchChar, "value")[0]
+    call_command(
+        "rotate_encryption_keys",
+        "encrypted_fields_test.SearchChar",
+        checkpoint=checkpoint,
+        verbosity=0,
+    )
+    assert raw_values(models.SearchChar, "value")[0] == before
+
+
+def write_checkpoint(checkpoint, primary_key_id, last_pk):
+    with open(checkpoint, "w") as f:
+        json.dump(
+            {
+                "primary_key_id": primary_key_id.hex(),
+                "models": {"encrypted_fields_test.SearchChar": last_pk},
+            },
+            f,
+        )
+
+
+def test_resume_from_checkpoint(old_key_rows, checkpoint):
+    keyring = get_keyring()
+    pks = list(models.SearchChar.objects.order_by("pk").values_list("pk", flat=True))
+    write_checkpoint(checkpoint, keyring.primary_key_id, pks[2])
+
+    call_command(
+        "rotate_encryption_keys",
+        "encrypted_fields_test.SearchChar",
+        checkpoint=checkpoint,
+        verbosity=0,
+    )
+
+    rotated = list(
+        map(keyring.uses_primary_key, raw_values(models.SearchChar, "value"))
+    )
+    assert rotated == [False, False, False, True, True]
+    # Checkpoint is removed when the rotation is complete
+    with pytest.raises(FileNotFoundError):
+        open(checkpoint)
+
+
+@pytest.mark.parametrize("saved", ["other key", "old format"])
+def test_checkpoint_of_another_key_ignored(old_key_rows, checkpoint, saved):
+    keyring = get_keyring()
+    pks = list(models.SearchChar.objects.order_by("pk").values_list("pk", flat=True))
+    if saved == "old format":
+        with open(checkpoint, "w") as f:
+            json.dump({"encrypted_fields_test.SearchChar": pks[2]}, f)
+    else:
+        # saved while KEY2 was the first key, so the rows up to pks[2] use KEY2
+        write_checkpoint(checkpoint, get_keyring([KEY2]).primary_key_id, pks[2])
+    out = StringIO()
+
+    call_command(
+        "rotate_encryption_keys",
+        "encrypted_fields_test.SearchChar",
+        checkpoint=checkpoint,
+        stdout=out,
+    )
+
+    assert "Ignoring checkpoint" in out.getvalue()
+    assert all(map(keyring.uses_primary_key, raw_values(models.SearchChar, "value")))
@@ -1,5 +1,7 @@
 from datetime import timedelta
 import datetime
+import hashlib
+import hmac
 import os
 
 import pytest
@@ -21,11 +23,15 @@ from django.contrib.auth import get_user_model
 from django.test import Client
 
 from encrypted_fields import fields
-from encrypted_fields.fields import is_hashed_already
+from encrypted_fields.fields import (
+    clear_search_hash_cache,
+    get_search_hash_cache,
+    is_hashed_already,
+)
+from encrypted_fields.query import EncryptedQuerySet
 
 from .. import models
 
-
 pytestmark = pytest.mark.django_db
 
 User = get_user_model()
@@ -87,6 +93,177 @@ def test_is_hashed_already(value, result):
     assert outcome == result
 
 
+class TestHashAlgorithm:
+    @pytest.mark.parametrize(
+        "algorithm,expected",
+        [
+            ("sha256", "xx" + hashlib.sha256(b"fooabc123").hexdigest()),
+            (
+                "hmac-sha256",
+                "xh" + hmac.new(b"abc123", b"foo", hashlib.sha256).hexdigest(),
+            ),
+            (
+                "blake2b",
+                "xb"
+                + hashlib.blake2b(b"foo", key=b"abc123", digest_size=32).hexdigest(),
+            ),
+        ],
+    )
+    def test_algorithm(self, algorithm, expected):
+        f = fields.SearchField(
+            hash_key="abc123", encrypted_field_name="v", algorithm=algorithm
+        )
+        assert f.get_prep_value("foo") == expected
+        assert f.get_db_prep_save("foo", connection) == expected
+        assert f.hash_many(["foo"]) == [expected]
+        assert is_hashed_already(expected)
+        # keyed state is reused between values
+        assert f.get_prep_value("bar") != expected
+
+    def test_invalid_algorithm(self):
+        with pytest.raises(ImproperlyConfigured):
+            fields.SearchField(hash_key="a", encrypted_field_name="v", algorithm="md5")
+        with pytest.raises(ImproperlyConfigured):
+            fields.SearchField(
+                hash_key="a" * 65, encrypted_field_name="v", algorithm="blake2b"
+            )
+
+    def test_deconstruct(self):
+        f = fields.SearchField(hash_key="a", encrypted_field_name="v")
+        assert "algorithm" not in f.deconstruct()[3]
+        f = fields.SearchField(
+            hash_key="a", encrypted_field_name="v", algorithm="blake2b"
+        )
+        assert f.deconstruct()[3]["algorithm"] == "blake2b"
+
+    def test_queries(self):
+        models.SearchKeyedHash.objects.create(search="foo", search_2="bar")
+        found = models.SearchKeyedHash.objects.get(search="foo", search_2="bar")
+        assert found.value == "foo"
+        assert found.value_2 == "bar"
+        assert found.search == "foo"
+
+    def test_algorithms_coexist(self):
+        """Hashes from a previous algorithm are recognised, so they don't overwrite
+        the data, and are replaced when the instance is saved."""
+        obj = models.SearchKeyedHash.objects.create(search="foo")
+        old_hash = models.SearchChar._meta.get_field("search").get_prep_value("foo")
+        models.SearchKeyedHash.objects.update(search=old_hash)
+        obj = models.SearchKeyedHash.objects.defer_decryption().get()
+        obj.save()
+        assert models.SearchKeyedHash.objects.get(search="foo").value == "foo"
+
+
+class TestSearchHashCache:
+    def test_lookups_use_cache(self):
+        clear_search_hash_cache()
+        field = models.SearchChar._meta.get_field("search")
+        first = field.get_prep_value("foo")
+        assert get_search_hash_cache().cache_info().misses == 1
+        assert field.get_prep_value("foo") == first
+        assert get_search_hash_cache().cache_info().hits == 1
+        # keyed by hash_key and value
+        other = fields.SearchField(hash_key="other", encrypted_field_name="value")
+        assert other.get_prep_value("foo") != first
+        assert get_search_hash_cache().cache_info().misses == 2
+
+    def test_saving_bypasses_cache(self):
+        clear_search_hash_cache()
+        models.SearchChar.objects.create(search="foo")
+        assert get_search_hash_cache().cache_info().currsize == 0
+        assert models.SearchChar.objects.get(search="foo")
+        assert get_search_hash_cache().cache_info().currsize == 1
+
+    def test_cache_size_setting(self, settings):
+        settings.SEARCH_FIELD_HASH_CACHE_SIZE = 2
+        field = models.SearchChar._meta.get_field("search")
+        for value in ["a", "b", "c", "a"]:
+            field.get_prep_value(value)
+        info = get_search_hash_cache().cache_info()
+        assert info.maxsize == 2
+        assert info.currsize == 2
+        assert info.hits == 0
+
+    def test_clear(self):
+        field = models.SearchChar._meta.get_field("search")
+        field.get_prep_value("foo")
+        clear_search_hash_cache()
+        assert get_search_hash_cache().cache_info().currsize == 0
+
+
+class TestInLookup:
+    def test_values_hashed_once(self, monkeypatch):
+        calls = []
+        original = fields.get_search_hash
+
+        def counting_hash(hash_key, value, *args):
+            calls.append(value)
+            return original(hash_key, value, *args)
+
+        monkeypatch.setattr(fields, "get_search_hash", counting_hash)
+        clear_search_hash_cache()
+        models.SearchInt.objects.create(search=1)
+        calls.clear()
+        queryset = models.SearchInt.objects.filter(search__in=[1, 2, 1, "1", 3])
+        assert queryset.get().search == 1
+        assert sorted(calls) == ["1", "2", "3"]
+        # the hashes are not added to the lookup cache
+        assert get_search_hash_cache().cache_info().currsize == 0
+
+    def test_subquery(self):
+        models.SearchChar.objects.create(search="foo")
+        models.SearchText.objects.create(search="foo")
+        hashes = models.SearchText.objects.values("search")
+        assert models.SearchChar.objects.filter(search__in=hashes).get().search == "foo"
+
+    def test_bulk_get(self):
+        for name in ["a", "b", "c"]:
+            models.DemoModel.objects.create(
+                email=f"{name}@example.com", name=name, date=DATE1, number=1, text="t"
+            )
+        found = models.DemoModel.objects.bulk_get(
+            ["a@example.com", "c@example.com", "x@example.com"], "email"
+        )
+        assert sorted(found) == ["a@example.com", "c@example.com"]
+        assert found["a@example.com"].name == "a"
+        assert found["c@example.com"].email == "c@example.com"
+
+    def test_bulk_get_one_query(self, django_assert_num_queries):
+        values = [f"{i}@example.com" for i in range(20)]
+        models.DemoModel.objects.bulk_create(
+            [
+                models.DemoModel(email=value, name="n", date=DATE1, number=1, text="t")
+                for value in values
+            ]
+        )
+        with django_assert_num_queries(1):
+            found = models.DemoModel.objects.bulk_get(values + values, "email")
+        assert [found[value].email for value in values] == values
+
+    def test_bulk_get_duplicates_use_lowest_pk(self):
+        first = models.SearchKeyedHash.objects.create(search="foo", search_2="x")
+        models.SearchKeyedHash.objects.create(search="foo", search_2="y")
+        assert models.SearchKeyedHash.objects.bulk_get(["foo"], "search") == {
+            "foo": first
+        }
+
+    def test_bulk_get_values_with_same_hash(self):
+        obj = models.SearchInt.objects.create(search=1)
+        queryset = EncryptedQuerySet(models.SearchInt)
+        assert queryset.bulk_get([1, "1", None]) == {1: obj, "1": obj}
+        assert queryset.bulk_get([]) == {}
+
+    def test_bulk_get_field_name(self):
+        with pytest.raises(ValueError, match="requires a field_name"):
+            models.DemoModel.objects.bulk_get(["foo"])
+        with pytest.raises(ValueError, match="is not a SearchField"):
+            models.DemoModel.objects.bulk_get(["foo"], "_email_data")
+
+    def test_bulk_get_sliced(self):
+        with pytest.raises(TypeError):
+            models.DemoModel.objects.all()[:2].bulk_get(["foo"], "email")
+
+
 @pytest.mark.parametrize(
     "model,vals",
     [
@@ -140,11 +317,18 @@ class TestSearchFieldQueries:
         found = model.objects.get()
         assert found.search == vals[1]
 
+    def test_in_lookup(self, db, model, vals):
+        model.objects.create(search=vals[0])
+        model.objects.create(search=vals[1])
+        assert model.objects.filter(search__in=[vals[0]]).get().search == vals[0]
+        assert model.objects.filter(search__in=vals + [None]).count() == 2
+        assert not model.objects.filter(search__in=[None]).exists()
+
     def test_lookups_raise_field_error(self, db, model, vals):
-        """Lookups except 'isnull' and 'exact' are not allowed."""
+        """Lookups except 'isnull', 'exact' and 'in' are not allowed."""
         model.objects.create(search=vals[0])
         field_name = model._meta.get_field("search").__class__.__name__
-        lookups = set(dj_models.Field.class_lookups) - set(["isnull", "exact"])
+        lookups = set(dj_models.Field.class_lookups) - set(["isnull", "exact", "in"])
 
         for lookup in lookups:
             with pytest.raises(FieldError) as exc:
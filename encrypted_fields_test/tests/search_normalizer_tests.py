@@ -0,0 +1,123 @@
+from django.core.exceptions import FieldError, ImproperlyConfigured
+from django.db.models.expressions import Col
+import pytest
+
+from encrypted_fields import fields
+from encrypted_fields.fields import get_search_hash, get_search_normalizer
+from .. import models
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        (" Alice@Example.COM ", "alice@example.com"),
+        ("ＢＯＢ@example.com", "bob@example.com"),  # NFKC
+        ("jo@Bücher.de", "jo@xn--bcher-kva.de"),
+        ("not an email", "not an email"),
+        ("x@..", "x@.."),  # invalid domain
+    ],
+)
+def test_normalize_email(value, expected):
+    assert fields.normalize_email(value) == expected
+
+
+def test_get_search_normalizer():
+    assert get_search_normalizer(None) is None
+    assert get_search_normalizer(str.upper) is str.upper
+    assert get_search_normalizer("strip")(" a ") == "a"
+    normalize = get_search_normalizer(["nfkc", "strip", "casefold"])
+    assert normalize(" ＳTRASSE ") == "strasse"
+    assert normalize("Straße") == "strasse"
+    for normalizer in ["lower", ["strip", "lower"], []]:
+        with pytest.raises(ImproperlyConfigured):
+            get_search_normalizer(normalizer)
+
+
+def test_normalized_on_save_and_lookup():
+    obj = models.SearchNormalized.objects.create(
+        email_search="Alice@Example.com", name_search=" Straße"
+    )
+    # the encrypted value is kept as it is
+    obj.refresh_from_db()
+    assert obj.email == "Alice@Example.com"
+    assert obj.name == " Straße"
+    stored = models.SearchNormalized.objects.values_list("email_search", flat=True)
+    assert list(stored) == [get_search_hash("abc123", "alice@example.com")]
+    for email in ["alice@example.com", " ALICE@EXAMPLE.COM"]:
+        assert models.SearchNormalized.objects.get(email_search=email) == obj
+        assert models.SearchNormalized.objects.get(email_search__iexact=email) == obj
+    assert models.SearchNormalized.objects.get(name_search="STRASSE") == obj
+    assert not models.SearchNormalized.objects.filter(email_search="bob@example.com")
+
+
+def test_in_lookup_and_bulk_get():
+    alice = models.SearchNormalized.objects.create(email_search="alice@example.com")
+    bob = models.SearchNormalized.objects.create(email_search="Bob@Example.com")
+    queryset = models.SearchNormalized.objects.filter(
+        email_search__in=["ALICE@example.com", "bob@EXAMPLE.com"]
+    )
+    assert set(queryset) == {alice, bob}
+    found = models.SearchNormalized.objects.bulk_get(
+        ["Alice@Example.com", "alice@example.com", "carol@example.com"],
+        "email_search",
+    )
+    assert found == {"Alice@Example.com": alice, "alice@example.com": alice}
+
+
+def test_saving_loaded_hash():
+    models.SearchNormalized.objects.create(
+        email_search="Alice@Example.com", name_search="Bob"
+    )
+    obj = models.SearchNormalized.objects.defer_decryption().get()
+    obj.save()
+    assert models.SearchNormalized.objects.get(email_search="alice@example.com")
+    assert models.SearchNormalized.objects.get(name_search="bob")
+
+
+def test_iexact_requires_normalizer():
+    with pytest.raises(FieldError, match="normalizer"):
+        models.SearchChar.objects.filter(search__iexact="foo")
+
+
+def case_insensitive(value):
+    return value.lower()
+
+
+case_insensitive.folds_case = True
+
+
+@pytest.mark.parametrize(
+    "normalizer,folds_case",
+    [
+        ("strip", False),
+        ("nfkc", False),
+        (["nfkc", "strip"], False),
+        (str.lower, False),
+        ("casefold", True),
+        ("email", True),
+        (["nfkc", "strip", "casefold"], True),
+        (case_insensitive, True),
+    ],
+)
+def test_iexact_requires_case_folding(normalizer, folds_case):
+    field = fields.SearchField(
+        hash_key="abc123", encrypted_field_name="value", normalizer=normalizer
+    )
+    field.set_attributes_from_name("search")
+    field.model = models.SearchChar
+    assert fields.normalizer_folds_case(normalizer) is folds_case
+    if folds_case:
+        assert fields.SearchFieldIExact(Col("t", field), "ALICE").rhs
+    else:
+        with pytest.raises(FieldError, match="without a normalizer that folds case"):
+            fields.SearchFieldIExact(Col("t", field), "ALICE")
+
+
+def test_deconstruct():
+    field = models.SearchNormalized._meta.get_field("name_search")
+    _, _, _, kwargs = field.deconstruct()
+    assert kwargs["normalizer"] == ["nfkc", "strip", "casefold"]
+    _, _, _, kwargs = models.SearchChar._meta.get_field("search").deconstruct()
+    assert "normalizer" not in kwargs
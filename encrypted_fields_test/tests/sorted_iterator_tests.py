@@ -0,0 +1,90 @@
+import datetime
+
+import pytest
+
+from encrypted_fields import query
+from .. import models
+
+pytestmark = pytest.mark.django_db
+
+AGES = [30, None, 5, 64, 17, 30, 45, None, 18, 29]
+
+
+@pytest.fixture
+def people():
+    return [
+        models.SearchRange.objects.create(
+            age=age, born=datetime.date(2000, 1, 1 + i % 3)
+        )
+        for i, age in enumerate(AGES)
+    ]
+
+
+def expected(people, key, reverse=False):
+    return [obj.pk for obj in sorted(people, key=key, reverse=reverse)]
+
+
+@pytest.mark.parametrize("run_size", [100, 3, 1])
+def test_sorted(people, run_size):
+    queryset = models.SearchRange.objects.all()
+    found = queryset.sorted_iterator("age", chunk_size=4, run_size=run_size)
+    assert [obj.pk for obj in found] == expected(
+        people, lambda obj: (obj.age is not None, obj.age or 0, obj.pk)
+    )
+    found = queryset.sorted_iterator("-age", chunk_size=4, run_size=run_size)
+    assert [obj.age for obj in found] == [64, 45, 30, 30, 29, 18, 17, 5, None, None]
+
+
+def test_several_fields(people):
+    found = models.SearchRange.objects.sorted_iterator("born", "-age", run_size=2)
+    assert [obj.pk for obj in found] == expected(
+        people,
+        lambda obj: (obj.born, -(obj.age if obj.age is not None else -1), obj.pk),
+    )
+
+
+def test_limit(people):
+    found = models.SearchRange.objects.filter(pk__gt=people[0].pk).sorted_iterator(
+        "-age", limit=3, chunk_size=2
+    )
+    assert [obj.age for obj in found] == [64, 45, 30]
+    assert list(models.SearchRange.objects.sorted_iterator("age", limit=0)) == []
+
+
+def test_search_field_names():
+    for email in ["b@example.com", "c@example.com", "a@example.com"]:
+        models.SearchNormalized.objects.create(email_search=email)
+    found = models.SearchNormalized.objects.sorted_iterator("email_search")
+    assert [obj.email for obj in found] == [
+        "a@example.com",
+        "b@example.com",
+        "c@example.com",
+    ]
+
+
+def test_runs_spilled_encrypted(people, monkeypatch):
+    runs = []
+
+    class SortedRun(query._SortedRun):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            runs.append(self)
+
+    monkeypatch.setattr(query, "_SortedRun", SortedRun)
+    found = models.SearchRange.objects.sorted_iterator("age", run_size=4)
+    assert len(list(found)) == 10
+    assert len(runs) == 3
+    assert all(run.file.closed for run in runs)
+
+    records = [((True, f"secret {i}"), i) for i in range(10)]
+    run = SortedRun(records, block_size=3)
+    assert b"secret" not in run.file.read()
+    run.file.seek(0)
+    assert list(run) == records
+
+
+def test_invalid_arguments():
+    with pytest.raises(TypeError):
+        models.SearchRange.objects.sorted_iterator()
+    with pytest.raises(TypeError):
+        models.SearchRange.objects.all()[:2].sorted_iterator("age")
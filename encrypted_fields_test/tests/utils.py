@@ -0,0 +1,25 @@
+from django.db import connection
+
+# KEY1 is the key in settings.FIELD_ENCRYPTION_KEYS.
+KEY1 = "f164ec6bd6fbc4aef5647abc15199da0f9badcc1d2127bde2087ae0d794a9a0b"
+KEY2 = "e364ec6bd6fbc4aef5647abc15199da0f9badcc1d2127bde2087ae0d794a9a0b"
+KEY3 = "d244ec6bd6fbc4aef5647abc15199da0f9badcc1d2127bde2087ae0d794a9a0b"
+
+
+def raw_values(model, column):
+    """The values of column in the table of model, as stored, in pk order."""
+    with connection.cursor() as cur:
+        cur.execute(f"SELECT {column} FROM {model._meta.db_table} ORDER BY id")
+        return [
+            bytes(r[0]) if isinstance(r[0], memoryview) else r[0]
+            for r in cur.fetchall()
+        ]
+
+
+def raw_value(obj, column="value"):
+    """The value of column in the row of obj, as stored."""
+    with connection.cursor() as cur:
+        cur.execute(
+            f"SELECT {column} FROM {obj._meta.db_table} WHERE id = %s", [obj.pk]
+        )
+        return bytes(cur.fetchone()[0])
@@ -14,8 +14,14 @@ setup(
     maintainer="Guy Willett",
     maintainer_email="<guy@chamsoft.co>",
     url="https://gitlab.com/guywillett/django-searchable-encrypted-fields",
-    packages=["encrypted_fields"],
+    packages=[
+        "encrypted_fields",
+        "encrypted_fields.management",
+        "encrypted_fields.management.commands",
+        "encrypted_fields.migrations",
+    ],
     install_requires=["Django>=2.1", "pycryptodome>=3.7.0"],
+    extras_require={"cryptography": ["cryptography>=2.5"]},
     classifiers=[
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",